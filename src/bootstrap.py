@@ -7,7 +7,7 @@ from pathlib import Path
 
 from src.infra.biliup import BILIUP_ARTIFACT_NAMES, _biliup_work_dir, login as biliup_login, validate_bilibili_cookies
 from src.infra.cli_path import cli_exists
-from src.infra.ffmpeg import probe_ffmpeg
+from src.infra.ffmpeg import probe_ffmpeg, set_probe_cache_dir
 from src.infra.yt_dlp import probe_youtube_video_access, validate_youtube_auth
 
 
@@ -22,6 +22,11 @@ def ensure_runtime_tools(config, logger=None) -> None:
     ensure_pipeline_tools(config, logger=logger, needs_render=True, needs_upload=True)
 
 
+def configure_probe_cache(config) -> None:
+    """Keep ffprobe results next to the state DB so resumed jobs skip re-probing unchanged media."""
+    set_probe_cache_dir(Path(config.state_db).parent / "probe_cache")
+
+
 def ensure_pipeline_tools(config, logger=None, *, needs_render: bool, needs_upload: bool) -> None:
     _ensure_tool("yt-dlp", logger)
     if needs_upload:
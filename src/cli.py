@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import shutil
 import sys
@@ -11,10 +12,11 @@ from dotenv import load_dotenv
 from rich.console import Console
 from rich.table import Table
 
-from src.bootstrap import login_bilibili, run_checks
+from src.bootstrap import configure_probe_cache, login_bilibili, run_checks
 from src.config.config import load_config, runtime_root, save_youtube_auth_config
 from src.logger import setup_logger
 from src.service.pipeline import SingleVideoPipeline
+from src.service.render_scheduler import RenderScheduler
 from src.state import StateRepository
 
 
@@ -72,6 +74,69 @@ def build_parser() -> argparse.ArgumentParser:
     status.add_argument("job_id")
     status.set_defaults(func=cmd_status)
 
+    preview = sub.add_parser("preview", help="用当前 ASS 快速渲染指定时间点的预览片段或截图，检查字幕排版")
+    preview.add_argument("job_id")
+    preview.add_argument("--at", action="append", type=parse_timestamp, required=True, help="时间点，如 00:04:20、4:20 或 260，可重复")
+    preview.add_argument("--duration", type=float, default=5.0, help="预览片段时长（秒）")
+    preview.add_argument("--still", action="store_true", help="只输出单帧截图（jpg）")
+    preview.set_defaults(func=cmd_preview)
+
+    usage = sub.add_parser("usage", help="汇总 LLM token 用量与费用")
+    usage.add_argument("--by", choices=("day", "model", "stage"), default="day", help="汇总维度")
+    usage.add_argument("--days", type=int, default=None, help="只统计最近 N 天")
+    usage.set_defaults(func=cmd_usage)
+
+    bench = sub.add_parser("bench", help="性能基准测试")
+    bench_sub = bench.add_subparsers(dest="bench_target", required=True)
+    bench_llm = bench_sub.add_parser("llm", help="用本地模拟 LLM 服务测量字幕翻译吞吐")
+    bench_llm.add_argument("--cues", type=int, default=500, help="合成字幕条数")
+    bench_llm.add_argument("--subtitle", help="使用真实 VTT/SRT 字幕代替合成字幕")
+    bench_llm.add_argument("--segment", action="store_true", help="翻译前先执行智能分句并单独计时")
+    bench_llm.add_argument("--fused", action="store_true", help="配合 --segment，使用分句+翻译单次调用模式")
+    bench_llm.add_argument("--base-url", help="使用已运行的 OpenAI 兼容服务，而不是内置模拟服务")
+    bench_llm.add_argument("--batch-size", type=int, help="覆盖 translation.subtitle_batch_size")
+    bench_llm.add_argument("--concurrency", type=int, help="覆盖 translation.subtitle_concurrency")
+    bench_llm.add_argument("--client-timeout", type=float, default=10.0, help="客户端请求超时秒数")
+    bench_llm.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    add_mock_server_args(bench_llm)
+    bench_llm.set_defaults(func=cmd_bench_llm)
+    bench_mock = bench_sub.add_parser("mock-server", help="前台运行 OpenAI 兼容模拟 LLM 服务")
+    bench_mock.add_argument("--host", default="127.0.0.1")
+    bench_mock.add_argument("--port", type=int, default=8765)
+    bench_mock.add_argument(
+        "--timeout-hold",
+        type=float,
+        help="注入超时时保持连接不响应的秒数，应大于客户端超时；默认 ai.timeout + 1",
+    )
+    add_mock_server_args(bench_mock)
+    bench_mock.set_defaults(func=cmd_bench_mock_server)
+    bench_subtitle = bench_sub.add_parser("subtitle", help="测量长字幕解析与本地分句后处理的耗时和内存")
+    bench_subtitle.add_argument("--hours", type=float, default=10.0, help="合成 YouTube 自动字幕时长（小时）")
+    bench_subtitle.add_argument("--format", choices=["vtt", "json3"], default="vtt", help="合成字幕格式")
+    bench_subtitle.add_argument("--subtitle", help="使用真实 json3/srv3/VTT/SRT 字幕代替合成字幕")
+    bench_subtitle.add_argument("--seed", type=int, default=0)
+    bench_subtitle.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    bench_subtitle.set_defaults(func=cmd_bench_subtitle)
+    bench_layout = bench_sub.add_parser("layout", help="测量中英双语字幕排版（宽度计算与换行）耗时")
+    bench_layout.add_argument("--cues", type=int, default=5000, help="每组合成字幕条数（中文为主/英文为主各一组）")
+    bench_layout.add_argument("--seed", type=int, default=0)
+    bench_layout.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    bench_layout.set_defaults(func=cmd_bench_layout)
+    bench_window = bench_sub.add_parser("window", help="对比超长直播回放整轨处理与分窗处理的耗时和内存峰值")
+    bench_window.add_argument("--hours", type=float, default=12.0, help="合成字幕时长（小时）")
+    bench_window.add_argument("--window-minutes", type=float, default=30.0, help="每个处理窗口的时长（分钟）")
+    bench_window.add_argument("--seed", type=int, default=0)
+    bench_window.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    bench_window.set_defaults(func=cmd_bench_window)
+    bench_render = bench_sub.add_parser("render", help="用同一测试片段对比各编码 profile 的速度、体积和画质")
+    bench_render.add_argument("--input", help="输入视频；不指定时用 ffmpeg lavfi 生成测试图案")
+    bench_render.add_argument("--seconds", type=float, default=10.0, help="测试片段时长（秒）")
+    bench_render.add_argument("--width", type=int, default=1280, help="测试图案宽度")
+    bench_render.add_argument("--height", type=int, default=720, help="测试图案高度")
+    bench_render.add_argument("--profile", action="append", help="只测指定 profile，可重复；默认测全部")
+    bench_render.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    bench_render.set_defaults(func=cmd_bench_render)
+
     logs = sub.add_parser("logs", help="查看日志")
     logs.add_argument("-f", "--follow", action="store_true", help="实时跟随日志")
     logs.add_argument("--lines", type=int, default=80, help="显示最近 N 行")
@@ -91,6 +156,12 @@ def add_translate_args(parser: argparse.ArgumentParser) -> None:
     parser.add_argument("--keep-files", action="store_true", help="保留下载和中间文件")
     parser.add_argument("--resume-job", help="恢复已有任务 ID，并复用校验通过的阶段产物")
     parser.add_argument("--render-profile", choices=("quality", "fast"), help="压制配置：quality 或 fast")
+    parser.add_argument(
+        "--render-priority",
+        type=int,
+        default=0,
+        help="启用 render.scheduler 时的压制排队优先级，数值大的先压制，默认 0",
+    )
     parser.add_argument(
         "--stop-after",
         choices=("subtitle", "translation", "ass", "render", "upload"),
@@ -98,6 +169,35 @@ def add_translate_args(parser: argparse.ArgumentParser) -> None:
     )
 
 
+def add_mock_server_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="模拟响应延迟中位数（毫秒）")
+    parser.add_argument("--latency-dist", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--latency-jitter", type=float, default=0.4, help="uniform 为相对抖动，lognormal 为 sigma")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="注入 429 的概率")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="注入 500 的概率")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="注入 503 的概率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="注入超时的概率")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="返回截断输出的概率")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def mock_server_config(args, *, timeout_seconds: float = 30.0):
+    from src.infra.llm_mock_server import MockLLMServerConfig
+
+    return MockLLMServerConfig(
+        latency_ms=args.latency_ms,
+        latency_distribution=args.latency_dist,
+        latency_jitter=args.latency_jitter,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        rate_503=args.rate_503,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=timeout_seconds,
+        truncate_rate=args.truncate_rate,
+        seed=args.seed,
+    )
+
+
 def cmd_login_youtube(args) -> int:
     config = load_config()
     if args.browser and args.cookies_file:
@@ -187,6 +287,7 @@ def cmd_check(args) -> int:
 def cmd_translate(args) -> int:
     config = load_config()
     logger = setup_logger(config.log_dir)
+    configure_probe_cache(config)
     state = StateRepository(config.state_db)
     try:
         if args.resume_job:
@@ -215,6 +316,7 @@ def cmd_translate(args) -> int:
                 resume=bool(args.resume_job),
                 render_profile=args.render_profile,
                 stop_after=args.stop_after,
+                render_priority=args.render_priority,
             )
         print_job_detail(record)
         return 0
@@ -230,8 +332,15 @@ def cmd_jobs(args) -> int:
             interrupted = state.mark_unfinished_interrupted()
             console.print(f"已标记 {interrupted} 个执行中任务为中断，可使用 --resume-job 恢复。")
         rows = state.list_jobs(args.limit)
+        scheduler = RenderScheduler(state, config.render.scheduler)
+        render_queue = scheduler.stats() if scheduler.enabled else None
     finally:
         state.close()
+    if render_queue:
+        console.print(
+            f"压制队列: 运行 {render_queue['running']}/{render_queue['slots']}，排队 {render_queue['waiting']}，"
+            f"每路 {render_queue['threads']} 线程"
+        )
     if not rows:
         print("暂无任务。")
         return 0
@@ -240,7 +349,7 @@ def cmd_jobs(args) -> int:
         table.add_column(col)
     for row in rows:
         status = row.get("status") or "-"
-        color = "green" if status == "completed" else "red" if status == "failed" else "yellow"
+        color = "green" if status == "completed" else "red" if status in {"failed", "stalled"} else "yellow"
         table.add_row(
             (row.get("job_id") or "")[:12],
             (row.get("video_id") or "-")[:12],
@@ -258,14 +367,180 @@ def cmd_status(args) -> int:
     state = StateRepository(config.state_db)
     try:
         record = state.get_job(args.job_id)
+        usage_rows = state.llm_usage_by_stage(args.job_id) if record else []
     finally:
         state.close()
     if not record:
         raise RuntimeError(f"任务不存在: {args.job_id}")
     print_job_detail(record)
+    if usage_rows:
+        print_usage_table(usage_rows, title="LLM 用量（按阶段）", key_columns=("stage", "model"))
+    return 0
+
+
+def parse_timestamp(value: str) -> float:
+    try:
+        seconds = 0.0
+        for part in value.strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效时间点: {value}") from None
+    if seconds < 0 or value.count(":") > 2:
+        raise argparse.ArgumentTypeError(f"无效时间点: {value}")
+    return seconds
+
+
+def cmd_preview(args) -> int:
+    from src.service.renderer import RenderService
+
+    config = load_config()
+    configure_probe_cache(config)
+    state = StateRepository(config.state_db)
+    try:
+        record = state.get_job(args.job_id)
+    finally:
+        state.close()
+    if not record:
+        raise RuntimeError(f"任务不存在: {args.job_id}")
+    video = Path(record.get("video_path") or "")
+    ass = Path(record.get("subtitle_path") or "")
+    if not record.get("video_path") or not video.is_file():
+        raise RuntimeError("任务的源视频不存在（可能已被清理），请使用 --keep-files 重新运行或 --resume-job 恢复下载")
+    if ass.suffix != ".ass" or not ass.is_file():
+        raise RuntimeError("任务还没有生成 ASS 字幕")
+    results = RenderService(config).preview(
+        input_video=video,
+        ass_path=ass,
+        output_dir=Path(config.output_dir) / "previews",
+        at=args.at,
+        duration=args.duration,
+        still=args.still,
+    )
+    for path, reused in results:
+        console.print(f"{'复用' if reused else '生成'}: {path}")
+    return 0
+
+
+def cmd_usage(args) -> int:
+    config = load_config()
+    state = StateRepository(config.state_db)
+    try:
+        rows = state.llm_usage_rollup(group_by=args.by, days=args.days)
+    finally:
+        state.close()
+    if not rows:
+        print("暂无 LLM 用量记录。")
+        return 0
+    currency = config.ai.pricing.currency if config.ai.pricing else None
+    print_usage_table(rows, title=f"LLM 用量（按 {args.by}）", key_columns=("bucket",), currency=currency)
+    return 0
+
+
+def cmd_bench_llm(args) -> int:
+    from src.service.benchmark import load_bench_cues, run_llm_benchmark
+
+    config = load_config()
+    if args.batch_size:
+        config.translation.subtitle_batch_size = args.batch_size
+    if args.concurrency:
+        config.translation.subtitle_concurrency = args.concurrency
+    if args.fused:
+        config.translation.fused_segment_translation = True
+    cues = load_bench_cues(config, args.subtitle) if args.subtitle else None
+    result = run_llm_benchmark(
+        config,
+        cues=cues,
+        cue_count=args.cues,
+        server_config=mock_server_config(args, timeout_seconds=args.client_timeout + 1),
+        base_url=args.base_url,
+        client_timeout=args.client_timeout,
+        include_segmentation=args.segment,
+        seed=args.seed,
+    )
+    print_bench_result(result, title="LLM 翻译吞吐基准", as_json=args.json)
+    return 0
+
+
+def cmd_bench_mock_server(args) -> int:
+    from src.infra.llm_mock_server import start_mock_llm_server
+
+    hold = args.timeout_hold if args.timeout_hold is not None else load_config().ai.timeout + 1
+    server = start_mock_llm_server(mock_server_config(args, timeout_seconds=hold), host=args.host, port=args.port)
+    console.print(f"模拟 LLM 服务已启动: [cyan]{server.base_url}[/]，Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        server.close()
+        console.print(f"请求统计: {server.stats.as_dict()}")
+
+
+def cmd_bench_subtitle(args) -> int:
+    from src.service.benchmark import run_subtitle_benchmark
+
+    result = run_subtitle_benchmark(load_config(), hours=args.hours, seed=args.seed, path=args.subtitle, fmt=args.format)
+    print_bench_result(result, title="字幕处理基准", as_json=args.json)
+    return 0
+
+
+def cmd_bench_layout(args) -> int:
+    from src.service.benchmark import run_layout_benchmark
+
+    result = run_layout_benchmark(load_config(), cue_count=args.cues, seed=args.seed)
+    print_bench_result(result, title="字幕排版基准", as_json=args.json)
+    return 0
+
+
+def cmd_bench_window(args) -> int:
+    from src.service.benchmark import run_window_benchmark
+
+    result = run_window_benchmark(load_config(), hours=args.hours, window_minutes=args.window_minutes, seed=args.seed)
+    print_bench_result(result, title="分窗处理基准", as_json=args.json)
+    return 0
+
+
+def cmd_bench_render(args) -> int:
+    from src.service.benchmark import run_render_benchmark
+
+    result = run_render_benchmark(
+        load_config(),
+        input_video=args.input,
+        seconds=args.seconds,
+        width=args.width,
+        height=args.height,
+        profiles=args.profile,
+    )
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+    table = Table(title=f"编码 profile 基准（{result['source']}，{result['seconds']:g}s，{result['frames']} 帧）")
+    columns = ("codec", "encode_fps", "cpu_seconds", "bitrate_kbps", "size_bytes", "psnr", "ssim", "vmaf")
+    table.add_column("profile")
+    for col in columns:
+        table.add_column(col, justify="right")
+    for name, row in result["profiles"].items():
+        if "error" in row:
+            table.add_row(name, row["codec"], f"[red]{row['error']}[/]", *[""] * (len(columns) - 2))
+            continue
+        table.add_row(name, *(str(row.get(col, "-")) for col in columns))
+    console.print(table)
     return 0
 
 
+def print_bench_result(result: dict, *, title: str, as_json: bool) -> None:
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    table = Table(title=title)
+    table.add_column("指标")
+    table.add_column("值", justify="right")
+    for key, value in result.items():
+        table.add_row(key, json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value))
+    console.print(table)
+
+
 def cmd_logs(args) -> int:
     config = load_config()
     path = Path(config.log_dir) / "app.log"
@@ -296,6 +571,34 @@ def tail_lines(path: Path, lines: int) -> list[str]:
     return content[-max(1, lines) :]
 
 
+def print_usage_table(
+    rows: list[dict],
+    *,
+    title: str,
+    key_columns: tuple[str, ...],
+    currency: str | None = None,
+) -> None:
+    table = Table(title=title)
+    for col in key_columns:
+        table.add_column(col.upper())
+    for col in ("CALLS", "PROMPT", "CACHED", "COMPLETION", "RETRIES", "RETRY_WAIT_MS", "AVG_MS", "COST"):
+        table.add_column(col, justify="right")
+    for row in rows:
+        cost = row.get("cost")
+        table.add_row(
+            *(str(row.get(col) or "-") for col in key_columns),
+            str(row.get("calls") or 0),
+            str(row.get("prompt_tokens") or 0),
+            str(row.get("cached_tokens") or 0),
+            str(row.get("completion_tokens") or 0),
+            str(row.get("retries") or 0),
+            str(row.get("retry_wait_ms") or 0),
+            str(row.get("avg_latency_ms") or 0),
+            "-" if cost is None else f"{cost:.4f}{' ' + currency if currency else ''}",
+        )
+    console.print(table)
+
+
 def print_job_detail(record: dict) -> None:
     for key in [
         "job_id",
@@ -311,10 +614,16 @@ def print_job_detail(record: dict) -> None:
         "rendered_path",
         "bvid",
         "error",
+        "prompt_cache_hit_tokens",
+        "prompt_cache_miss_tokens",
         "created_at",
         "updated_at",
     ]:
         print(f"{key}: {record.get(key)}")
+    hit = int(record.get("prompt_cache_hit_tokens") or 0)
+    miss = int(record.get("prompt_cache_miss_tokens") or 0)
+    if hit + miss:
+        print(f"prompt_cache_hit_rate: {hit / (hit + miss):.1%}")
 
 
 if __name__ == "__main__":
@@ -5,7 +5,7 @@ from pathlib import Path
 from typing import Any, Literal
 
 import yaml
-from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
 
 
 CONFIG_PATH = Path(__file__).parent / "config.yaml"
@@ -17,6 +17,15 @@ class StrictModel(BaseModel):
     model_config = ConfigDict(extra="forbid", protected_namespaces=())
 
 
+class AIPricingConfig(StrictModel):
+    """Per-million-token prices used to estimate LLM cost in the usage ledger."""
+
+    currency: str = "CNY"
+    cache_hit: float = Field(ge=0)
+    cache_miss: float = Field(ge=0)
+    output: float = Field(ge=0)
+
+
 class AIConfig(StrictModel):
     provider: Literal["deepseek", "openai", "gemini"] = "deepseek"
     model: str = "deepseek-v4-flash"
@@ -27,6 +36,10 @@ class AIConfig(StrictModel):
     json_response: bool = True
     timeout: float = 120.0
     max_retries: int = 2
+    pricing: AIPricingConfig | None = None
+    # record: persist every response; replay: serve responses offline from replay_path.
+    replay_mode: Literal["off", "record", "replay"] = "off"
+    replay_path: str = "./data/llm_replay.jsonl"
 
     @field_validator("model")
     @classmethod
@@ -47,12 +60,25 @@ class TranslationConfig(StrictModel):
     subtitle_concurrency: int = Field(default=4, ge=1, le=8)
     segmentation_batch_size: int = Field(default=300, ge=40, le=800)
     segmentation_concurrency: int = Field(default=2, ge=1, le=6)
+    # Opt-in: one request per batch returns both sentence ranges and their translations.
+    fused_segment_translation: bool = False
+    # Opt-in: well-punctuated batches of non-ASR tracks skip the LLM and use the local segmenter.
+    rule_segmentation: bool = False
+    rule_segmentation_min_confidence: float = Field(default=0.75, ge=0.0, le=1.0)
+    # > 0: stream multi-hour tracks through segmentation/translation/ASS in windows of
+    # this many minutes, so memory stays flat regardless of video length.
+    window_minutes: float = Field(default=0.0, ge=0.0)
+    window_overlap_seconds: float = Field(default=60.0, ge=0.0)
 
 
 class YouTubeConfig(StrictModel):
     cookies: str | None = "./data/youtube_cookies.txt"
     cookies_from_browser: str | None = None
     extractor_args: list[str] = Field(default_factory=list)
+    # Kill a video download that reports no progress for this long (0 disables) and
+    # restart it up to stall_retries times; yt-dlp resumes from its .part files.
+    stall_timeout_seconds: float = Field(default=300.0, ge=0.0)
+    stall_retries: int = Field(default=2, ge=0, le=10)
 
 
 class SubtitleStyleConfig(StrictModel):
@@ -106,6 +132,55 @@ class RenderProfileConfig(StrictModel):
     bitrate: str | None = None
 
 
+class RenderOutputConfig(RenderProfileConfig):
+    # Extra output encoded in the same ffmpeg pass as the main video:
+    # output/<video_id>.bilingual.<name>.mp4, optionally scaled down to height.
+    name: str = Field(pattern=r"^[A-Za-z0-9_-]+$")
+    height: int | None = Field(default=None, ge=144)
+
+
+class AdaptiveEncodingConfig(StrictModel):
+    # Opt-in: before rendering, encode a few sampled segments and pick the highest CRF
+    # that still meets target_ssim, capped so the predicted output fits max_size_mb.
+    # Only applies to CRF-based profiles.
+    enabled: bool = False
+    target_ssim: float = Field(default=0.985, gt=0.0, le=1.0)
+    min_crf: int = Field(default=18, ge=0, le=51)
+    max_crf: int = Field(default=30, ge=0, le=51)
+    max_size_mb: float | None = Field(default=None, gt=0)
+    sample_count: int = Field(default=4, ge=1, le=12)
+    sample_seconds: float = Field(default=4.0, gt=0.0, le=30.0)
+
+    @model_validator(mode="after")
+    def _check_crf_range(self) -> AdaptiveEncodingConfig:
+        if self.min_crf > self.max_crf:
+            raise ValueError("render.adaptive.min_crf 不能大于 max_crf")
+        return self
+
+
+class SelectiveRenderConfig(StrictModel):
+    # Opt-in: re-encode only keyframe-aligned spans that carry subtitle events and
+    # stream-copy the rest. Needs an H.264 yuv420p source and a libx264 profile;
+    # anything else falls back to the full re-encode.
+    enabled: bool = False
+    # Subtitle-free gaps shorter than this are re-encoded instead of cut out for copying.
+    min_copy_seconds: float = Field(default=10.0, ge=0.0)
+    padding_seconds: float = Field(default=0.5, ge=0.0)
+
+
+class RenderSchedulerConfig(StrictModel):
+    # Opt-in: every y2b process sharing state_db queues its renders for a fixed number
+    # of encode slots, and each encode gets an explicit thread budget instead of all
+    # of them starting libx264 with one thread per core.
+    enabled: bool = False
+    # None derives slots from the core count (min_threads_per_encode each) and memory.
+    max_concurrent: int | None = Field(default=None, ge=1)
+    threads_per_encode: int | None = Field(default=None, ge=1)
+    min_threads_per_encode: int = Field(default=4, ge=1)
+    memory_per_encode_mb: int = Field(default=2048, ge=256)
+    poll_seconds: float = Field(default=2.0, gt=0.0, le=60.0)
+
+
 class RenderConfig(StrictModel):
     profile: Literal["quality", "fast"] = "quality"
     quality: RenderProfileConfig = Field(
@@ -114,6 +189,24 @@ class RenderConfig(StrictModel):
     fast: RenderProfileConfig = Field(
         default_factory=lambda: RenderProfileConfig(codec="h264_videotoolbox", bitrate="6M")
     )
+    adaptive: AdaptiveEncodingConfig = Field(default_factory=AdaptiveEncodingConfig)
+    selective: SelectiveRenderConfig = Field(default_factory=SelectiveRenderConfig)
+    scheduler: RenderSchedulerConfig = Field(default_factory=RenderSchedulerConfig)
+    # Fail the render when ffmpeg's output position stops advancing for this long (0 disables).
+    stall_timeout_seconds: float = Field(default=600.0, ge=0.0)
+    # Opt-in: when no local source is needed, ffmpeg reads the yt-dlp selected format URLs
+    # directly instead of encoding from a downloaded MP4. Not used with --keep-files or
+    # when adaptive/selective rendering needs a seekable local file.
+    stream_source: bool = False
+    extra_outputs: list[RenderOutputConfig] = Field(default_factory=list)
+
+    @field_validator("extra_outputs")
+    @classmethod
+    def _unique_output_names(cls, value: list[RenderOutputConfig]) -> list[RenderOutputConfig]:
+        names = [item.name for item in value]
+        if len(set(names)) != len(names):
+            raise ValueError("render.extra_outputs 的 name 不能重复")
+        return value
 
 
 class GlobalConfig(StrictModel):
@@ -238,6 +331,7 @@ def _resolve_runtime_paths(config: AppConfig, base_dir: Path) -> AppConfig:
     config.output_dir = resolved(config.output_dir) or config.output_dir
     config.log_dir = resolved(config.log_dir) or config.log_dir
     config.state_db = resolved(config.state_db) or config.state_db
+    config.ai.replay_path = resolved(config.ai.replay_path) or config.ai.replay_path
     config.youtube.cookies = resolved(config.youtube.cookies)
     config.bilibili.cookies = resolved(config.bilibili.cookies) or config.bilibili.cookies
     config.subtitle_style.fonts_dir = resolved(config.subtitle_style.fonts_dir)
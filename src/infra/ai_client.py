@@ -6,11 +6,16 @@ import random
 import re
 import time
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from functools import lru_cache
-from typing import Any
+from typing import Any, Callable, Iterator
 
 from openai import APIConnectionError, APITimeoutError, OpenAI
 
+from src.infra.llm_replay import RecordingChatClient, ReplayChatClient, get_replay_store
+
 
 class LLMAPIError(RuntimeError):
     def __init__(self, message: str, *, status_code: int | None = None):
@@ -26,6 +31,62 @@ class LLMFatalError(LLMAPIError):
     pass
 
 
+NON_THINKING_INSTRUCTION = "请使用非思考模式：不要输出推理过程、分析步骤或解释，只输出最终结果。"
+
+
+@dataclass
+class LLMUsage:
+    """Token usage reported by one chat completion response."""
+
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    prompt_cache_hit_tokens: int = 0
+    prompt_cache_miss_tokens: int = 0
+    stage: str = "unknown"
+    # Latency of the successful attempt; failed attempts and backoff are in retry_wait_ms.
+    latency_ms: int = 0
+    retries: int = 0
+    retry_wait_ms: int = 0
+
+
+UsageListener = Callable[[LLMUsage], None]
+
+_LLM_STAGE: ContextVar[str | None] = ContextVar("llm_stage", default=None)
+
+
+@contextmanager
+def llm_stage(stage: str) -> Iterator[None]:
+    """Attribute LLM calls made inside the block to a pipeline stage in the usage ledger."""
+    token = _LLM_STAGE.set(stage)
+    try:
+        yield
+    finally:
+        _LLM_STAGE.reset(token)
+
+
+def current_llm_stage() -> str | None:
+    return _LLM_STAGE.get()
+
+
+_USAGE_LISTENER: ContextVar[UsageListener | None] = ContextVar("llm_usage_listener", default=None)
+
+
+@contextmanager
+def llm_usage_listener(listener: UsageListener) -> Iterator[None]:
+    """Report the usage of every LLM call made inside the block to listener.
+
+    Unlike a listener stored on a shared client, the scope is per context, so
+    concurrent pipeline runs each see their own. Worker threads inherit it only
+    when submitted through ``contextvars.copy_context().run``.
+    """
+    token = _USAGE_LISTENER.set(listener)
+    try:
+        yield
+    finally:
+        _USAGE_LISTENER.reset(token)
+
+
 class BaseLLMClient(ABC):
     @abstractmethod
     def translate_text(self, text: str, *, system_prompt: str, max_tokens: int = 1024) -> str:
@@ -52,6 +113,18 @@ class BaseLLMClient(ABC):
     ) -> list[dict[str, int]]:
         raise NotImplementedError
 
+    @abstractmethod
+    def segment_and_translate(
+        self,
+        lines: list[str],
+        *,
+        system_prompt: str,
+        source_lang: str = "en",
+        target_lang: str = "zh-CN",
+        max_tokens: int,
+    ) -> list[dict[str, Any]]:
+        raise NotImplementedError
+
     @abstractmethod
     def complete_json(self, payload: dict[str, Any], *, system_prompt: str, max_tokens: int = 1024) -> Any:
         raise NotImplementedError
@@ -63,9 +136,14 @@ def _get_openai_client(base_url: str, api_key: str, timeout: float, max_retries:
 
 
 class OpenAICompatibleLLMClient(BaseLLMClient):
-    def __init__(self, ai_cfg, logger=None):
+    def __init__(self, ai_cfg, logger=None, usage_listener: UsageListener | None = None):
         self.ai_cfg = ai_cfg
         self.logger = logger
+        self.usage_listener = usage_listener
+        replay_mode = getattr(ai_cfg, "replay_mode", "off")
+        if replay_mode == "replay":
+            self.client = ReplayChatClient(get_replay_store(str(ai_cfg.replay_path)))
+            return
         # Disable SDK hidden retries; we handle DeepSeek error codes explicitly below.
         self.client = _get_openai_client(
             ai_cfg.base_url,
@@ -73,6 +151,8 @@ class OpenAICompatibleLLMClient(BaseLLMClient):
             float(ai_cfg.timeout),
             0,
         )
+        if replay_mode == "record":
+            self.client = RecordingChatClient(self.client, get_replay_store(str(ai_cfg.replay_path)))
 
     def translate_text(self, text: str, *, system_prompt: str, max_tokens: int = 1024) -> str:
         content = self._chat(
@@ -140,6 +220,46 @@ class OpenAICompatibleLLMClient(BaseLLMClient):
             ranges.append({"start": int(item["start"]), "end": int(item["end"])})
         return ranges
 
+    def segment_and_translate(
+        self,
+        lines: list[str],
+        *,
+        system_prompt: str,
+        source_lang: str = "en",
+        target_lang: str = "zh-CN",
+        max_tokens: int,
+    ) -> list[dict[str, Any]]:
+        if not lines:
+            return []
+        indexed = [{"i": i, "t": text} for i, text in enumerate(lines)]
+        payload = json.dumps(
+            {"source_lang": source_lang, "target_lang": target_lang, "tokens": indexed},
+            ensure_ascii=False,
+        )
+        content = self._chat(
+            messages=[
+                {"role": "system", "content": self._non_thinking_prompt(system_prompt)},
+                {"role": "user", "content": payload},
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            json_response=True,
+        )
+        data = _parse_json_value(content)
+        if isinstance(data, dict):
+            data = data.get("segments") or data.get("ranges") or data.get("items")
+        if not isinstance(data, list):
+            raise RuntimeError("字幕分句翻译结果不是 JSON 数组")
+        segments: list[dict[str, Any]] = []
+        for item in data:
+            if not isinstance(item, dict):
+                raise RuntimeError(f"字幕分句翻译元素不是对象: {item!r}")
+            text = item.get("text", item.get("translation"))
+            if text is None:
+                raise RuntimeError(f"字幕分句翻译元素缺少译文: {item!r}")
+            segments.append({"start": int(item["start"]), "end": int(item["end"]), "text": str(text).strip()})
+        return segments
+
     def complete_json(self, payload: dict[str, Any], *, system_prompt: str, max_tokens: int = 1024) -> Any:
         content = self._chat(
             messages=[
@@ -166,10 +286,11 @@ class OpenAICompatibleLLMClient(BaseLLMClient):
             kwargs["reasoning_effort"] = self.ai_cfg.reasoning_effort
 
         max_retries = max(0, int(self.ai_cfg.max_retries))
+        first_started = time.monotonic()
         for attempt in range(max_retries + 1):
+            started = time.monotonic()
             try:
                 resp = self.client.chat.completions.create(**kwargs)
-                return (resp.choices[0].message.content or "").strip()
             except Exception as e:
                 status_code = _status_code(e)
                 message = _deepseek_error_message(e, status_code)
@@ -186,12 +307,39 @@ class OpenAICompatibleLLMClient(BaseLLMClient):
                         f"({attempt + 1}/{max_retries})：{message}"
                     )
                 time.sleep(wait)
+                continue
+            self._report_usage(
+                resp,
+                latency=time.monotonic() - started,
+                retries=attempt,
+                retry_wait=started - first_started,
+            )
+            return (resp.choices[0].message.content or "").strip()
         raise LLMRetriableError("DeepSeek API 请求失败，请稍后重试")
 
+    def _report_usage(self, resp, *, latency: float, retries: int, retry_wait: float = 0.0) -> None:
+        listeners = [fn for fn in (self.usage_listener, _USAGE_LISTENER.get()) if fn is not None]
+        if not listeners:
+            return
+        try:
+            usage = _usage_from_response(resp, self.ai_cfg.model)
+            usage.stage = current_llm_stage() or "unknown"
+            usage.latency_ms = int(round(latency * 1000))
+            usage.retries = retries
+            usage.retry_wait_ms = int(round(retry_wait * 1000))
+            for listener in listeners:
+                listener(usage)
+        except Exception as e:
+            # Usage accounting must never fail a translation request.
+            if self.logger:
+                self.logger.warning(f"记录 LLM 用量失败: {e}")
+
     def _non_thinking_prompt(self, prompt: str) -> str:
         if self.ai_cfg.reasoning:
             return prompt
-        return prompt + "\n\n请使用非思考模式：不要输出推理过程、分析步骤或解释，只输出最终结果。"
+        # The instruction is identical for every request, so it leads the system
+        # message and extends the prefix DeepSeek can serve from its prompt cache.
+        return NON_THINKING_INSTRUCTION + "\n\n" + prompt
 
     @staticmethod
     def _api_key(ai_cfg) -> str:
@@ -213,30 +361,33 @@ class GeminiClient(OpenAICompatibleLLMClient):
     pass
 
 
-def create_llm_client(ai_cfg, logger=None) -> BaseLLMClient:
+def create_llm_client(ai_cfg, logger=None, usage_listener: UsageListener | None = None) -> BaseLLMClient:
     provider = str(ai_cfg.provider).lower()
     if provider == "deepseek":
-        return DeepSeekClient(ai_cfg, logger=logger)
+        return DeepSeekClient(ai_cfg, logger=logger, usage_listener=usage_listener)
     if provider == "openai":
-        return OpenAIClient(ai_cfg, logger=logger)
+        return OpenAIClient(ai_cfg, logger=logger, usage_listener=usage_listener)
     if provider == "gemini":
-        return GeminiClient(ai_cfg, logger=logger)
+        return GeminiClient(ai_cfg, logger=logger, usage_listener=usage_listener)
     raise RuntimeError(f"不支持的 LLM provider: {ai_cfg.provider}")
 
 
+# Prompt builders order their content for provider-side prefix caching: fixed
+# instructions first, then config-level content such as the glossary, and
+# per-request variables (languages, lengths, styles) last.
 def build_title_prompt(style_prompt: str, glossary: dict[str, str], max_title_length: int) -> str:
     glossary_lines = ""
     if glossary:
-        glossary_lines = "\n术语表（优先遵守，保留专有名词准确性）:\n" + "\n".join(
+        glossary_lines = "术语表（优先遵守，保留专有名词准确性）:\n" + "\n".join(
             f"- {src} -> {dst}" for src, dst in glossary.items()
-        )
+        ) + "\n"
 
     return (
         "你是一个中文视频标题编辑。请把英文标题翻译成适合B站发布的自然中文标题。\n"
-        f"风格要求：{style_prompt}\n"
-        f"长度要求：不超过 {max_title_length} 个中文字符（不含前缀）。\n"
-        "必须遵守：保留人名/角色名/版本号/数字信息；不要编造信息；不要加营销词；只输出标题。"
+        "必须遵守：保留人名/角色名/版本号/数字信息；不要编造信息；不要加营销词；只输出标题。\n"
         f"{glossary_lines}"
+        f"风格要求：{style_prompt}\n"
+        f"长度要求：不超过 {max_title_length} 个中文字符（不含前缀）。"
     )
 
 
@@ -257,6 +408,37 @@ def build_segment_prompt(source_lang: str = "en") -> str:
     )
 
 
+def build_fused_segment_translation_prompt(
+    translation_cfg,
+    source_lang: str = "en",
+    target_lang: str = "zh-CN",
+) -> str:
+    glossary_lines = ""
+    if translation_cfg.glossary:
+        glossary_lines = "术语表：\n" + "\n".join(
+            f"- {src} -> {dst}" for src, dst in translation_cfg.glossary.items()
+        ) + "\n"
+
+    return (
+        "你是视频字幕分句与翻译专家。输入是一组按时间顺序排列的英文字幕 token/短语，"
+        "每个元素有索引 i 和文本 t。请先把它们合并成适合中文字幕显示的自然语义片段，再把每个片段翻译成简体中文。\n"
+        "适用内容：编程教程、量化金融教学、荒野乱斗/游戏解说。\n"
+        "必须遵守：\n"
+        "1. 只返回 JSON 对象，不要解释；格式：{\"segments\":[{\"start\":0,\"end\":5,\"text\":\"译文\"}, ...]}。\n"
+        "2. start/end 是输入 token 的索引，从 0 开始且 end 包含在内。\n"
+        "3. 必须从 0 覆盖到最后一个索引，不能遗漏、不能重叠、不能乱序。\n"
+        "4. 尽量按完整句子或自然从句切分；没有标点时按语义短句切分。\n"
+        "5. 不要把介词、冠词、连词、助动词、物主代词留在片段结尾，例如 a/an/the/of/to/for/with/as/by/and/or/but/if/when/which/that/we/can/our。\n"
+        "6. 不要把固定搭配拆开，例如 read CSV function、data frame methods、first five or n elements、Dot tail、risk-free rate。\n"
+        "7. 每段通常 6~20 个英文词，过短要合并，过长要在自然从句处切开。\n"
+        "8. text 只放该片段对应原文的中文译文：口语自然、简洁，像中文教学/游戏解说字幕，不要翻成纪录片腔，不要解释或添加原文没有的信息。\n"
+        "9. 保留人名、品牌名、数字、代码、函数名、API、文件名、公式、变量名、版本号、游戏角色/模式/技能名。\n"
+        "10. 只包含 um/uh/er/hmm/yeah/yep/oh/ah 等填充词的片段，text 用空字符串。\n"
+        f"{glossary_lines}"
+        f"源语言：{source_lang}，目标语言：{target_lang}。"
+    )
+
+
 def build_bilibili_metadata_prompt(tid_whitelist: dict[int, str], tag_min_count: int, tag_max_count: int) -> str:
     choices = "\n".join(f"- {tid}: {name}" for tid, name in tid_whitelist.items())
     return (
@@ -273,9 +455,9 @@ def build_bilibili_metadata_prompt(tid_whitelist: dict[int, str], tag_min_count:
 def build_subtitle_translation_prompt(translation_cfg, source_lang: str = "en", target_lang: str = "zh-CN") -> str:
     glossary_lines = ""
     if translation_cfg.glossary:
-        glossary_lines = "\n术语表：\n" + "\n".join(
+        glossary_lines = "术语表：\n" + "\n".join(
             f"- {src} -> {dst}" for src, dst in translation_cfg.glossary.items()
-        )
+        ) + "\n"
 
     return (
         "你是专业字幕翻译。请把字幕从英文翻译成简体中文。\n"
@@ -289,8 +471,41 @@ def build_subtitle_translation_prompt(translation_cfg, source_lang: str = "en",
         "6. 输入 items 每项都有 i 和 text。必须返回 JSON 对象，格式：{\"translations\":[{\"i\":0,\"text\":\"译文1\"},{\"i\":1,\"text\":\"译文2\"}]}。\n"
         "7. translations 必须覆盖每个输入 i，数量与输入 items 完全一致；不要合并、不要拆分、不要省略任何 i。\n"
         "8. 每个元素只放对应字幕的中文译文。\n"
-        f"源语言：{source_lang}，目标语言：{target_lang}。"
         f"{glossary_lines}"
+        f"源语言：{source_lang}，目标语言：{target_lang}。"
+    )
+
+
+def estimate_llm_cost(usage: LLMUsage, pricing) -> float | None:
+    """Price one call from per-million-token rates; None when pricing is not configured."""
+    if pricing is None:
+        return None
+    return (
+        usage.prompt_cache_hit_tokens * pricing.cache_hit
+        + usage.prompt_cache_miss_tokens * pricing.cache_miss
+        + usage.completion_tokens * pricing.output
+    ) / 1_000_000
+
+
+def _usage_from_response(resp, model: str) -> LLMUsage:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return LLMUsage(model=model)
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if hit is None:
+        # OpenAI-compatible providers report cached prefixes under prompt_tokens_details.
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit = getattr(details, "cached_tokens", 0) if details is not None else 0
+    hit = int(hit or 0)
+    miss = int(miss) if miss is not None else max(0, prompt_tokens - hit)
+    return LLMUsage(
+        model=str(getattr(resp, "model", None) or model),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=int(getattr(usage, "completion_tokens", 0) or 0),
+        prompt_cache_hit_tokens=hit,
+        prompt_cache_miss_tokens=miss,
     )
 
 
@@ -378,8 +593,15 @@ def _coerce_translation_result(data: Any, *, expected_count: int) -> list[str]:
 
 
 # Backward-compatible functional API.
-def translate_title(text: str, ai_cfg, translation_cfg, *, logger=None) -> str:
-    client = create_llm_client(ai_cfg, logger=logger)
+def translate_title(
+    text: str,
+    ai_cfg,
+    translation_cfg,
+    *,
+    logger=None,
+    usage_listener: UsageListener | None = None,
+) -> str:
+    client = create_llm_client(ai_cfg, logger=logger, usage_listener=usage_listener)
     return client.translate_text(
         text,
         system_prompt=build_title_prompt(
@@ -391,9 +613,16 @@ def translate_title(text: str, ai_cfg, translation_cfg, *, logger=None) -> str:
     )
 
 
-def segment_subtitle_ranges(lines: list[str], *, ai_cfg, source_lang: str = "en", logger=None) -> list[dict[str, int]]:
+def segment_subtitle_ranges(
+    lines: list[str],
+    *,
+    ai_cfg,
+    source_lang: str = "en",
+    logger=None,
+    usage_listener: UsageListener | None = None,
+) -> list[dict[str, int]]:
     payload = json.dumps({"tokens": [{"i": i, "t": text} for i, text in enumerate(lines)]}, ensure_ascii=False)
-    return create_llm_client(ai_cfg, logger=logger).segment_ranges(
+    return create_llm_client(ai_cfg, logger=logger, usage_listener=usage_listener).segment_ranges(
         lines,
         system_prompt=build_segment_prompt(source_lang),
         source_lang=source_lang,
@@ -401,6 +630,26 @@ def segment_subtitle_ranges(lines: list[str], *, ai_cfg, source_lang: str = "en"
     )
 
 
+def segment_and_translate_subtitle_lines(
+    lines: list[str],
+    *,
+    ai_cfg,
+    translation_cfg,
+    source_lang: str = "en",
+    target_lang: str = "zh-CN",
+    logger=None,
+    usage_listener: UsageListener | None = None,
+) -> list[dict[str, Any]]:
+    payload = json.dumps({"tokens": [{"i": i, "t": text} for i, text in enumerate(lines)]}, ensure_ascii=False)
+    return create_llm_client(ai_cfg, logger=logger, usage_listener=usage_listener).segment_and_translate(
+        lines,
+        system_prompt=build_fused_segment_translation_prompt(translation_cfg, source_lang, target_lang),
+        source_lang=source_lang,
+        target_lang=target_lang,
+        max_tokens=max(4096, min(24000, len(payload) * 5 + 4096)),
+    )
+
+
 def suggest_bilibili_metadata(
     payload: dict[str, Any],
     *,
@@ -409,8 +658,9 @@ def suggest_bilibili_metadata(
     tag_min_count: int = 1,
     tag_max_count: int = 4,
     logger=None,
+    usage_listener: UsageListener | None = None,
 ) -> dict[str, Any]:
-    data = create_llm_client(ai_cfg, logger=logger).complete_json(
+    data = create_llm_client(ai_cfg, logger=logger, usage_listener=usage_listener).complete_json(
         payload,
         system_prompt=build_bilibili_metadata_prompt(tid_whitelist, tag_min_count, tag_max_count),
         max_tokens=1024,
@@ -428,9 +678,10 @@ def translate_subtitle_lines(
     source_lang: str = "en",
     target_lang: str = "zh-CN",
     logger=None,
+    usage_listener: UsageListener | None = None,
 ) -> list[str]:
     payload = json.dumps({"items": [{"i": i, "text": text} for i, text in enumerate(lines)]}, ensure_ascii=False)
-    parsed = create_llm_client(ai_cfg, logger=logger).translate_batch(
+    parsed = create_llm_client(ai_cfg, logger=logger, usage_listener=usage_listener).translate_batch(
         lines,
         system_prompt=build_subtitle_translation_prompt(translation_cfg, source_lang, target_lang),
         max_tokens=max(4096, min(16000, len(payload) * 3 + 2048)),
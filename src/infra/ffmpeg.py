@@ -1,10 +1,143 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import re
 import subprocess
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field, replace
+from functools import lru_cache
 from pathlib import Path
 
 from src.infra.cli_path import resolve_cli
+from src.infra.process_watchdog import StallWatchdog
+
+
+# "  Duration: 00:12:34.56, start: ..." in ffmpeg's input banner.
+_DURATION_RE = re.compile(r"^\s*Duration:\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+_PROGRESS_LINE_RE = re.compile(r"^([a-z][a-z0-9_]*)=(\S*)$")
+# libx264 with qp 0 is lossless, so test sources and references add no coding noise of their own.
+_LOSSLESS_VIDEO_ARGS = ("-c:v", "libx264", "-preset", "ultrafast", "-qp", "0", "-pix_fmt", "yuv420p")
+# Annex-B MPEG-TS segments carry SPS/PPS in-band, so re-encoded and copied spans concatenate cleanly.
+_TS_SEGMENT_ARGS = ("-bsf:v", "h264_mp4toannexb", "-avoid_negative_ts", "make_zero", "-f", "mpegts")
+_SEGMENT_PROGRESS_ARGS = ("-nostats", "-progress", "pipe:1")
+_PSNR_RE = re.compile(r"PSNR y:.*?average:(inf|[\d.]+)")
+_SSIM_RE = re.compile(r"SSIM Y:.*?All:([\d.]+)")
+_VMAF_RE = re.compile(r"VMAF score[:=]\s*([\d.]+)")
+# How ffmpeg's http protocol reports an error status from a network input.
+_HTTP_ERROR_RE = re.compile(r"HTTP error \d{3}|Server returned (?:\d{3}|4XX|5XX)")
+# Network inputs reconnect on drops instead of ending the encode early; rw_timeout (µs) bounds a dead socket.
+_RECONNECT_ARGS = (
+    "-reconnect",
+    "1",
+    "-reconnect_streamed",
+    "1",
+    "-reconnect_on_network_error",
+    "1",
+    "-reconnect_delay_max",
+    "30",
+    "-rw_timeout",
+    "30000000",
+)
+_PROBE_STREAM_ENTRIES = (
+    "index,codec_type,codec_name,profile,pix_fmt,width,height,r_frame_rate,avg_frame_rate,field_order,sample_rate,channels"
+)
+# Bump when MediaInfo changes shape so stale on-disk entries are ignored.
+_PROBE_CACHE_VERSION = 1
+_PROBE_MEMORY_LIMIT = 256
+# On-disk entries unused for this long, or beyond the newest this many, are pruned at startup.
+_PROBE_DISK_MAX_AGE_SECONDS = 30 * 86400
+_PROBE_DISK_MAX_ENTRIES = 2048
+# Scratch directories made by the renderer and benchmarks; their files never outlive the run.
+_SCRATCH_DIR_RE = re.compile(r"^\.?y2b-[a-z]+-[A-Za-z0-9_]+$")
+
+
+@dataclass
+class RenderProgress:
+    """One snapshot of ffmpeg's ``-progress`` key=value stream."""
+
+    out_seconds: float = 0.0
+    frame: int = 0
+    fps: float | None = None
+    speed: float | None = None
+    total_seconds: float | None = None
+    done: bool = False
+
+    @property
+    def fraction(self) -> float | None:
+        if not self.total_seconds:
+            return None
+        return 1.0 if self.done else min(1.0, max(0.0, self.out_seconds / self.total_seconds))
+
+    @property
+    def eta_seconds(self) -> float | None:
+        if self.done:
+            return 0.0
+        if not self.total_seconds or not self.speed:
+            return None
+        return max(0.0, self.total_seconds - self.out_seconds) / self.speed
+
+
+class ProgressParser:
+    """Fold ffmpeg ``-progress`` lines into RenderProgress snapshots.
+
+    ffmpeg writes one key=value per line and ends each block with
+    ``progress=continue`` (or ``progress=end``); feed() returns a snapshot only
+    on those lines. The input duration is picked up from the stderr banner when
+    both streams share a pipe.
+    """
+
+    def __init__(self, total_seconds: float | None = None):
+        self.total_seconds = total_seconds
+        self._values: dict[str, str] = {}
+
+    def feed(self, line: str) -> RenderProgress | None:
+        if self.total_seconds is None:
+            duration = _DURATION_RE.match(line)
+            if duration:
+                hours, minutes, seconds = duration.groups()
+                self.total_seconds = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+                return None
+        match = _PROGRESS_LINE_RE.match(line.strip())
+        if not match:
+            return None
+        key, value = match.groups()
+        if key != "progress":
+            self._values[key] = value
+            return None
+        values, self._values = self._values, {}
+        return RenderProgress(
+            out_seconds=_progress_out_seconds(values),
+            frame=int(_progress_number(values.get("frame")) or 0),
+            fps=_progress_number(values.get("fps")),
+            speed=_progress_number((values.get("speed") or "").rstrip("x")),
+            total_seconds=self.total_seconds,
+            done=value == "end",
+        )
+
+    def is_progress_line(self, line: str) -> bool:
+        return bool(_PROGRESS_LINE_RE.match(line.strip()))
+
+
+def _progress_number(value: str | None) -> float | None:
+    try:
+        number = float(value) if value else None
+    except ValueError:  # "N/A" before the first frame is encoded
+        return None
+    return number if number is not None and number >= 0 else None
+
+
+def _progress_out_seconds(values: dict[str, str]) -> float:
+    # out_time_ms is in microseconds as well, despite its name.
+    for key in ("out_time_us", "out_time_ms"):
+        micros = _progress_number(values.get(key))
+        if micros is not None:
+            return micros / 1_000_000
+    return 0.0
 
 
 def _bin(name: str) -> str:
@@ -23,7 +156,106 @@ def probe_ffmpeg() -> None:
     subprocess.run([_bin("ffprobe"), "-version"], capture_output=True, text=True, check=True)
 
 
-def get_video_resolution(video_path: str | Path) -> tuple[int, int]:
+@dataclass
+class MediaInfo:
+    """Streams, duration and (optionally) video keyframes of a media file."""
+
+    duration: float | None
+    format_name: str
+    streams: list[dict]
+    # Only filled by probe_media(..., packets=True), which reads every video packet header.
+    keyframes: list[float] | None = None
+    video_packets: int | None = None
+
+    def first_stream(self, codec_type: str) -> dict | None:
+        return next((stream for stream in self.streams if stream.get("codec_type") == codec_type), None)
+
+    @property
+    def codec_types(self) -> set[str]:
+        return {str(stream.get("codec_type") or "") for stream in self.streams}
+
+
+_probe_memory: OrderedDict[tuple[str, int, int], MediaInfo] = OrderedDict()
+_probe_lock = threading.Lock()
+_probe_cache_dir: Path | None = None
+
+
+def set_probe_cache_dir(directory: str | Path | None) -> None:
+    """Persist probe_media() results under directory; None keeps them in memory only.
+
+    Called once at startup, it also prunes entries unused for
+    _PROBE_DISK_MAX_AGE_SECONDS and keeps at most _PROBE_DISK_MAX_ENTRIES.
+    """
+    global _probe_cache_dir
+    _probe_cache_dir = Path(directory) if directory else None
+    if _probe_cache_dir is not None:
+        _prune_probe_cache(_probe_cache_dir)
+
+
+def _prune_probe_cache(directory: Path) -> None:
+    now = time.time()
+    try:
+        entries = []
+        for file in directory.iterdir():
+            if file.suffix not in {".json", ".partial"}:
+                continue
+            mtime = file.stat().st_mtime
+            if file.suffix == ".partial" or now - mtime > _PROBE_DISK_MAX_AGE_SECONDS:
+                file.unlink(missing_ok=True)
+            else:
+                entries.append((mtime, file))
+        entries.sort(reverse=True)
+        for _mtime, file in entries[_PROBE_DISK_MAX_ENTRIES:]:
+            file.unlink(missing_ok=True)
+    except OSError:
+        # A missing or read-only cache dir only means nothing gets pruned.
+        pass
+
+
+def probe_media(path: str | Path, *, packets: bool = False) -> MediaInfo:
+    """Inspect path with ffprobe, cached by (path, size, mtime_ns).
+
+    Results are kept in memory and, after set_probe_cache_dir(), on disk, so a
+    file is probed once per content version across stages and runs. Files in
+    the renderer's scratch directories are only cached in memory. packets=True
+    adds the video keyframe list and packet count from a separate packet scan,
+    run only when the cached entry does not have them yet.
+    """
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    persist = not any(_SCRATCH_DIR_RE.match(part) for part in path.resolve().parent.parts)
+    info = _cached_probe(key, persist=persist)
+    if info is None:
+        info = _run_probe(path)
+    elif not packets or info.keyframes is not None:
+        return info
+    if packets:
+        keyframes, count = _scan_video_packets(path)
+        info = replace(info, keyframes=keyframes, video_packets=count)
+    _store_probe(key, info, persist=persist)
+    return info
+
+
+def _run_probe(path: Path) -> MediaInfo:
+    entries = f"format=duration,format_name:stream={_PROBE_STREAM_ENTRIES}"
+    cmd = [_bin("ffprobe"), "-v", "error", "-show_entries", entries, "-of", "json", str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout or "{}")
+    fmt = data.get("format") or {}
+    try:
+        duration = float(fmt.get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    return MediaInfo(duration=duration, format_name=str(fmt.get("format_name") or ""), streams=data.get("streams") or [])
+
+
+def _scan_video_packets(path: Path) -> tuple[list[float], int]:
+    """Read the first video stream's packet headers; returns (sorted keyframe times, packet count).
+
+    A long video has hundreds of thousands of packets, so the CSV output is
+    consumed line by line instead of being loaded as one JSON document.
+    """
     cmd = [
         _bin("ffprobe"),
         "-v",
@@ -31,23 +263,268 @@ def get_video_resolution(video_path: str | Path) -> tuple[int, int]:
         "-select_streams",
         "v:0",
         "-show_entries",
-        "stream=width,height",
+        "packet=pts_time,flags",
         "-of",
-        "json",
-        str(video_path),
+        "csv=p=0",
+        str(path),
     ]
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    data = json.loads(result.stdout or "{}")
-    streams = data.get("streams") or []
-    if not streams:
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    keyframes: list[float] = []
+    count = 0
+    assert process.stdout is not None
+    for line in process.stdout:
+        line = line.strip()
+        if not line:
+            continue
+        count += 1
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in {"", "N/A"}:
+            keyframes.append(float(pts))
+    _stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+    return sorted(keyframes), count
+
+
+def _cached_probe(key: tuple[str, int, int], *, persist: bool) -> MediaInfo | None:
+    with _probe_lock:
+        info = _probe_memory.get(key)
+        if info is not None:
+            _probe_memory.move_to_end(key)
+            return info
+    cache_file = _probe_cache_file(key) if persist else None
+    if cache_file is None or not cache_file.exists():
+        return None
+    try:
+        entry = json.loads(cache_file.read_text(encoding="utf-8"))
+        if entry.get("version") != _PROBE_CACHE_VERSION or entry.get("key") != list(key):
+            return None
+        info = MediaInfo(**entry["info"])
+        # Pruning goes by mtime, so a hit keeps the entry alive.
+        os.utime(cache_file)
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    _remember_probe(key, info)
+    return info
+
+
+def _store_probe(key: tuple[str, int, int], info: MediaInfo, *, persist: bool) -> None:
+    _remember_probe(key, info)
+    cache_file = _probe_cache_file(key) if persist else None
+    if cache_file is None:
+        return
+    entry = {"version": _PROBE_CACHE_VERSION, "key": list(key), "info": asdict(info)}
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        partial = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.partial")
+        partial.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(partial, cache_file)
+    except OSError:
+        # The disk cache is an optimization; a read-only data dir must not fail the job.
+        pass
+
+
+def _remember_probe(key: tuple[str, int, int], info: MediaInfo) -> None:
+    with _probe_lock:
+        _probe_memory[key] = info
+        _probe_memory.move_to_end(key)
+        while len(_probe_memory) > _PROBE_MEMORY_LIMIT:
+            _probe_memory.popitem(last=False)
+
+
+def _probe_cache_file(key: tuple[str, int, int]) -> Path | None:
+    if _probe_cache_dir is None:
+        return None
+    digest = hashlib.sha256(json.dumps(list(key)).encode("utf-8")).hexdigest()
+    return _probe_cache_dir / f"{digest[:32]}.json"
+
+
+def get_video_resolution(video_path: str | Path) -> tuple[int, int]:
+    video = probe_media(video_path).first_stream("video")
+    if not video:
         raise RuntimeError(f"无法读取视频分辨率: {video_path}")
-    width = int(streams[0].get("width") or 0)
-    height = int(streams[0].get("height") or 0)
+    width = int(video.get("width") or 0)
+    height = int(video.get("height") or 0)
     if width <= 0 or height <= 0:
         raise RuntimeError(f"视频分辨率无效: {width}x{height}")
     return width, height
 
 
+@lru_cache(maxsize=None)
+def has_ffmpeg_filter(name: str) -> bool:
+    result = subprocess.run([_bin("ffmpeg"), "-hide_banner", "-filters"], capture_output=True, text=True)
+    return any(line.split()[1:2] == [name] for line in result.stdout.splitlines())
+
+
+def make_test_pattern(output: str | Path, *, seconds: float, width: int, height: int, fps: int = 30) -> Path:
+    """Write a lossless lavfi test pattern (moving testsrc2 plus a sine tone) to output."""
+    output = Path(output)
+    cmd = [
+        _bin("ffmpeg"),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate={fps}",
+        "-f",
+        "lavfi",
+        "-i",
+        "sine=frequency=440:sample_rate=48000",
+        "-t",
+        f"{seconds:g}",
+        *_LOSSLESS_VIDEO_ARGS,
+        "-c:a",
+        "aac",
+        str(output),
+    ]
+    _run_checked(cmd, "ffmpeg 生成测试视频失败")
+    return output
+
+
+def get_media_duration(path: str | Path) -> float:
+    duration = probe_media(path).duration
+    if duration is None:
+        raise RuntimeError(f"无法读取媒体时长: {path}")
+    if duration <= 0:
+        raise RuntimeError(f"媒体时长无效: {duration}")
+    return duration
+
+
+def extract_clip(input_video: str | Path, output: str | Path, *, seconds: float, start: float = 0.0) -> Path:
+    """Losslessly re-encode seconds of input_video from start, so every encode sees the same frames."""
+    output = Path(output)
+    cmd = [
+        _bin("ffmpeg"),
+        "-y",
+        "-v",
+        "error",
+        "-ss",
+        f"{start:.3f}",
+        "-i",
+        str(input_video),
+        "-t",
+        f"{seconds:g}",
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        *_LOSSLESS_VIDEO_ARGS,
+        "-c:a",
+        "aac",
+        str(output),
+    ]
+    _run_checked(cmd, "ffmpeg 截取测试片段失败")
+    return output
+
+
+def encode_video(
+    input_video: str | Path,
+    output: str | Path,
+    *,
+    codec: str,
+    preset: str | None,
+    crf: int,
+    maxrate: str | None = None,
+    bufsize: str | None = None,
+) -> Path:
+    """Encode the video stream only, with the same rate-control flags burn_ass_subtitle uses."""
+    output = Path(output)
+    cmd = [_bin("ffmpeg"), "-y", "-v", "error", "-i", str(input_video), "-an", "-c:v", codec]
+    cmd.extend(_rate_control_args(preset=preset, crf=crf, bitrate=None, maxrate=maxrate, bufsize=bufsize))
+    cmd.append(str(output))
+    _run_checked(cmd, "ffmpeg 编码采样片段失败")
+    return output
+
+
+def measure_quality(
+    distorted: str | Path,
+    reference: str | Path,
+    *,
+    metrics: tuple[str, ...] | None = None,
+) -> dict[str, float]:
+    """PSNR (dB) and SSIM of distorted against reference, plus VMAF when ffmpeg has libvmaf.
+
+    metrics narrows the ffmpeg filters run, e.g. ("ssim",) for a quick check.
+    """
+    if metrics is None:
+        metrics = ("psnr", "ssim", "libvmaf") if has_ffmpeg_filter("libvmaf") else ("psnr", "ssim")
+    count = len(metrics)
+    graph = ";".join(
+        [
+            f"[0:v]split={count}" + "".join(f"[d{i}]" for i in range(count)),
+            f"[1:v]split={count}" + "".join(f"[r{i}]" for i in range(count)),
+            *(f"[d{i}][r{i}]{metric}" for i, metric in enumerate(metrics)),
+        ]
+    )
+    cmd = [
+        _bin("ffmpeg"),
+        "-hide_banner",
+        "-i",
+        str(distorted),
+        "-i",
+        str(reference),
+        "-lavfi",
+        graph,
+        "-f",
+        "null",
+        "-",
+    ]
+    output = _run_checked(cmd, "ffmpeg 画质评估失败")
+    result: dict[str, float] = {}
+    for name, pattern in (("psnr", _PSNR_RE), ("ssim", _SSIM_RE), ("vmaf", _VMAF_RE)):
+        match = pattern.search(output)
+        if match:
+            result[name] = float(match.group(1))
+    return result
+
+
+def _run_checked(cmd: list[str], error: str) -> str:
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{error}:\n" + "\n".join(result.stderr.splitlines()[-20:]))
+    return result.stderr
+
+
+class StreamHTTPError(RuntimeError):
+    """ffmpeg stopped because a network input answered with an HTTP error, e.g. an expired signed URL."""
+
+
+@dataclass
+class StreamInput:
+    """A network input read by ffmpeg directly, e.g. a format URL selected by yt-dlp."""
+
+    url: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+def _input_args(source: str | Path | StreamInput) -> list[str]:
+    if not isinstance(source, StreamInput):
+        return ["-i", str(source)]
+    args = list(_RECONNECT_ARGS)
+    if source.headers:
+        args.extend(["-headers", "".join(f"{key}: {value}\r\n" for key, value in source.headers.items())])
+    return [*args, "-i", source.url]
+
+
+@dataclass
+class RenderTarget:
+    """One encoded output of a subtitle burn; height scales it down, keeping the aspect ratio."""
+
+    output: Path
+    codec: str = "libx264"
+    preset: str | None = "medium"
+    crf: int | None = 20
+    bitrate: str | None = None
+    maxrate: str | None = None
+    bufsize: str | None = None
+    height: int | None = None
+    # Explicit encoder threads; None leaves ffmpeg's default of one per core.
+    threads: int | None = None
+    lookahead_threads: int | None = None
+
+
 def burn_ass_subtitle(
     *,
     input_video: str | Path,
@@ -59,37 +536,107 @@ def burn_ass_subtitle(
     preset: str | None = "medium",
     crf: int | None = 20,
     bitrate: str | None = None,
+    maxrate: str | None = None,
+    bufsize: str | None = None,
+    progress_callback: Callable[[RenderProgress], None] | None = None,
+    stall_seconds: float = 0.0,
 ) -> Path:
-    output = Path(output_video)
-    output.parent.mkdir(parents=True, exist_ok=True)
-    filter_arg = f"ass=filename='{_escape_filter_path(Path(ass_path).resolve())}'"
-    if fonts_dir:
-        font_path = Path(fonts_dir)
-        if font_path.exists():
-            filter_arg += f":fontsdir='{_escape_filter_path(font_path.resolve())}'"
+    """Burn an ASS file into the video, reporting ``-progress`` snapshots to progress_callback."""
+    target = RenderTarget(
+        Path(output_video), codec=codec, preset=preset, crf=crf, bitrate=bitrate, maxrate=maxrate, bufsize=bufsize
+    )
+    return burn_ass_subtitle_outputs(
+        input_video=input_video,
+        ass_path=ass_path,
+        targets=[target],
+        fonts_dir=fonts_dir,
+        logger=logger,
+        progress_callback=progress_callback,
+        stall_seconds=stall_seconds,
+    )[0]
+
+
+def burn_ass_subtitle_outputs(
+    *,
+    input_video: str | Path | StreamInput,
+    ass_path: str | Path,
+    targets: list[RenderTarget],
+    fonts_dir: str | Path | None = None,
+    logger=None,
+    progress_callback: Callable[[RenderProgress], None] | None = None,
+    stall_seconds: float = 0.0,
+    audio_input: StreamInput | None = None,
+) -> list[Path]:
+    """Decode once, burn the ASS once, then split into one encoder per target.
+
+    input_video may be a StreamInput, with the audio in a separate audio_input,
+    so the encode reads straight from the network. With stall_seconds > 0,
+    ffmpeg is killed and SubprocessStalledError raised when its output position
+    stops advancing for that long.
+    """
+    if not targets:
+        raise ValueError("至少需要一个压制输出")
+    filter_arg = _ass_filter(ass_path, fonts_dir)
     cmd = [
         _bin("ffmpeg"),
         "-y",
-        "-i",
-        str(input_video),
-        "-vf",
-        filter_arg,
-        "-c:v",
-        codec,
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        *_input_args(input_video),
     ]
-    if preset:
-        cmd.extend(["-preset", preset])
-    if crf is not None:
-        cmd.extend(["-crf", str(crf)])
-    if bitrate:
-        cmd.extend(["-b:v", bitrate])
-    cmd.extend([
-        "-c:a",
-        "copy",
-        str(output),
-    ])
+    audio_map = "0:a?"
+    if audio_input is not None:
+        cmd.extend(_input_args(audio_input))
+        audio_map = "1:a:0"
+    single = len(targets) == 1 and targets[0].height is None
+    if single:
+        cmd.extend(["-vf", filter_arg])
+        if audio_input is not None:
+            cmd.extend(["-map", "0:v:0", "-map", audio_map])
+    else:
+        cmd.extend(["-filter_complex", _split_filter_graph(filter_arg, targets)])
+    for index, target in enumerate(targets):
+        target.output.parent.mkdir(parents=True, exist_ok=True)
+        if not single:
+            cmd.extend(["-map", f"[v{index}]", "-map", audio_map])
+        cmd.extend(["-c:v", target.codec])
+        cmd.extend(
+            _rate_control_args(
+                preset=target.preset,
+                crf=target.crf,
+                bitrate=target.bitrate,
+                maxrate=target.maxrate,
+                bufsize=target.bufsize,
+            )
+        )
+        cmd.extend(_thread_args(target.codec, target.threads, target.lookahead_threads))
+        cmd.extend(["-c:a", "copy", str(target.output)])
     if logger:
         logger.info("[ffmpeg] " + " ".join(cmd))
+    _run_with_progress(
+        cmd,
+        tool="ffmpeg 字幕压制",
+        error="ffmpeg 字幕压制失败",
+        progress_callback=progress_callback,
+        stall_seconds=stall_seconds,
+    )
+    return [target.output for target in targets]
+
+
+def _run_with_progress(
+    cmd: list[str],
+    *,
+    tool: str,
+    error: str,
+    progress_callback: Callable[[RenderProgress], None] | None = None,
+    stall_seconds: float = 0.0,
+) -> None:
+    """Run an ffmpeg command that writes ``-progress pipe:1``, under the stall watchdog.
+
+    Progress only counts when the output position advances, so a hung input
+    that keeps printing the same position is still treated as stalled.
+    """
     process = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -98,22 +645,274 @@ def burn_ass_subtitle(
         bufsize=1,
     )
     last_lines: list[str] = []
-    assert process.stdout is not None
-    for raw_line in process.stdout:
+    parser = ProgressParser()
+    watchdog = StallWatchdog(process, tool=tool, stall_seconds=stall_seconds, is_noise=parser.is_progress_line)
+    position = -1.0
+    for raw_line in watchdog.lines():
         line = raw_line.rstrip()
         if not line:
             continue
+        if parser.is_progress_line(line):
+            snapshot = parser.feed(line)
+            if snapshot is not None and (snapshot.done or snapshot.out_seconds > position):
+                position = snapshot.out_seconds
+                watchdog.progressed()
+            if snapshot is not None and progress_callback:
+                progress_callback(snapshot)
+            continue
+        parser.feed(line)  # picks up the input duration from the banner
         last_lines.append(line)
         if len(last_lines) > 100:
             last_lines.pop(0)
-        if logger and ("time=" in line or line.startswith("frame=")):
-            logger.info(f"[ffmpeg] {line}")
     code = process.wait()
     if code != 0:
-        raise RuntimeError("ffmpeg 字幕压制失败:\n" + "\n".join(last_lines))
+        message = f"{error}:\n" + "\n".join(last_lines)
+        if any(_HTTP_ERROR_RE.search(line) for line in last_lines):
+            raise StreamHTTPError(message)
+        raise RuntimeError(message)
+
+
+def render_preview(
+    *,
+    input_video: str | Path,
+    ass_path: str | Path,
+    output: str | Path,
+    at: float,
+    duration: float = 5.0,
+    still: bool = False,
+    fonts_dir: str | Path | None = None,
+) -> Path:
+    """Burn the ASS into a short clip (or one frame) starting at ``at`` seconds.
+
+    Input seeking with -copyts keeps the original timestamps, so libass shows
+    the cues of that moment; setpts then rebases the clip to start at zero.
+    """
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    filter_arg = _ass_filter(ass_path, fonts_dir)
+    cmd = [_bin("ffmpeg"), "-y", "-v", "error", "-ss", f"{at:.3f}", "-copyts"]
+    if still:
+        cmd.extend(["-i", str(input_video), "-vf", filter_arg, "-frames:v", "1", "-update", "1", str(output)])
+    else:
+        cmd.extend(["-t", f"{duration:g}", "-i", str(input_video)])
+        cmd.extend(["-vf", f"{filter_arg},setpts=PTS-STARTPTS", "-af", "asetpts=PTS-STARTPTS"])
+        cmd.extend(["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-c:a", "aac", str(output)])
+    _run_checked(cmd, "ffmpeg 生成预览失败")
     return output
 
 
+def probe_video_stream(path: str | Path) -> dict:
+    """Codec parameters of the first video stream plus the container duration."""
+    info = probe_media(path)
+    video = info.first_stream("video")
+    if not video:
+        raise RuntimeError(f"没有视频流: {path}")
+    return {**video, "duration": info.duration or 0.0}
+
+
+def probe_keyframes(path: str | Path) -> list[float]:
+    """Presentation times of the video keyframes, read from packet flags without decoding."""
+    return list(probe_media(path, packets=True).keyframes or [])
+
+
+def count_video_packets(path: str | Path) -> int:
+    return probe_media(path, packets=True).video_packets or 0
+
+
+def copy_video_segment(
+    input_video: str | Path,
+    output: str | Path,
+    *,
+    start: float,
+    duration: float,
+    progress_callback: Callable[[RenderProgress], None] | None = None,
+    stall_seconds: float = 0.0,
+) -> Path:
+    """Stream-copy the video packets of [start, start + duration) into an MPEG-TS segment."""
+    cmd = [
+        _bin("ffmpeg"),
+        "-y",
+        "-v",
+        "error",
+        *_SEGMENT_PROGRESS_ARGS,
+        "-ss",
+        f"{start:.6f}",
+        "-t",
+        f"{duration:.6f}",
+        "-i",
+        str(input_video),
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        *_TS_SEGMENT_ARGS,
+        str(output),
+    ]
+    _run_with_progress(
+        cmd,
+        tool="ffmpeg 复制视频片段",
+        error="ffmpeg 复制视频片段失败",
+        progress_callback=progress_callback,
+        stall_seconds=stall_seconds,
+    )
+    return Path(output)
+
+
+def encode_subtitled_segment(
+    input_video: str | Path,
+    ass_path: str | Path,
+    output: str | Path,
+    *,
+    start: float,
+    duration: float,
+    codec: str,
+    preset: str | None,
+    crf: int | None,
+    profile: str,
+    pix_fmt: str,
+    bitrate: str | None = None,
+    maxrate: str | None = None,
+    bufsize: str | None = None,
+    fonts_dir: str | Path | None = None,
+    threads: int | None = None,
+    lookahead_threads: int | None = None,
+    progress_callback: Callable[[RenderProgress], None] | None = None,
+    stall_seconds: float = 0.0,
+) -> Path:
+    """Burn the ASS into [start, start + duration) and encode it as an MPEG-TS segment.
+
+    -copyts keeps the original timestamps for libass; profile and pix_fmt
+    follow the source so the segment can sit between stream-copied ones.
+    Progress positions are relative to start.
+    """
+    cmd = [
+        _bin("ffmpeg"),
+        "-y",
+        "-v",
+        "error",
+        *_SEGMENT_PROGRESS_ARGS,
+        "-ss",
+        f"{start:.6f}",
+        "-t",
+        f"{duration:.6f}",
+        "-copyts",
+        "-i",
+        str(input_video),
+        "-map",
+        "0:v:0",
+        "-vf",
+        f"{_ass_filter(ass_path, fonts_dir)},setpts=PTS-STARTPTS",
+        "-c:v",
+        codec,
+        *_rate_control_args(preset=preset, crf=crf, bitrate=bitrate, maxrate=maxrate, bufsize=bufsize),
+        *_thread_args(codec, threads, lookahead_threads),
+        "-profile:v",
+        profile,
+        "-pix_fmt",
+        pix_fmt,
+        *_TS_SEGMENT_ARGS,
+        str(output),
+    ]
+    _run_with_progress(
+        cmd,
+        tool="ffmpeg 字幕片段压制",
+        error="ffmpeg 压制字幕片段失败",
+        progress_callback=progress_callback,
+        stall_seconds=stall_seconds,
+    )
+    return Path(output)
+
+
+def concat_segments_with_audio(segments: list[Path], audio_source: str | Path, output: str | Path) -> Path:
+    """Concatenate video segments and mux them with the untouched audio of audio_source."""
+    output = Path(output)
+    list_file = output.with_name(f".{output.name}.segments.txt")
+    list_file.write_text("".join(f"file '{_escape_concat_path(path)}'\n" for path in segments), encoding="utf-8")
+    try:
+        cmd = [
+            _bin("ffmpeg"),
+            "-y",
+            "-v",
+            "error",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            str(list_file),
+            "-i",
+            str(audio_source),
+            "-map",
+            "0:v:0",
+            "-map",
+            "1:a?",
+            "-c",
+            "copy",
+            "-movflags",
+            "+faststart",
+            str(output),
+        ]
+        _run_checked(cmd, "ffmpeg 拼接视频片段失败")
+    finally:
+        list_file.unlink(missing_ok=True)
+    return output
+
+
+def _ass_filter(ass_path: str | Path, fonts_dir: str | Path | None) -> str:
+    filter_arg = f"ass=filename='{_escape_filter_path(Path(ass_path).resolve())}'"
+    if fonts_dir:
+        font_path = Path(fonts_dir)
+        if font_path.exists():
+            filter_arg += f":fontsdir='{_escape_filter_path(font_path.resolve())}'"
+    return filter_arg
+
+
+def _escape_concat_path(path: Path) -> str:
+    return str(Path(path).resolve()).replace("'", "'\\''")
+
+
+def _split_filter_graph(filter_arg: str, targets: list[RenderTarget]) -> str:
+    count = len(targets)
+    labels = [f"[s{index}]" for index in range(count)]
+    chains = [f"[0:v]{filter_arg}" + (f",split={count}" if count > 1 else "") + "".join(labels)]
+    for index, target in enumerate(targets):
+        if target.height:
+            chains.append(f"[s{index}]scale=-2:{target.height}[v{index}]")
+        else:
+            chains.append(f"[s{index}]null[v{index}]")
+    return ";".join(chains)
+
+
+def _rate_control_args(
+    *,
+    preset: str | None,
+    crf: int | None,
+    bitrate: str | None,
+    maxrate: str | None,
+    bufsize: str | None,
+) -> list[str]:
+    args: list[str] = []
+    if preset:
+        args.extend(["-preset", preset])
+    if crf is not None:
+        args.extend(["-crf", str(crf)])
+    if bitrate:
+        args.extend(["-b:v", bitrate])
+    if maxrate:
+        args.extend(["-maxrate", maxrate, "-bufsize", bufsize or maxrate])
+    return args
+
+
+def _thread_args(codec: str, threads: int | None, lookahead_threads: int | None) -> list[str]:
+    if not threads:
+        return []
+    args = ["-threads", str(threads)]
+    if codec == "libx264":
+        lookahead = lookahead_threads or max(1, threads // 6)
+        args.extend(["-x264-params", f"threads={threads}:lookahead-threads={lookahead}"])
+    return args
+
+
 def _escape_filter_path(path: Path) -> str:
     # ffmpeg filtergraph path escaping for ass/subtitles filter.
     text = str(path).replace("\\", "/")
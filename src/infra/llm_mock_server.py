@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import random
+import select
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Literal
+
+
+@dataclass
+class MockLLMServerConfig:
+    """Latency and fault-injection knobs for the local OpenAI-compatible mock server."""
+
+    latency_ms: float = 300.0
+    latency_distribution: Literal["fixed", "uniform", "lognormal"] = "lognormal"
+    # uniform: +/- fraction of latency_ms; lognormal: sigma of the underlying normal.
+    latency_jitter: float = 0.4
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_503: float = 0.0
+    timeout_rate: float = 0.0
+    # An injected timeout holds the request this long (set it above the client's
+    # timeout) and then drops the connection without a response.
+    timeout_seconds: float = 30.0
+    truncate_rate: float = 0.0
+    segment_size: int = 8
+    seed: int | None = None
+
+
+@dataclass
+class MockLLMServerStats:
+    requests: int = 0
+    faults: dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"requests": self.requests, "faults": dict(sorted(self.faults.items()))}
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: MockLLMServerConfig):
+        super().__init__(address, _MockLLMHandler)
+        self.mock_config = config
+        self.stats = MockLLMServerStats()
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes: set[str] = set()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> MockLLMServer:
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> MockLLMServer:
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    def plan_request(self) -> tuple[float, str | None]:
+        """Pick this request's latency (seconds) and injected fault, if any."""
+        cfg = self.mock_config
+        with self._lock:
+            self.stats.requests += 1
+            latency = _sample_latency(self._rng, cfg) / 1000
+            roll = self._rng.random()
+            fault = None
+            threshold = 0.0
+            for name, rate in (
+                ("timeout", cfg.timeout_rate),
+                ("429", cfg.rate_429),
+                ("500", cfg.rate_500),
+                ("503", cfg.rate_503),
+                ("truncated", cfg.truncate_rate),
+            ):
+                threshold += max(0.0, rate)
+                if roll < threshold:
+                    fault = name
+                    self.stats.faults[name] = self.stats.faults.get(name, 0) + 1
+                    break
+        return latency, fault
+
+    def cache_hit_tokens(self, system_prompt: str) -> int:
+        # Emulate provider prefix caching: a repeated system prompt is served from cache.
+        digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest in self._seen_prefixes:
+                return _estimate_tokens(system_prompt)
+            self._seen_prefixes.add(digest)
+        return 0
+
+
+def start_mock_llm_server(
+    config: MockLLMServerConfig | None = None,
+    *,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> MockLLMServer:
+    return MockLLMServer((host, port), config or MockLLMServerConfig()).start()
+
+
+class _MockLLMHandler(BaseHTTPRequestHandler):
+    server: MockLLMServer
+
+    def log_message(self, *_args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path: {self.path}", "type": "not_found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        latency, fault = self.server.plan_request()
+        if fault == "timeout":
+            self._hold_then_drop(self.server.mock_config.timeout_seconds)
+            return
+        time.sleep(latency)
+        if fault in {"429", "500", "503"}:
+            self._send_json(int(fault), {"error": {"message": f"mock injected {fault}", "type": "mock_fault"}})
+            return
+
+        content = _mock_completion_content(body, segment_size=self.server.mock_config.segment_size)
+        finish_reason = "stop"
+        if fault == "truncated":
+            content = content[: max(1, len(content) // 2)]
+            finish_reason = "length"
+        messages = body.get("messages") or []
+        system_prompt = next((str(m.get("content") or "") for m in messages if m.get("role") == "system"), "")
+        prompt_tokens = sum(_estimate_tokens(str(m.get("content") or "")) for m in messages)
+        hit = min(prompt_tokens, self.server.cache_hit_tokens(system_prompt))
+        self._send_json(
+            200,
+            {
+                "id": "mock-" + hashlib.md5(content.encode("utf-8")).hexdigest()[:12],
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model") or "mock",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": finish_reason,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": _estimate_tokens(content),
+                    "total_tokens": prompt_tokens + _estimate_tokens(content),
+                    "prompt_cache_hit_tokens": hit,
+                    "prompt_cache_miss_tokens": prompt_tokens - hit,
+                },
+            },
+        )
+
+    def _hold_then_drop(self, seconds: float) -> None:
+        """Send nothing until the client gives up or seconds pass, then close the socket."""
+        deadline = time.monotonic() + seconds
+        while (remaining := deadline - time.monotonic()) > 0:
+            readable, _, _ = select.select([self.connection], [], [], remaining)
+            try:
+                if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                    break
+            except OSError:
+                break
+        self.close_connection = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _send_json(self, status: int, payload: dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up first, e.g. on an injected timeout.
+            pass
+
+
+def _sample_latency(rng: random.Random, cfg: MockLLMServerConfig) -> float:
+    base = max(0.0, cfg.latency_ms)
+    if cfg.latency_distribution == "fixed" or base == 0:
+        return base
+    if cfg.latency_distribution == "uniform":
+        spread = base * max(0.0, cfg.latency_jitter)
+        return max(0.0, rng.uniform(base - spread, base + spread))
+    # lognormal with latency_ms as the median, which gives the long tail seen on real APIs.
+    return rng.lognormvariate(math.log(base), max(0.0, cfg.latency_jitter))
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def _mock_completion_content(body: dict[str, Any], *, segment_size: int) -> str:
+    messages = body.get("messages") or []
+    user = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+    try:
+        payload = json.loads(user)
+    except json.JSONDecodeError:
+        payload = None
+    if isinstance(payload, dict) and isinstance(payload.get("tokens"), list):
+        tokens = payload["tokens"]
+        count = len(tokens)
+        size = max(1, segment_size)
+        ranges = [{"start": start, "end": min(count, start + size) - 1} for start in range(0, count, size)]
+        if payload.get("target_lang"):
+            # Fused segment-and-translate request: each range also carries its translation.
+            segments = [
+                {
+                    **item,
+                    "text": "译：" + " ".join(
+                        str(token.get("t") or "") for token in tokens[item["start"] : item["end"] + 1] if isinstance(token, dict)
+                    ),
+                }
+                for item in ranges
+            ]
+            return json.dumps({"segments": segments}, ensure_ascii=False)
+        return json.dumps({"ranges": ranges}, ensure_ascii=False)
+    if isinstance(payload, dict) and isinstance(payload.get("items"), list):
+        translations = [
+            {"i": item.get("i"), "text": f"译：{item.get('text') or ''}"}
+            for item in payload["items"]
+            if isinstance(item, dict)
+        ]
+        return json.dumps({"translations": translations}, ensure_ascii=False)
+    if isinstance(payload, dict):
+        return json.dumps({"tid": 4, "tags": ["测试"]}, ensure_ascii=False)
+    return "模拟标题"
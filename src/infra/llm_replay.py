@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+
+class LLMReplayMissError(RuntimeError):
+    pass
+
+
+class ReplayStore:
+    """Append-only JSONL store of chat completions keyed by their request payload."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        if self.path.exists():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict) and entry.get("key"):
+                    self._entries[str(entry["key"])] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        return self._entries.get(key)
+
+    def put(self, key: str, entry: dict[str, Any]) -> None:
+        record = {"key": key, **entry}
+        with self._lock:
+            self._entries[key] = record
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@lru_cache(maxsize=8)
+def get_replay_store(path: str) -> ReplayStore:
+    # One store per file so the many short-lived LLM clients of a job share the same index.
+    return ReplayStore(path)
+
+
+def request_key(kwargs: dict[str, Any]) -> str:
+    keyed = {
+        name: kwargs.get(name)
+        for name in ("model", "messages", "temperature", "max_tokens", "response_format", "reasoning_effort")
+    }
+    payload = json.dumps(keyed, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _usage_dict(resp) -> dict[str, int]:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return {}
+    result: dict[str, int] = {}
+    for name in ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+        value = getattr(usage, name, None)
+        if value is not None:
+            result[name] = int(value)
+    return result
+
+
+def _response(content: str, *, model: str, usage: dict[str, int], finish_reason: str = "stop"):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=message, finish_reason=finish_reason)],
+        usage=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+class _Completions:
+    def __init__(self, create):
+        self.create = create
+
+
+class RecordingChatClient:
+    """Pass requests through to a real client and persist every successful response."""
+
+    def __init__(self, client, store: ReplayStore):
+        self._client = client
+        self._store = store
+        self.chat = SimpleNamespace(completions=_Completions(self._create))
+
+    def _create(self, **kwargs):
+        resp = self._client.chat.completions.create(**kwargs)
+        choice = resp.choices[0]
+        self._store.put(
+            request_key(kwargs),
+            {
+                "model": str(getattr(resp, "model", None) or kwargs.get("model") or ""),
+                "content": choice.message.content or "",
+                "finish_reason": getattr(choice, "finish_reason", None) or "stop",
+                "usage": _usage_dict(resp),
+            },
+        )
+        return resp
+
+
+class ReplayChatClient:
+    """Serve chat completions from a recorded store without touching the network."""
+
+    def __init__(self, store: ReplayStore):
+        self._store = store
+        self.chat = SimpleNamespace(completions=_Completions(self._create))
+
+    def _create(self, **kwargs):
+        entry = self._store.get(request_key(kwargs))
+        if entry is None:
+            raise LLMReplayMissError(f"LLM 回放记录中没有该请求: {self._store.path}")
+        return _response(
+            str(entry.get("content") or ""),
+            model=str(entry.get("model") or kwargs.get("model") or ""),
+            usage=dict(entry.get("usage") or {}),
+            finish_reason=str(entry.get("finish_reason") or "stop"),
+        )
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+
+
+class SubprocessStalledError(RuntimeError):
+    """A watched subprocess reported no progress within its stall timeout and was killed."""
+
+    def __init__(self, tool: str, stall_seconds: float, last_lines: list[str]):
+        self.tool = tool
+        self.stall_seconds = stall_seconds
+        self.last_lines = list(last_lines)
+        tail = "\n".join(self.last_lines)
+        super().__init__(
+            f"{tool} 超过 {stall_seconds:g} 秒没有进度，已终止" + (f"\n最近输出:\n{tail}" if tail else "")
+        )
+
+
+class StallWatchdog:
+    """Read a subprocess's output line by line and kill it once progress stops.
+
+    lines() yields raw output lines as they arrive; the caller decides what
+    counts as progress and calls progressed(). When stall_seconds pass without
+    progress the process is terminated (killed if it ignores SIGTERM, so yt-dlp
+    leaves its .part files for a later resume) and SubprocessStalledError is
+    raised with the last output lines. stall_seconds <= 0 disables the timer.
+    """
+
+    def __init__(
+        self,
+        process: subprocess.Popen,
+        *,
+        tool: str,
+        stall_seconds: float,
+        keep_lines: int = 20,
+        is_noise: Callable[[str], bool] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.process = process
+        self.tool = tool
+        self.stall_seconds = stall_seconds
+        self._is_noise = is_noise
+        self._clock = clock
+        self._recent: deque[str] = deque(maxlen=keep_lines)
+        self._last_progress = clock()
+
+    @property
+    def last_lines(self) -> list[str]:
+        return list(self._recent)
+
+    def progressed(self) -> None:
+        self._last_progress = self._clock()
+
+    def lines(self) -> Iterator[str]:
+        assert self.process.stdout is not None
+        if self.stall_seconds <= 0:
+            for raw_line in self.process.stdout:
+                self._remember(raw_line)
+                yield raw_line
+            return
+        # A blocked read on the pipe cannot time out, so a daemon thread does the reading.
+        pending: queue.Queue[str | None] = queue.Queue()
+        reader = threading.Thread(target=_pump_lines, args=(self.process.stdout, pending), daemon=True)
+        reader.start()
+        while True:
+            remaining = self.stall_seconds - (self._clock() - self._last_progress)
+            if remaining <= 0:
+                self._kill()
+                raise SubprocessStalledError(self.tool, self.stall_seconds, self.last_lines)
+            try:
+                raw_line = pending.get(timeout=min(remaining, 1.0))
+            except queue.Empty:
+                continue
+            if raw_line is None:
+                return
+            self._remember(raw_line)
+            yield raw_line
+
+    def _remember(self, raw_line: str) -> None:
+        line = raw_line.rstrip()
+        if line and not (self._is_noise and self._is_noise(line)):
+            self._recent.append(line)
+
+    def _kill(self) -> None:
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=5)
+        except Exception:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=5)
+            except Exception:
+                pass
+
+
+def _pump_lines(stream, pending: queue.Queue[str | None]) -> None:
+    try:
+        for raw_line in stream:
+            pending.put(raw_line)
+    except (OSError, ValueError):
+        pass
+    finally:
+        pending.put(None)
@@ -8,16 +8,23 @@ import time
 import urllib.parse
 import urllib.request
 from http.cookiejar import Cookie
+from dataclasses import dataclass
 from pathlib import Path
 
 from yt_dlp.cookies import SUPPORTED_BROWSERS, extract_cookies_from_browser
 
 from src.infra.cli_path import resolve_cli
-from src.infra.ffmpeg import _bin
+from src.infra.ffmpeg import StreamInput, _bin, probe_media
+from src.infra.process_watchdog import StallWatchdog, SubprocessStalledError
 
 YOUTUBE_COOKIES_PATH = str(Path(__file__).parent.parent.parent / "data" / "youtube_cookies.txt")
 HLS_FRAGMENT_403_PATTERN = re.compile(r"HTTP Error 403: Forbidden.*fragment", re.IGNORECASE)
+# Subtitle formats SubtitleService can parse, most preferred first.
+SUBTITLE_EXTENSIONS = ("json3", "srv3", "vtt", "srt")
 HLS_FRAGMENT_SKIP_PATTERN = re.compile(r"fragment not found; Skipping fragment", re.IGNORECASE)
+_DOWNLOAD_PERCENT_RE = re.compile(r"^\[download\]\s+(\d+(?:\.\d+)?)%")
+# Output that a stuck download keeps printing; it does not count as progress for the watchdog.
+_STALL_NOISE_RE = re.compile(r"retrying|error|timed out|unable to", re.IGNORECASE)
 YOUTUBE_AUTH_COOKIE_NAMES = {
     "LOGIN_INFO",
     "SID",
@@ -72,6 +79,7 @@ def _run_yt_dlp_stream(
     action: str,
     logger=None,
     hls_403_fast_fail_threshold: int | None = None,
+    stall_seconds: float = 0.0,
 ) -> None:
     process = subprocess.Popen(
         cmd,
@@ -85,9 +93,10 @@ def _run_yt_dlp_stream(
     hls_fragment_403_count = 0
     hls_fragment_skip_count = 0
     saw_hls_download = False
+    watchdog = StallWatchdog(process, tool=f"yt-dlp {action}", stall_seconds=stall_seconds)
+    last_percent: str | None = None
 
-    assert process.stdout is not None
-    for raw_line in process.stdout:
+    for raw_line in watchdog.lines():
         line = raw_line.rstrip()
         if not line:
             continue
@@ -95,6 +104,15 @@ def _run_yt_dlp_stream(
         if len(merged_lines) > 120:
             merged_lines.pop(0)
 
+        # Progress is a new percentage, or any other non-error line such as a new stage.
+        percent = _DOWNLOAD_PERCENT_RE.match(line)
+        if percent:
+            if percent.group(1) != last_percent:
+                last_percent = percent.group(1)
+                watchdog.progressed()
+        elif not _STALL_NOISE_RE.search(line):
+            watchdog.progressed()
+
         should_emit = True
         is_progress = line.startswith("[download]") and "%" in line
         if is_progress:
@@ -320,22 +338,10 @@ def _guess_media_kind_by_extension(path: Path) -> str:
 
 
 def _classify_media_file(path: Path) -> str:
-    cmd = [
-        _bin("ffprobe"),
-        "-v",
-        "error",
-        "-show_entries",
-        "stream=codec_type",
-        "-of",
-        "json",
-        str(path),
-    ]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        streams = json.loads(result.stdout or "{}").get("streams") or []
-    except (subprocess.CalledProcessError, json.JSONDecodeError):
+        types = probe_media(path).codec_types
+    except (subprocess.CalledProcessError, json.JSONDecodeError, OSError):
         return _guess_media_kind_by_extension(path)
-    types = {str(item.get("codec_type") or "") for item in streams}
     has_video = "video" in types
     has_audio = "audio" in types
     if has_video and has_audio:
@@ -472,6 +478,8 @@ def download_video(
     logger=None,
     extractor_args: list[str] | None = None,
     retries: int = 3,
+    stall_seconds: float = 0.0,
+    stall_retries: int = 0,
 ):
     auth_args = _build_auth_args(cookies_path=cookies_path, cookies_from_browser=cookies_from_browser)
     user_extractor_args = _build_extractor_args(extractor_args)
@@ -509,7 +517,13 @@ def download_video(
             logger.info(
                 "[yt-dlp] 下载策略: 优先非 HLS(m3u8)，英语原声，按分辨率/帧率/码率选择最高质量"
             )
-        _run_yt_dlp_stream(non_hls_cmd, action="下载视频", logger=logger, hls_403_fast_fail_threshold=6)
+        _run_download_stream(
+            non_hls_cmd,
+            logger=logger,
+            hls_403_fast_fail_threshold=6,
+            stall_seconds=stall_seconds,
+            stall_retries=stall_retries,
+        )
         _ensure_merged_mp4(output_path, logger=logger)
         return
     except RuntimeError as e:
@@ -533,10 +547,181 @@ def download_video(
         "1",
         common_args[-1],
     ]
-    _run_yt_dlp_stream(fallback_cmd, action="下载视频", logger=logger, hls_403_fast_fail_threshold=8)
+    _run_download_stream(
+        fallback_cmd,
+        logger=logger,
+        hls_403_fast_fail_threshold=8,
+        stall_seconds=stall_seconds,
+        stall_retries=stall_retries,
+    )
     _ensure_merged_mp4(output_path, logger=logger)
 
 
+def _run_download_stream(
+    cmd: list[str],
+    *,
+    logger=None,
+    hls_403_fast_fail_threshold: int,
+    stall_seconds: float,
+    stall_retries: int,
+) -> None:
+    """Run a video download, restarting it after a stall; yt-dlp continues from its .part files."""
+    for attempt in range(stall_retries + 1):
+        try:
+            _run_yt_dlp_stream(
+                cmd,
+                action="下载视频",
+                logger=logger,
+                hls_403_fast_fail_threshold=hls_403_fast_fail_threshold,
+                stall_seconds=stall_seconds,
+            )
+            return
+        except SubprocessStalledError as e:
+            if attempt >= stall_retries:
+                raise
+            if logger:
+                logger.warning(
+                    f"[yt-dlp] 下载超过 {e.stall_seconds:g} 秒没有进度，"
+                    f"第 {attempt + 1}/{stall_retries} 次重试（保留 .part 续传）"
+                )
+
+
+@dataclass
+class StreamSource:
+    """Direct format URLs picked by yt-dlp, for ffmpeg to read without a local download."""
+
+    video: StreamInput
+    audio: StreamInput | None
+    format_id: str
+    width: int
+    height: int
+    duration: float | None = None
+
+
+# Progressive HTTP(S) downloads only: fragmented protocols (HLS, DASH segments) need yt-dlp itself.
+_STREAMABLE_PROTOCOLS = {"http", "https"}
+
+
+def resolve_stream_source(
+    url: str,
+    *,
+    cookies_path: str | None = YOUTUBE_COOKIES_PATH,
+    cookies_from_browser: str | None = None,
+    extractor_args: list[str] | None = None,
+    retries: int = 3,
+) -> StreamSource:
+    """Select formats like download_video() does, but return their URLs instead of downloading."""
+    cmd = [
+        _yt_dlp_bin(),
+        "--dump-json",
+        "--no-warnings",
+        "--no-playlist",
+        "--retries",
+        str(max(1, int(retries))),
+        "-f",
+        build_video_format_selector(non_hls=True),
+        "-S",
+        "res,fps,br",
+        "--extractor-args",
+        "youtube:player_client=default,-ios",
+        *_build_js_runtime_args(),
+        *_build_extractor_args(extractor_args),
+        *_build_auth_args(cookies_path=cookies_path, cookies_from_browser=cookies_from_browser),
+        url,
+    ]
+    result = _run_yt_dlp(cmd, action="解析视频流地址")
+    content = (result.stdout or "").strip()
+    if not content:
+        raise RuntimeError("视频详情为空")
+    return _stream_source_from_info(json.loads(content.splitlines()[0].strip()))
+
+
+def _stream_source_from_info(info: dict) -> StreamSource:
+    video_format, audio_format = _split_stream_formats(info.get("requested_formats") or [info])
+    if video_format is None:
+        raise RuntimeError("未选到可直接读取的视频流")
+    for fmt in (video_format, audio_format):
+        if fmt is not None and (fmt.get("protocol") not in _STREAMABLE_PROTOCOLS or not fmt.get("url")):
+            raise RuntimeError(f"格式 {fmt.get('format_id')} 的协议 {fmt.get('protocol')} 不支持直接流式压制")
+    width = int(video_format.get("width") or 0)
+    height = int(video_format.get("height") or 0)
+    if width <= 0 or height <= 0:
+        raise RuntimeError(f"视频流分辨率未知: {video_format.get('format_id')}")
+    try:
+        duration = float(info.get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+
+    def stream_input(fmt: dict) -> StreamInput:
+        return StreamInput(str(fmt["url"]), headers={str(k): str(v) for k, v in (fmt.get("http_headers") or {}).items()})
+
+    return StreamSource(
+        video=stream_input(video_format),
+        audio=stream_input(audio_format) if audio_format is not None else None,
+        format_id=str(info.get("format_id") or video_format.get("format_id") or ""),
+        width=width,
+        height=height,
+        duration=duration,
+    )
+
+
+def _split_stream_formats(formats: list[dict]) -> tuple[dict | None, dict | None]:
+    video_format = next((fmt for fmt in formats if _has_codec(fmt, "vcodec")), None)
+    audio_format = next((fmt for fmt in formats if fmt is not video_format and _has_codec(fmt, "acodec")), None)
+    return video_format, audio_format
+
+
+def _has_codec(fmt: dict, key: str) -> bool:
+    return (fmt.get(key) or "none") != "none"
+
+
+def _stream_sort_key(fmt: dict) -> tuple[int, float, float]:
+    # Mirrors `-S res,fps,br`: the smaller frame side, then frame rate, then total bitrate.
+    width = int(fmt.get("width") or 0)
+    height = int(fmt.get("height") or 0)
+    res = min(width, height) if width and height else max(width, height)
+    return res, float(fmt.get("fps") or 0), float(fmt.get("tbr") or fmt.get("abr") or fmt.get("vbr") or 0)
+
+
+def _audio_preference(fmt: dict) -> int:
+    # The selector's audio fallbacks in order: original English, any English, anything.
+    if not str(fmt.get("language") or "").startswith("en"):
+        return 0
+    return 2 if "original" in str(fmt.get("format_note") or "") else 1
+
+
+def select_stream_formats(meta: dict) -> list[dict]:
+    """Apply resolve_stream_source()'s format selection to already fetched metadata, offline.
+
+    Follows build_video_format_selector(non_hls=True) with ``-S res,fps,br``:
+    the best non-HLS video plus the preferred audio-only track (original
+    English, any English, any), else the best muxed format. Returns the
+    formats in requested_formats order; empty when nothing matches.
+    """
+    formats = [
+        fmt
+        for fmt in meta.get("formats") or []
+        if isinstance(fmt, dict) and "m3u8" not in str(fmt.get("protocol") or "")
+    ]
+    videos = [fmt for fmt in formats if _has_codec(fmt, "vcodec")]
+    audios = [fmt for fmt in formats if _has_codec(fmt, "acodec") and not _has_codec(fmt, "vcodec")]
+    if videos and audios:
+        audio = max(audios, key=lambda fmt: (_audio_preference(fmt), _stream_sort_key(fmt)))
+        return [max(videos, key=_stream_sort_key), audio]
+    muxed = [fmt for fmt in videos if _has_codec(fmt, "acodec")]
+    return [max(muxed, key=_stream_sort_key)] if muxed else []
+
+
+def stream_resolution(meta: dict) -> tuple[int, int] | None:
+    """Frame size of the video format a streamed render will read, from metadata alone."""
+    video_format, _audio = _split_stream_formats(select_stream_formats(meta))
+    if video_format is None:
+        return None
+    width = int(video_format.get("width") or 0)
+    height = int(video_format.get("height") or 0)
+    return (width, height) if width > 0 and height > 0 else None
+
+
 def select_best_thumbnail_url(meta: dict) -> str | None:
     thumbnails = meta.get("thumbnails") or []
     if isinstance(thumbnails, list) and thumbnails:
@@ -614,7 +799,8 @@ def download_subtitle(
         "--sub-langs",
         lang_expr,
         "--sub-format",
-        "vtt/srt/best",
+        # json3 has no rolling duplicates and keeps per-word offsets of auto captions.
+        "json3/srv3/vtt/srt/best",
         "--no-playlist",
         "--no-warnings",
         "--retries",
@@ -630,15 +816,32 @@ def download_subtitle(
     _run_yt_dlp(cmd, action="下载字幕")
 
     candidates = sorted(
-        [
-            *out_dir.glob(f"{template_name}.{source_lang}*.vtt"),
-            *out_dir.glob(f"{template_name}.{source_lang}*.srt"),
-            *out_dir.glob(f"{template_name}*.vtt"),
-            *out_dir.glob(f"{template_name}*.srt"),
-        ],
-        key=lambda p: (0 if f".{source_lang}" in p.name else 1, len(p.name)),
+        {path for ext in SUBTITLE_EXTENSIONS for path in out_dir.glob(f"{template_name}*.{ext}")},
+        key=lambda p: (
+            0 if f".{source_lang}" in p.name else 1,
+            SUBTITLE_EXTENSIONS.index(p.suffix.lstrip(".").lower()),
+            len(p.name),
+        ),
     )
     for path in candidates:
         if path.exists() and path.stat().st_size > 0:
             return path
     raise RuntimeError(f"未找到 {source_lang} 字幕。该视频可能没有官方/自动英文字幕。")
+
+
+def subtitle_track_kind(meta: dict, subtitle_path: str | Path, *, video_id: str) -> str | None:
+    """'manual' for an uploader-provided track, 'asr' for automatic captions, None if unknown.
+
+    yt-dlp writes the uploader track when one exists for the language and the
+    automatic captions otherwise, both as <video_id>.<lang>.<ext>.
+    """
+    name = Path(subtitle_path).name
+    prefix = f"{video_id}."
+    if not name.startswith(prefix):
+        return None
+    lang = name[len(prefix) :].rsplit(".", 1)[0]
+    if lang in (meta.get("subtitles") or {}):
+        return "manual"
+    if lang in (meta.get("automatic_captions") or {}):
+        return "asr"
+    return None
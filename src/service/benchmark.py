@@ -0,0 +1,491 @@
+from __future__ import annotations
+
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from src.config.config import RenderProfileConfig
+from src.infra.ffmpeg import burn_ass_subtitle, extract_clip, make_test_pattern, measure_quality
+from src.infra.llm_mock_server import MockLLMServerConfig, start_mock_llm_server
+from src.service.subtitle import SubtitleCue, SubtitleService
+from src.service.translator import TranslatorService
+
+
+# Must not use the Y2B_ prefix, which load_config() treats as a config override.
+_BENCH_API_KEY_ENV = "MOCK_LLM_API_KEY"
+_SYNTHETIC_WORDS = (
+    "we", "load", "the", "data", "frame", "and", "then", "call", "plot", "on", "returns", "so",
+    "this", "brawler", "has", "a", "super", "that", "charges", "faster", "when", "you", "hit",
+    "enemies", "with", "main", "attack", "now", "let's", "compute", "monthly", "volatility",
+)
+_SYNTHETIC_CN_PHRASES = (
+    "我们先加载数据", "然后调用", "这个英雄的大招", "命中敌人后充能更快", "计算月度波动率",
+    "用来存储数据", "以及", "用于数据可视化", "接下来", "你会发现", "，", "。", "DataFrame",
+    "read_csv", "Matplotlib", "（也就是", "）", "《荒野乱斗》", "！",
+)
+
+
+def _vtt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def _synthetic_caption_lines(hours: float, *, seed: int, cue_seconds: float):
+    rng = random.Random(seed)
+    for index in range(int(hours * 3600 / cue_seconds)):
+        yield index * cue_seconds, [rng.choice(_SYNTHETIC_WORDS) for _ in range(rng.randint(3, 7))]
+
+
+def write_synthetic_vtt(path: str | Path, *, hours: float, seed: int = 0, cue_seconds: float = 2.0) -> Path:
+    """Write a YouTube auto-caption style VTT: rolling lines with per-word karaoke timings."""
+    output = Path(path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    previous = ""
+    with output.open("w", encoding="utf-8") as f:
+        f.write("WEBVTT\nKind: captions\nLanguage: en\n\n")
+        for start, words in _synthetic_caption_lines(hours, seed=seed, cue_seconds=cue_seconds):
+            step = cue_seconds / len(words)
+            timed = words[0] + "".join(
+                f"<{_vtt_time(start + step * i)}><c> {word}</c>" for i, word in enumerate(words[1:], start=1)
+            )
+            f.write(f"{_vtt_time(start)} --> {_vtt_time(start + cue_seconds)} align:start position:0%\n")
+            f.write(f"{previous}\n{timed}\n\n" if previous else f"{timed}\n\n")
+            # The short "hold" cue YouTube emits between rolling lines.
+            f.write(f"{_vtt_time(start + cue_seconds)} --> {_vtt_time(start + cue_seconds + 0.01)} align:start position:0%\n")
+            f.write(" ".join(words) + "\n\n")
+            previous = " ".join(words)
+    return output
+
+
+def write_synthetic_json3(path: str | Path, *, hours: float, seed: int = 0, cue_seconds: float = 2.0) -> Path:
+    """Write the same captions as write_synthetic_vtt() in YouTube's json3 layout."""
+    events: list[dict] = []
+    for start, words in _synthetic_caption_lines(hours, seed=seed, cue_seconds=cue_seconds):
+        start_ms = int(round(start * 1000))
+        step_ms = int(cue_seconds * 1000 / len(words))
+        segs = [{"utf8": words[0], "acAsrConf": 0}]
+        segs.extend({"utf8": f" {word}", "tOffsetMs": step_ms * i, "acAsrConf": 0} for i, word in enumerate(words[1:], start=1))
+        # Auto-caption events stay up while the next line is spoken.
+        events.append({"tStartMs": start_ms, "dDurationMs": int(cue_seconds * 2000), "wWinId": 1, "segs": segs})
+        events.append({"tStartMs": start_ms + int(cue_seconds * 1000), "dDurationMs": 10, "wWinId": 1, "aAppend": 1, "segs": [{"utf8": "\n"}]})
+    output = Path(path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"wireMagic": "pb3", "events": events}, separators=(",", ":")), encoding="utf-8")
+    return output
+
+
+def run_subtitle_benchmark(
+    config,
+    *,
+    hours: float = 10.0,
+    seed: int = 0,
+    path: str | Path | None = None,
+    fmt: str = "vtt",
+) -> dict:
+    """Measure parse and local post-processing time and memory for a long caption track.
+
+    No LLM is involved: segmentation uses the local sentence merger, which is
+    what the rule fast path and the LLM-failure fallback run. Timings are taken
+    without tracemalloc, which would otherwise dominate them.
+    """
+    subtitle = SubtitleService(config, translator=None)
+    with tempfile.TemporaryDirectory(prefix="y2b-bench-") as tmp:
+        if path:
+            source = Path(path)
+        else:
+            writer = write_synthetic_json3 if fmt == "json3" else write_synthetic_vtt
+            source = writer(Path(tmp) / f"synthetic.en.{fmt}", hours=hours, seed=seed)
+        result: dict = {"source": str(source) if path else f"synthetic {hours:g}h {fmt}", "file_bytes": source.stat().st_size}
+
+        started = time.perf_counter()
+        cues = subtitle.parse(source)
+        result["parse_seconds"] = round(time.perf_counter() - started, 3)
+        result["raw_cues"] = len(cues)
+
+        started = time.perf_counter()
+        segmented = subtitle._trim_unusually_long_cues(cues)
+        segmented = subtitle._merge_sentence_fragments(segmented)
+        segmented = subtitle._post_process_segmented(segmented)
+        result["post_process_seconds"] = round(time.perf_counter() - started, 3)
+        result["segmented_cues"] = len(segmented)
+        del cues, segmented
+
+        tracemalloc.start()
+        try:
+            cues = subtitle.parse(source)
+            retained, peak = tracemalloc.get_traced_memory()
+            del cues
+            tracemalloc.reset_peak()
+            # Consumers that process cues as they stream in never hold the whole track.
+            streamed = sum(1 for _ in subtitle.iter_cues(source))
+            _, stream_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    result["parsed_cues_mb"] = round(retained / 1024 / 1024, 2)
+    result["stream_parse_peak_mb"] = round(stream_peak / 1024 / 1024, 2)
+    result["bytes_per_raw_cue"] = retained // streamed if streamed else 0
+    result["parse_peak_mb"] = round(peak / 1024 / 1024, 2)
+    result["process_peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def synthetic_layout_cues(count: int, *, script: str, seed: int = 0) -> list[SubtitleCue]:
+    """Bilingual cues whose layout cost is dominated by CJK (``cjk``) or Latin (``latin``) text."""
+    rng = random.Random(seed)
+    cues: list[SubtitleCue] = []
+    for index in range(max(0, count)):
+        start = index * 4.0
+        if script == "cjk":
+            text = " ".join(rng.choice(_SYNTHETIC_WORDS) for _ in range(rng.randint(4, 10)))
+            translation = "".join(rng.choice(_SYNTHETIC_CN_PHRASES) for _ in range(rng.randint(6, 16)))
+        else:
+            text = " ".join(rng.choice(_SYNTHETIC_WORDS) for _ in range(rng.randint(20, 45)))
+            translation = "".join(rng.choice(_SYNTHETIC_CN_PHRASES) for _ in range(rng.randint(1, 3)))
+        cues.append(SubtitleCue(start=start, end=start + 3.8, text=text, translation=translation))
+    return cues
+
+
+def run_layout_benchmark(config, *, cue_count: int = 5000, seed: int = 0, width: int = 1920, height: int = 1080) -> dict:
+    """Time bilingual ASS layout (CN single-line splitting and EN wrapping) on CJK- and Latin-heavy sets."""
+    subtitle = SubtitleService(config, translator=None)
+    result: dict = {"cues_per_set": cue_count, "resolution": f"{width}x{height}"}
+    with tempfile.TemporaryDirectory(prefix="y2b-bench-") as tmp:
+        for script in ("cjk", "latin"):
+            cues = synthetic_layout_cues(cue_count, script=script, seed=seed)
+            output = Path(tmp) / f"{script}.ass"
+            started = time.perf_counter()
+            subtitle.write_bilingual_ass(cues, output, width=width, height=height)
+            elapsed = time.perf_counter() - started
+            dialogues = sum(1 for line in output.read_text(encoding="utf-8").splitlines() if line.startswith("Dialogue:"))
+            result[f"{script}_seconds"] = round(elapsed, 3)
+            result[f"{script}_cues_per_second"] = round(cue_count / elapsed) if elapsed > 0 else None
+            result[f"{script}_dialogue_lines"] = dialogues
+    return result
+
+
+class _EchoTranslator:
+    """In-process stand-in for the LLM: fixed-size segmentation ranges and prefixed translations."""
+
+    def __init__(self, segment_size: int = 8):
+        self.segment_size = segment_size
+
+    def segment_subtitle_batch(self, lines: list[str], *, source_lang: str | None = None) -> list[dict[str, int]]:
+        size = max(1, self.segment_size)
+        return [{"start": start, "end": min(len(lines), start + size) - 1} for start in range(0, len(lines), size)]
+
+    def translate_subtitle_batch(
+        self,
+        lines: list[str],
+        *,
+        source_lang: str | None = None,
+        target_lang: str | None = None,
+    ) -> list[str]:
+        return [f"译：{line}" for line in lines]
+
+
+def run_window_benchmark(config, *, hours: float = 12.0, window_minutes: float = 30.0, seed: int = 0) -> dict:
+    """Compare whole-track and windowed parse -> segment -> translate -> ASS on a long synthetic VOD.
+
+    The LLM is replaced by an in-process echo translator so the numbers show
+    only local time and Python heap use. Peaks are measured in a second,
+    tracemalloc-instrumented run so they do not distort the timings.
+    """
+    bench_cfg = config.model_copy(deep=True)
+    bench_cfg.translation.rule_segmentation = False
+    bench_cfg.translation.fused_segment_translation = False
+    bench_cfg.translation.subtitle_concurrency = 1
+    bench_cfg.translation.segmentation_concurrency = 1
+    subtitle = SubtitleService(bench_cfg, _EchoTranslator())
+    source_lang = bench_cfg.translation.source_lang
+    target_lang = bench_cfg.translation.target_lang
+    result: dict = {"source": f"synthetic {hours:g}h vtt", "window_minutes": window_minutes}
+
+    with tempfile.TemporaryDirectory(prefix="y2b-bench-") as tmp:
+        source = write_synthetic_vtt(Path(tmp) / "synthetic.en.vtt", hours=hours, seed=seed)
+        result["file_bytes"] = source.stat().st_size
+
+        def whole_track() -> int:
+            cues = subtitle.parse(source)
+            cues = subtitle.segment_cues(cues, source_lang=source_lang, target_lang=target_lang)
+            cues = subtitle.translate_segmented_cues(cues, source_lang=source_lang, target_lang=target_lang)
+            subtitle.write_bilingual_ass(cues, Path(tmp) / "whole.ass", width=1920, height=1080)
+            return len(cues)
+
+        def windowed() -> int:
+            cache = Path(tmp) / "windowed.translated.json"
+            subtitle.save_cues([], cache)
+            for window in subtitle.iter_translated_windows(
+                subtitle.iter_cues(source),
+                source_lang=source_lang,
+                target_lang=target_lang,
+                window_seconds=window_minutes * 60,
+                overlap_seconds=bench_cfg.translation.window_overlap_seconds,
+            ):
+                subtitle.append_cues(window, cache)
+            subtitle.write_bilingual_ass(subtitle.iter_cached_cues(cache), Path(tmp) / "windowed.ass", width=1920, height=1080)
+            return sum(1 for _ in subtitle.iter_cached_cues(cache))
+
+        for name, flow in (("whole", whole_track), ("windowed", windowed)):
+            started = time.perf_counter()
+            result[f"{name}_cues"] = flow()
+            result[f"{name}_seconds"] = round(time.perf_counter() - started, 3)
+            tracemalloc.start()
+            try:
+                flow()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            result[f"{name}_peak_mb"] = round(peak / 1024 / 1024, 2)
+    return result
+
+
+def run_render_benchmark(
+    config,
+    *,
+    input_video: str | Path | None = None,
+    seconds: float = 10.0,
+    width: int = 1280,
+    height: int = 720,
+    profiles: list[str] | None = None,
+) -> dict:
+    """Render one clip with every configured render profile and compare speed, size and quality.
+
+    The clip (the first seconds of input_video, or a lavfi test pattern) is
+    re-encoded losslessly first; the quality reference is that clip with the
+    same sample ASS burned in losslessly, so the scores measure only encoder
+    loss. A profile that fails, e.g. a hardware encoder missing on this host,
+    is reported with its error instead of aborting the run.
+    """
+    subtitle = SubtitleService(config, translator=None)
+    available = [name for name, value in config.render if isinstance(value, RenderProfileConfig)]
+    selected = profiles or available
+    unknown = sorted(set(selected) - set(available))
+    if unknown:
+        raise RuntimeError(f"未知编码 profile: {', '.join(unknown)}")
+    result: dict = {"source": str(input_video) if input_video else f"lavfi testsrc2 {width}x{height}", "seconds": seconds}
+
+    with tempfile.TemporaryDirectory(prefix="y2b-bench-") as tmp:
+        work = Path(tmp)
+        clip = work / "clip.mp4"
+        if input_video:
+            extract_clip(input_video, clip, seconds=seconds)
+        else:
+            make_test_pattern(clip, seconds=seconds, width=width, height=height)
+        ass_path = work / "sample.ass"
+        cues = synthetic_layout_cues(int(seconds // 4) + 1, script="cjk", seed=0)
+        subtitle.write_bilingual_ass(cues, ass_path, width=width, height=height)
+
+        reference = work / "reference.mp4"
+        reference_progress = _render_clip(
+            clip, ass_path, reference, config, RenderProfileConfig(codec="libx264", preset="ultrafast", crf=0)
+        )
+        duration = reference_progress["seconds"] or seconds
+        result["frames"] = reference_progress["frames"]
+
+        rows: dict[str, dict] = {}
+        for name in selected:
+            profile = getattr(config.render, name)
+            output = work / f"{name}.mp4"
+            row: dict = {"codec": profile.codec, "preset": profile.preset, "crf": profile.crf, "bitrate": profile.bitrate}
+            try:
+                stats = _render_clip(clip, ass_path, output, config, profile)
+            except Exception as e:
+                # ffmpeg failures end with the most specific stderr line.
+                row["error"] = str(e).strip().splitlines()[-1]
+                rows[name] = row
+                continue
+            size = output.stat().st_size
+            row.update(
+                {
+                    "encode_seconds": round(stats["wall_seconds"], 3),
+                    "encode_fps": round(stats["frames"] / stats["wall_seconds"], 1) if stats["wall_seconds"] > 0 else None,
+                    "cpu_seconds": round(stats["cpu_seconds"], 3) if stats["cpu_seconds"] is not None else None,
+                    "size_bytes": size,
+                    "bitrate_kbps": round(size * 8 / duration / 1000, 1),
+                    **{key: round(value, 4) for key, value in measure_quality(output, reference).items()},
+                }
+            )
+            rows[name] = row
+    result["profiles"] = rows
+    return result
+
+
+def _render_clip(clip: Path, ass_path: Path, output: Path, config, profile: RenderProfileConfig) -> dict:
+    snapshots = []
+    cpu_before = _child_cpu_seconds()
+    started = time.perf_counter()
+    burn_ass_subtitle(
+        input_video=clip,
+        ass_path=ass_path,
+        output_video=output,
+        fonts_dir=config.subtitle_style.fonts_dir,
+        codec=profile.codec,
+        preset=profile.preset,
+        crf=profile.crf,
+        bitrate=profile.bitrate,
+        progress_callback=snapshots.append,
+    )
+    wall = time.perf_counter() - started
+    cpu_after = _child_cpu_seconds()
+    last = snapshots[-1] if snapshots else None
+    return {
+        "wall_seconds": wall,
+        "cpu_seconds": cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None,
+        "frames": last.frame if last else 0,
+        "seconds": last.out_seconds if last else None,
+    }
+
+
+def _child_cpu_seconds() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def synthetic_cues(count: int, *, seed: int = 0, cue_seconds: float = 2.0) -> list[SubtitleCue]:
+    """Build deterministic sentence-sized cues resembling segmented auto captions."""
+    rng = random.Random(seed)
+    cues: list[SubtitleCue] = []
+    for index in range(max(0, count)):
+        words = [rng.choice(_SYNTHETIC_WORDS) for _ in range(rng.randint(5, 14))]
+        start = index * cue_seconds
+        cues.append(SubtitleCue(start=start, end=start + cue_seconds * 0.95, text=" ".join(words)))
+    return cues
+
+
+class _UsageCollector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latencies_ms: list[int] = []
+
+    def __call__(self, usage) -> None:
+        with self._lock:
+            self.calls += 1
+            self.retries += usage.retries
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.cached_tokens += usage.prompt_cache_hit_tokens
+            self.latencies_ms.append(usage.latency_ms)
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+
+        def percentile(ratio: float) -> int:
+            if not latencies:
+                return 0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * ratio))]
+
+        return {
+            "llm_calls": self.calls,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "latency_p50_ms": percentile(0.50),
+            "latency_p95_ms": percentile(0.95),
+        }
+
+
+def run_llm_benchmark(
+    config,
+    *,
+    cues: list[SubtitleCue] | None = None,
+    cue_count: int = 500,
+    server_config: MockLLMServerConfig | None = None,
+    base_url: str | None = None,
+    client_timeout: float = 10.0,
+    include_segmentation: bool = False,
+    seed: int = 0,
+    logger=None,
+) -> dict:
+    """Measure end-to-end subtitle translation throughput against a mock LLM endpoint.
+
+    Starts an in-process mock server unless base_url points at an existing
+    OpenAI-compatible endpoint, so no real API money is spent.
+    """
+    bench_cfg = config.model_copy(deep=True)
+    bench_cfg.ai.replay_mode = "off"
+    bench_cfg.ai.timeout = client_timeout
+    bench_cfg.ai.api_key_env = _BENCH_API_KEY_ENV
+    os.environ.setdefault(_BENCH_API_KEY_ENV, "bench")
+    cues = [SubtitleCue(cue.start, cue.end, cue.text) for cue in cues] if cues else synthetic_cues(cue_count, seed=seed)
+
+    server = None
+    if base_url is None:
+        server = start_mock_llm_server(server_config or MockLLMServerConfig(seed=seed))
+        base_url = server.base_url
+    bench_cfg.ai.base_url = base_url
+
+    collector = _UsageCollector()
+    translator = TranslatorService(bench_cfg, logger, usage_listener=collector)
+    subtitle = SubtitleService(bench_cfg, translator, logger)
+    result: dict = {
+        "base_url": base_url,
+        "input_cues": len(cues),
+        "batch_size": bench_cfg.translation.subtitle_batch_size,
+        "concurrency": bench_cfg.translation.subtitle_concurrency,
+        "fused_segment_translation": bool(include_segmentation and bench_cfg.translation.fused_segment_translation),
+    }
+    try:
+        if include_segmentation:
+            started = time.perf_counter()
+            cues = subtitle.segment_cues(
+                cues,
+                source_lang=bench_cfg.translation.source_lang,
+                target_lang=bench_cfg.translation.target_lang,
+            )
+            result["segmentation_seconds"] = round(time.perf_counter() - started, 3)
+            result["segmented_cues"] = len(cues)
+        started = time.perf_counter()
+        translated = subtitle.translate_segmented_cues(
+            cues,
+            source_lang=bench_cfg.translation.source_lang,
+            target_lang=bench_cfg.translation.target_lang,
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            result["mock_server"] = server.stats.as_dict()
+            server.close()
+
+    untranslated = sum(1 for cue in translated if not cue.translation or cue.translation == cue.text)
+    result.update(
+        {
+            "translation_seconds": round(elapsed, 3),
+            "cues_per_second": round(len(translated) / elapsed, 2) if elapsed > 0 else None,
+            "untranslated_cues": untranslated,
+            **collector.as_dict(),
+        }
+    )
+    return result
+
+
+def load_bench_cues(config, path: str | Path) -> list[SubtitleCue]:
+    return SubtitleService(config, translator=None).parse(path)
@@ -3,11 +3,13 @@ from __future__ import annotations
 from pathlib import Path
 
 from src.infra.yt_dlp import (
+    StreamSource,
     download_subtitle,
     download_thumbnail_from_metadata,
     download_video,
     fetch_video_metadata,
     normalize_video_url,
+    resolve_stream_source,
 )
 
 
@@ -19,11 +21,15 @@ class DownloaderService:
         youtube_cookies_from_browser: str | None,
         youtube_extractor_args: list[str] | None = None,
         max_retry: int = 3,
+        stall_timeout_seconds: float = 0.0,
+        stall_retries: int = 0,
     ):
         self.youtube_cookies_path = youtube_cookies_path
         self.youtube_cookies_from_browser = youtube_cookies_from_browser
         self.youtube_extractor_args = youtube_extractor_args or []
         self.max_retry = max(1, int(max_retry))
+        self.stall_timeout_seconds = stall_timeout_seconds
+        self.stall_retries = stall_retries
 
     def fetch_metadata(self, url: str) -> dict:
         return fetch_video_metadata(
@@ -46,9 +52,20 @@ class DownloaderService:
             logger=logger,
             extractor_args=self.youtube_extractor_args,
             retries=self.max_retry,
+            stall_seconds=self.stall_timeout_seconds,
+            stall_retries=self.stall_retries,
         )
         return out
 
+    def resolve_stream(self, url: str) -> StreamSource:
+        return resolve_stream_source(
+            normalize_video_url(url),
+            cookies_path=self.youtube_cookies_path,
+            cookies_from_browser=self.youtube_cookies_from_browser,
+            extractor_args=self.youtube_extractor_args,
+            retries=self.max_retry,
+        )
+
     def download_subtitle(self, url: str, base_dir: str | Path, *, video_id: str, source_lang: str, logger=None) -> Path:
         return download_subtitle(
             normalize_video_url(url),
@@ -2,19 +2,43 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
 import re
 import time
+from collections.abc import Iterable
 from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
 
 from src.bootstrap import ensure_bilibili_ready, ensure_pipeline_tools, ensure_youtube_ready
+from src.config.config import RenderOutputConfig
+from src.infra.ai_client import (
+    build_fused_segment_translation_prompt,
+    build_segment_prompt,
+    build_subtitle_translation_prompt,
+    estimate_llm_cost,
+    llm_usage_listener,
+)
+from src.infra.ffmpeg import RenderProgress, StreamHTTPError
+from src.infra.process_watchdog import SubprocessStalledError
+from src.infra.yt_dlp import SUBTITLE_EXTENSIONS, StreamSource, stream_resolution, subtitle_track_kind
 from src.service.downloader import DownloaderService
-from src.service.renderer import RenderService
-from src.service.subtitle import SubtitleService
+from src.service.render_scheduler import RenderScheduler
+from src.service.renderer import EncodingChoice, RenderService
+from src.service.subtitle import PARSER_VERSION, SubtitleService
 from src.service.translator import TranslatorService
 from src.service.uploader import UploaderService
 
 
+# Inputs a segmented cache depends on; the translated cache additionally depends on "translation".
+_SEGMENTED_CACHE_INPUTS = ("source", "parser", "segmentation")
+
+
+def _fingerprint(payload: dict) -> str:
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
 @dataclass
 class RunContext:
     """Shared, read-only state threaded through every pipeline stage for one job run."""
@@ -28,6 +52,54 @@ class RunContext:
     output_dir: Path
 
 
+class RenderProgressReporter:
+    """Turn ffmpeg progress snapshots into rate-limited job progress updates.
+
+    The render stage owns job progress 70-81; current_step carries percent, fps,
+    speed and ETA so slow encodes are visible in ``y2b status``.
+    """
+
+    START = 70
+    END = 81
+
+    def __init__(self, state, logger, job_id: str, *, interval_seconds: float = 5.0):
+        self.state = state
+        self.logger = logger
+        self.job_id = job_id
+        self.interval_seconds = interval_seconds
+        self._last_update: float | None = None
+
+    def __call__(self, snapshot: RenderProgress) -> None:
+        now = time.monotonic()
+        if not snapshot.done and self._last_update is not None and now - self._last_update < self.interval_seconds:
+            return
+        self._last_update = now
+        fraction = snapshot.fraction
+        progress = self.START + int((self.END - self.START) * fraction) if fraction is not None else self.START
+        step = self.describe(snapshot)
+        self.logger.info(f"[{self.job_id}] {step}")
+        self.state.update_job(self.job_id, progress=progress, current_step=step)
+
+    @staticmethod
+    def describe(snapshot: RenderProgress) -> str:
+        fraction = snapshot.fraction
+        parts = [f"压制 {fraction:.1%}" if fraction is not None else f"压制 {_clock(snapshot.out_seconds)}"]
+        if snapshot.fps is not None:
+            parts.append(f"{snapshot.fps:g} fps")
+        if snapshot.speed is not None:
+            parts.append(f"速度 {snapshot.speed:g}x")
+        eta = snapshot.eta_seconds
+        if eta is not None and not snapshot.done:
+            parts.append(f"剩余约 {_clock(eta)}")
+        return "，".join(parts)
+
+
+def _clock(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
 class SingleVideoPipeline:
     def __init__(self, config, logger, state):
         self.config = config
@@ -39,10 +111,13 @@ class SingleVideoPipeline:
             youtube_cookies_from_browser=yt_cfg.cookies_from_browser,
             youtube_extractor_args=yt_cfg.extractor_args,
             max_retry=config.max_retry,
+            stall_timeout_seconds=yt_cfg.stall_timeout_seconds,
+            stall_retries=yt_cfg.stall_retries,
         )
         self.translator = TranslatorService(config, logger)
         self.subtitle = SubtitleService(config, self.translator, logger)
         self.renderer = RenderService(config, logger)
+        self.render_scheduler = RenderScheduler(state, config.render.scheduler, logger=logger)
         self.uploader = UploaderService(config)
 
     _STAGE_ORDER = {
@@ -68,6 +143,7 @@ class SingleVideoPipeline:
         resume: bool = False,
         render_profile: str | None = None,
         stop_after: str | None = None,
+        render_priority: int = 0,
     ) -> dict:
         job_id = job_id or self.state.create_job(url=url)
         source_lang = source_lang or self.config.translation.source_lang
@@ -78,137 +154,164 @@ class SingleVideoPipeline:
         succeeded = False
         cleanup_preserve_suffixes: set[str] = {".ass"}
 
-        try:
-            self._step(job_id, "checking", 5, "检查运行环境")
-            ensure_pipeline_tools(
-                self.config,
-                self.logger,
-                needs_render=self._reaches_stage(target_stage, "render"),
-                needs_upload=target_stage == "upload",
-            )
-            ensure_youtube_ready(self.config)
-            if target_stage == "upload":
-                ensure_bilibili_ready(self.config)
-
-            meta = self._fetch_metadata_stage(job_id, url)
-            work_dir = Path(self.config.download_dir) / str(meta["video_id"])
-            work_dir.mkdir(parents=True, exist_ok=True)
-            output_dir = Path(self.config.output_dir)
-            output_dir.mkdir(parents=True, exist_ok=True)
-            ctx = RunContext(
-                job_id=job_id,
-                video_id=str(meta["video_id"]),
-                webpage_url=str(meta["webpage_url"]),
-                original_title=str(meta["title"]),
-                meta=meta,
-                work_dir=work_dir,
-                output_dir=output_dir,
-            )
-
-            raw_subtitle = self._download_subtitle_stage(ctx, source_lang=source_lang, resume=resume)
-            if target_stage == "subtitle":
-                cleanup_preserve_suffixes = {raw_subtitle.suffix}
-                record = self._complete_job(
-                    job_id,
-                    current_step="已完成（仅下载字幕）",
-                    subtitle_path=str(raw_subtitle),
-                    rendered_path=None,
+        # Scoped per run: the translator is shared, so concurrent runs must not swap listeners.
+        with llm_usage_listener(lambda usage: self._record_llm_usage(job_id, usage)):
+            try:
+                self._step(job_id, "checking", 5, "检查运行环境")
+                ensure_pipeline_tools(
+                    self.config,
+                    self.logger,
+                    needs_render=self._reaches_stage(target_stage, "render"),
+                    needs_upload=target_stage == "upload",
                 )
-                succeeded = True
-                self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
-                return record
-
-            cues = self.subtitle.parse(raw_subtitle)
-            if not cues:
-                raise RuntimeError("字幕解析结果为空")
-
-            downloaded_video: Path | None = None
-            if self._reaches_stage(target_stage, "render"):
-                downloaded_video = self._download_video_stage(ctx, resume=resume)
-
-            cues, translated_cache_path = self._translate_subtitle_stage(
-                ctx,
-                cues,
-                source_lang=source_lang,
-                target_lang=target_lang,
-                resume=resume,
-            )
-            if target_stage == "translation":
-                cleanup_preserve_suffixes = {".json"}
-                record = self._complete_job(
-                    job_id,
-                    current_step="已完成（仅翻译字幕）",
-                    subtitle_path=str(translated_cache_path),
-                    rendered_path=None,
+                ensure_youtube_ready(self.config)
+                if target_stage == "upload":
+                    ensure_bilibili_ready(self.config)
+
+                meta = self._fetch_metadata_stage(job_id, url)
+                work_dir = Path(self.config.download_dir) / str(meta["video_id"])
+                work_dir.mkdir(parents=True, exist_ok=True)
+                output_dir = Path(self.config.output_dir)
+                output_dir.mkdir(parents=True, exist_ok=True)
+                ctx = RunContext(
+                    job_id=job_id,
+                    video_id=str(meta["video_id"]),
+                    webpage_url=str(meta["webpage_url"]),
+                    original_title=str(meta["title"]),
+                    meta=meta,
+                    work_dir=work_dir,
+                    output_dir=output_dir,
                 )
-                succeeded = True
-                self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
-                return record
 
-            ass_path = self._write_ass_stage(
-                ctx,
-                cues,
-                downloaded_video=downloaded_video,
-                reaches_render=self._reaches_stage(target_stage, "render"),
-            )
-            if target_stage == "ass":
-                cleanup_preserve_suffixes = {".ass"}
-                record = self._complete_job(
-                    job_id,
-                    current_step="已完成（仅生成双语 ASS，未压制/未上传）",
-                    subtitle_path=str(ass_path),
-                    rendered_path=None,
+                raw_subtitle = self._download_subtitle_stage(ctx, source_lang=source_lang, resume=resume)
+                if target_stage == "subtitle":
+                    cleanup_preserve_suffixes = {raw_subtitle.suffix}
+                    record = self._complete_job(
+                        job_id,
+                        current_step="已完成（仅下载字幕）",
+                        subtitle_path=str(raw_subtitle),
+                        rendered_path=None,
+                    )
+                    succeeded = True
+                    self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
+                    return record
+
+                track_kind = subtitle_track_kind(meta, raw_subtitle, video_id=ctx.video_id)
+                windowed = self.config.translation.window_minutes > 0
+                cues: list | None = None
+                if not windowed:
+                    cues = self.subtitle.parse(raw_subtitle)
+                    if not cues:
+                        raise RuntimeError("字幕解析结果为空")
+
+                downloaded_video: Path | None = None
+                streamed = False
+                # Signed stream URLs expire, so a streamed source is only resolved by the render stage.
+                if self._reaches_stage(target_stage, "render"):
+                    streamed = self._should_stream_source(ctx, resume=resume, keep_files=keep_files)
+                    if not streamed:
+                        downloaded_video = self._download_video_stage(ctx, resume=resume)
+
+                if windowed:
+                    translated_cache_path = self._translate_windowed_stage(
+                        ctx,
+                        raw_subtitle,
+                        source_lang=source_lang,
+                        target_lang=target_lang,
+                        track_kind=track_kind,
+                        resume=resume,
+                    )
+                else:
+                    cues, translated_cache_path = self._translate_subtitle_stage(
+                        ctx,
+                        cues,
+                        raw_subtitle=raw_subtitle,
+                        source_lang=source_lang,
+                        target_lang=target_lang,
+                        track_kind=track_kind,
+                        resume=resume,
+                    )
+                if target_stage == "translation":
+                    cleanup_preserve_suffixes = {".json"}
+                    record = self._complete_job(
+                        job_id,
+                        current_step="已完成（仅翻译字幕）",
+                        subtitle_path=str(translated_cache_path),
+                        rendered_path=None,
+                    )
+                    succeeded = True
+                    self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
+                    return record
+
+                ass_path = self._write_ass_stage(
+                    ctx,
+                    cues if cues is not None else self.subtitle.iter_cached_cues(translated_cache_path),
+                    downloaded_video=downloaded_video,
+                    streamed=streamed,
+                    reaches_render=self._reaches_stage(target_stage, "render"),
+                )
+                if target_stage == "ass":
+                    cleanup_preserve_suffixes = {".ass"}
+                    record = self._complete_job(
+                        job_id,
+                        current_step="已完成（仅生成双语 ASS，未压制/未上传）",
+                        subtitle_path=str(ass_path),
+                        rendered_path=None,
+                    )
+                    succeeded = True
+                    self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
+                    return record
+
+                rendered_path = self._render_stage(
+                    ctx,
+                    ass_path,
+                    downloaded_video,
+                    render_profile=render_profile,
+                    resume=resume,
+                    render_priority=render_priority,
                 )
-                succeeded = True
-                self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
-                return record
-
-            if downloaded_video is None:
-                raise RuntimeError("内部错误：压制阶段缺少输入视频")
-            rendered_path = self._render_stage(
-                ctx,
-                ass_path,
-                downloaded_video,
-                render_profile=render_profile,
-                resume=resume,
-            )
 
-            if target_stage == "render":
-                message = "已完成（未上传）" if no_upload else "已完成（压制完成，未上传）"
-                record = self._complete_job(
-                    job_id,
-                    current_step=message,
-                    subtitle_path=str(ass_path),
-                    rendered_path=str(rendered_path),
+                if target_stage == "render":
+                    message = "已完成（未上传）" if no_upload else "已完成（压制完成，未上传）"
+                    record = self._complete_job(
+                        job_id,
+                        current_step=message,
+                        subtitle_path=str(ass_path),
+                        rendered_path=str(rendered_path),
+                    )
+                    succeeded = True
+                    self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
+                    return record
+
+                self._upload_stage(
+                    ctx,
+                    rendered_path,
+                    cues=cues if cues is not None else self.subtitle.iter_cached_cues(translated_cache_path),
+                    title_override=title_override,
+                    tags=tags,
+                    tid=tid,
                 )
-                succeeded = True
+
+                record = self.state.get_job(job_id) or {}
                 self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
+                succeeded = True
                 return record
 
-            self._upload_stage(
-                ctx,
-                rendered_path,
-                cues=cues,
-                title_override=title_override,
-                tags=tags,
-                tid=tid,
-            )
-
-            record = self.state.get_job(job_id) or {}
-            self.logger.info(f"任务完成 job_id={job_id} 耗时={time.time() - started:.1f}s")
-            succeeded = True
-            return record
-
-        except KeyboardInterrupt:
-            self.state.mark_job_failed(job_id, "用户手动中断")
-            raise
-        except Exception as e:
-            self.state.mark_job_failed(job_id, str(e))
-            self.logger.error(f"任务失败 job_id={job_id}: {e}")
-            raise
-        finally:
-            if succeeded and not keep_files and work_dir and work_dir.exists():
-                self._cleanup_workdir(work_dir, preserve_suffixes=cleanup_preserve_suffixes)
+            except KeyboardInterrupt:
+                self.state.mark_job_failed(job_id, "用户手动中断")
+                raise
+            except SubprocessStalledError as e:
+                self.state.mark_job_stalled(job_id, str(e))
+                self.logger.error(f"任务卡住 job_id={job_id}: {e}")
+                raise
+            except Exception as e:
+                self.state.mark_job_failed(job_id, str(e))
+                self.logger.error(f"任务失败 job_id={job_id}: {e}")
+                raise
+            finally:
+                self._log_prompt_cache_usage(job_id)
+                if succeeded and not keep_files and work_dir and work_dir.exists():
+                    self._cleanup_workdir(work_dir, preserve_suffixes=cleanup_preserve_suffixes)
 
     def _resolve_target_stage(self, *, no_upload: bool, stop_after: str | None) -> str:
         target = stop_after or ("render" if no_upload else "upload")
@@ -247,6 +350,29 @@ class SingleVideoPipeline:
         self.state.update_job(ctx.job_id, subtitle_path=str(raw_subtitle))
         return raw_subtitle
 
+    def _should_stream_source(self, ctx: RunContext, *, resume: bool, keep_files: bool) -> bool:
+        render_cfg = self.config.render
+        if not render_cfg.stream_source or keep_files:
+            return False
+        if render_cfg.adaptive.enabled or render_cfg.selective.enabled:
+            self.logger.info("自适应编码/选择性重编码需要本地视频，不使用流式压制")
+            return False
+        # A source already on disk from an earlier attempt is cheaper than the network.
+        return not (resume and self._can_reuse_video(ctx.work_dir / f"{ctx.video_id}.mp4"))
+
+    def _resolve_stream_stage(self, ctx: RunContext) -> StreamSource | None:
+        self._step(ctx.job_id, "rendering_subtitle", 70, "解析视频流地址（流式压制）")
+        try:
+            source = self.downloader.resolve_stream(ctx.webpage_url)
+        except Exception as e:
+            self.logger.warning(f"无法直接读取视频流，改为先下载视频: {e}")
+            return None
+        self.logger.info(
+            f"流式压制：格式 {source.format_id}，{source.width}x{source.height}，"
+            f"{'音视频分离' if source.audio else '单路音视频'}"
+        )
+        return source
+
     def _download_video_stage(self, ctx: RunContext, *, resume: bool) -> Path:
         self._step(ctx.job_id, "downloading_video", 35, "下载 YouTube 视频")
         expected_video = ctx.work_dir / f"{ctx.video_id}.mp4"
@@ -265,34 +391,130 @@ class SingleVideoPipeline:
         ctx: RunContext,
         cues: list,
         *,
+        raw_subtitle: Path,
         source_lang: str,
         target_lang: str,
+        track_kind: str | None = None,
         resume: bool,
     ) -> tuple[list, Path]:
         self._step(ctx.job_id, "translating_subtitle", 50, f"字幕 {source_lang} -> {target_lang}")
         segmented_cache_path = self._segmented_cache_path(ctx.work_dir, ctx.video_id, source_lang)
         cache_path = self._translated_cache_path(ctx.work_dir, ctx.video_id, source_lang, target_lang)
+        fingerprints = self._cache_fingerprints(raw_subtitle, source_lang, target_lang, track_kind=track_kind)
         if resume and cache_path.exists():
             try:
-                cues = self.subtitle.load_cues(cache_path)
+                cues = self.subtitle.load_cues(cache_path, fingerprints=fingerprints)
                 self.logger.info(f"恢复任务：复用字幕翻译缓存 {cache_path}")
             except Exception as e:
                 self.logger.warning(f"字幕翻译缓存不可用，将重新翻译: {e}")
                 cues = self._segment_and_translate(
-                    cues, segmented_cache_path, cache_path, source_lang, target_lang, resume=resume
+                    cues,
+                    segmented_cache_path,
+                    cache_path,
+                    source_lang,
+                    target_lang,
+                    fingerprints=fingerprints,
+                    track_kind=track_kind,
+                    resume=resume,
                 )
         else:
             cues = self._segment_and_translate(
-                cues, segmented_cache_path, cache_path, source_lang, target_lang, resume=resume
+                cues,
+                segmented_cache_path,
+                cache_path,
+                source_lang,
+                target_lang,
+                fingerprints=fingerprints,
+                track_kind=track_kind,
+                resume=resume,
             )
         return cues, cache_path
 
+    def _translate_windowed_stage(
+        self,
+        ctx: RunContext,
+        raw_subtitle: Path,
+        *,
+        source_lang: str,
+        target_lang: str,
+        track_kind: str | None = None,
+        resume: bool,
+    ) -> Path:
+        """Stream the track through segmentation and translation window by window.
+
+        Each finished window is appended to a partial cache that only replaces the
+        translated cache once complete; later stages stream cues back from it.
+        """
+        self._step(ctx.job_id, "translating_subtitle", 50, f"字幕 {source_lang} -> {target_lang}（分窗处理）")
+        cache_path = self._translated_cache_path(ctx.work_dir, ctx.video_id, source_lang, target_lang)
+        fingerprints = self._cache_fingerprints(raw_subtitle, source_lang, target_lang, track_kind=track_kind)
+        if resume and cache_path.exists():
+            try:
+                # Validate every block without holding the cues.
+                if sum(1 for _ in self.subtitle.iter_cached_cues(cache_path, fingerprints=fingerprints)):
+                    self.logger.info(f"恢复任务：复用字幕翻译缓存 {cache_path}")
+                    return cache_path
+            except Exception as e:
+                self.logger.warning(f"字幕翻译缓存不可用，将重新翻译: {e}")
+
+        translation = self.config.translation
+        partial_path = cache_path.with_name(f"{cache_path.name}.partial")
+        resume_after: float | None = None
+        total = 0
+        if resume and partial_path.exists():
+            try:
+                resume_after, total = self._recover_partial_windows(partial_path, fingerprints)
+            except Exception as e:
+                self.logger.warning(f"分窗翻译中间缓存不可用，将从头处理: {e}")
+        if resume_after is None:
+            self.subtitle.save_cues([], partial_path, fingerprints=fingerprints)
+        else:
+            self.logger.info(f"恢复任务：分窗翻译已完成 {total} 条，从 {resume_after:.1f}s 之后的窗口继续")
+        for window in self.subtitle.iter_translated_windows(
+            self.subtitle.iter_cues(raw_subtitle),
+            source_lang=source_lang,
+            target_lang=target_lang,
+            window_seconds=translation.window_minutes * 60,
+            overlap_seconds=translation.window_overlap_seconds,
+            track_kind=track_kind,
+            resume_after=resume_after,
+        ):
+            self.subtitle.append_cues(window, partial_path)
+            total += len(window)
+        if not total:
+            partial_path.unlink(missing_ok=True)
+            raise RuntimeError("字幕解析结果为空")
+        os.replace(partial_path, cache_path)
+        self.logger.info(f"分窗翻译完成，共 {total} 条字幕")
+        return cache_path
+
+    def _recover_partial_windows(self, partial_path: Path, fingerprints: dict[str, str]) -> tuple[float | None, int]:
+        """Keep the complete blocks of an interrupted windowed run.
+
+        Each finished window was appended as one checksummed block, so the cues
+        read back are whole windows; a torn trailing append is dropped by
+        rewriting the file. Returns the last kept cue start and the cue count.
+        """
+        last_start: float | None = None
+        count = 0
+
+        def kept():
+            nonlocal last_start, count
+            for cue in self.subtitle.iter_cached_cues(partial_path, fingerprints=fingerprints):
+                last_start = cue.start
+                count += 1
+                yield cue
+
+        self.subtitle.save_cues(kept(), partial_path, fingerprints=fingerprints)
+        return last_start, count
+
     def _write_ass_stage(
         self,
         ctx: RunContext,
-        cues: list,
+        cues: Iterable,
         *,
         downloaded_video: Path | None,
+        streamed: bool = False,
         reaches_render: bool,
     ) -> Path:
         step = "生成双语 ASS 字幕并压制" if reaches_render else "生成双语 ASS 字幕"
@@ -300,6 +522,9 @@ class SingleVideoPipeline:
         ass_path = ctx.work_dir / f"{ctx.video_id}.bilingual.ass"
         if downloaded_video is not None:
             width, height = self.renderer.get_resolution(downloaded_video)
+        elif streamed:
+            # The size of the format the render stage will stream, not the largest one listed.
+            width, height = stream_resolution(ctx.meta) or self._metadata_resolution(ctx.meta)
         else:
             width, height = self._metadata_resolution(ctx.meta)
         self.subtitle.write_bilingual_ass(cues, ass_path, width=width, height=height)
@@ -310,39 +535,130 @@ class SingleVideoPipeline:
         self,
         ctx: RunContext,
         ass_path: Path,
-        downloaded_video: Path,
+        downloaded_video: Path | None,
         *,
         render_profile: str | None,
         resume: bool,
+        render_priority: int = 0,
     ) -> Path:
+        """Render the ASS onto the local video, or onto the source streamed from YouTube.
+
+        Reuse on resume is decided from the recorded manifests alone. Only when
+        a render is needed, and without downloaded_video, are the format URLs
+        resolved, as late as possible. A streamed render that fails with an
+        HTTP error (expired URLs) re-resolves once, then falls back to
+        downloading the video.
+        """
         rendered_path = ctx.output_dir / f"{ctx.video_id}.bilingual.mp4"
         render_manifest_path = ctx.output_dir / f"{ctx.video_id}.bilingual.render.json"
         render_profile_name = render_profile or self.config.render.profile
+        # Extra outputs come from the same ffmpeg pass, so they are reused or re-rendered together.
+        extra_outputs = [
+            (
+                output,
+                ctx.output_dir / f"{ctx.video_id}.bilingual.{output.name}.mp4",
+                ctx.output_dir / f"{ctx.video_id}.bilingual.{output.name}.render.json",
+            )
+            for output in self.config.render.extra_outputs
+        ]
         if resume and self._can_reuse_rendered_output(
             rendered_path,
             render_manifest_path,
             ass_path,
             downloaded_video,
             render_profile_name,
+        ) and all(
+            self._can_reuse_rendered_output(path, manifest, ass_path, downloaded_video, render_profile_name, output=output)
+            for output, path, manifest in extra_outputs
         ):
             self.logger.info(f"恢复任务：复用已压制视频 {rendered_path}")
         else:
+            source: Path | StreamSource = (
+                downloaded_video or self._resolve_stream_stage(ctx) or self._download_video_stage(ctx, resume=resume)
+            )
+            re_resolved = False
+            while True:
+                try:
+                    source, encoding_choice = self._burn_in_slot(
+                        ctx,
+                        ass_path,
+                        source,
+                        rendered_path,
+                        render_profile=render_profile,
+                        render_profile_name=render_profile_name,
+                        extra_outputs=extra_outputs,
+                        render_priority=render_priority,
+                    )
+                    break
+                except StreamHTTPError as e:
+                    if not isinstance(source, StreamSource):
+                        raise
+                    self.logger.warning(f"视频流地址不可用（可能已过期）: {e}")
+                    refreshed = None if re_resolved else self._resolve_stream_stage(ctx)
+                    re_resolved = True
+                    source = refreshed or self._download_video_stage(ctx, resume=resume)
+            self._write_render_manifest(
+                render_manifest_path,
+                ass_path,
+                source,
+                render_profile_name,
+                encoding=encoding_choice.as_dict() if encoding_choice else None,
+            )
+            for output, path, manifest in extra_outputs:
+                self._write_render_manifest(manifest, ass_path, source, render_profile_name, output=output)
+                self.logger.info(f"附加输出 {output.name}: {path}")
+        self.state.update_job(ctx.job_id, subtitle_path=str(ass_path), rendered_path=str(rendered_path))
+        return rendered_path
+
+    def _burn_in_slot(
+        self,
+        ctx: RunContext,
+        ass_path: Path,
+        source: Path | StreamSource,
+        rendered_path: Path,
+        *,
+        render_profile: str | None,
+        render_profile_name: str,
+        extra_outputs: list[tuple[RenderOutputConfig, Path, Path]],
+        render_priority: int,
+    ) -> tuple[Path | StreamSource, EncodingChoice | None]:
+        """Burn under a render slot; returns the source actually rendered and the adaptive choice."""
+        waited = False
+
+        def on_wait(ahead: int) -> None:
+            nonlocal waited
+            waited = True
+            self._step(ctx.job_id, "rendering_subtitle", 70, f"等待压制槽位（前面还有 {ahead} 个任务）")
+
+        with self.render_scheduler.slot(ctx.job_id, priority=render_priority, on_wait=on_wait) as thread_budget:
+            if waited and isinstance(source, StreamSource):
+                # URLs resolved before a queue wait may have expired meanwhile.
+                source = self._resolve_stream_stage(ctx) or source
+            encoding_choice = None
+            # Streaming is only chosen when adaptive encoding is off, so source is a local file here.
+            if self.config.render.adaptive.enabled:
+                self._step(ctx.job_id, "rendering_subtitle", 70, "采样分析画面，选择编码参数")
+                encoding_choice = self.renderer.choose_encoding(source, profile=render_profile_name)
+            streamed = isinstance(source, StreamSource)
             self.renderer.burn_subtitle(
-                input_video=downloaded_video,
+                input_video=source.video if streamed else source,
                 ass_path=ass_path,
                 output_video=rendered_path,
                 profile=render_profile,
+                encoding_choice=encoding_choice,
+                extra_targets=[self.renderer.output_target(path, output) for output, path, _manifest in extra_outputs],
+                progress_callback=RenderProgressReporter(self.state, self.logger, ctx.job_id),
+                thread_budget=thread_budget,
+                audio_input=source.audio if streamed else None,
             )
-            self._write_render_manifest(render_manifest_path, ass_path, downloaded_video, render_profile_name)
-        self.state.update_job(ctx.job_id, subtitle_path=str(ass_path), rendered_path=str(rendered_path))
-        return rendered_path
+        return source, encoding_choice
 
     def _upload_stage(
         self,
         ctx: RunContext,
         rendered_path: Path,
         *,
-        cues: list,
+        cues: Iterable,
         title_override: str | None,
         tags: list[str] | None,
         tid: int | None,
@@ -426,7 +742,7 @@ class SingleVideoPipeline:
         final_title: str,
         webpage_url: str,
         meta: dict,
-        cues: list,
+        cues: Iterable,
         tags: list[str] | None,
         tid: int | None,
     ) -> tuple[list[str] | None, int | None]:
@@ -436,7 +752,7 @@ class SingleVideoPipeline:
             return final_tags, final_tid
 
         sample = []
-        for cue in cues[:12]:
+        for cue in islice(cues, 12):
             sample.append({"en": cue.text, "zh": cue.translation or ""})
         payload = {
             "title": original_title,
@@ -460,16 +776,40 @@ class SingleVideoPipeline:
             self.logger.warning(f"AI 推荐 Bilibili 元数据失败，使用配置默认值: {e}")
         return final_tags, final_tid
 
+    def _record_llm_usage(self, job_id: str, usage) -> None:
+        self.state.record_llm_usage(
+            job_id,
+            stage=usage.stage,
+            model=usage.model,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cached_tokens=usage.prompt_cache_hit_tokens,
+            cache_miss_tokens=usage.prompt_cache_miss_tokens,
+            latency_ms=usage.latency_ms,
+            retries=usage.retries,
+            retry_wait_ms=usage.retry_wait_ms,
+            cost=estimate_llm_cost(usage, self.config.ai.pricing),
+        )
+
+    def _log_prompt_cache_usage(self, job_id: str) -> None:
+        record = self.state.get_job(job_id) or {}
+        hit = int(record.get("prompt_cache_hit_tokens") or 0)
+        miss = int(record.get("prompt_cache_miss_tokens") or 0)
+        if hit + miss:
+            self.logger.info(
+                f"Prompt 缓存 job_id={job_id}: 命中 {hit} tokens，未命中 {miss} tokens，"
+                f"命中率 {hit / (hit + miss):.1%}"
+            )
+
     def _step(self, job_id: str, status: str, progress: int, step: str) -> None:
         self.logger.info(f"[{job_id}] {step}")
         self.state.update_job(job_id, status=status, progress=progress, current_step=step, error=None)
 
     def _find_existing_subtitle(self, work_dir: Path, video_id: str, source_lang: str) -> Path | None:
         candidates = [
-            *work_dir.glob(f"{video_id}.{source_lang}*.vtt"),
-            *work_dir.glob(f"{video_id}.{source_lang}*.srt"),
+            path for ext in SUBTITLE_EXTENSIONS for path in sorted(work_dir.glob(f"{video_id}.{source_lang}*.{ext}"))
         ]
-        return next((path for path in sorted(candidates) if path.stat().st_size > 0), None)
+        return next((path for path in candidates if path.stat().st_size > 0), None)
 
     def _translated_cache_path(self, work_dir: Path, video_id: str, source_lang: str, target_lang: str) -> Path:
         lang_key = re.sub(r"[^A-Za-z0-9_-]", "_", f"{source_lang}-{target_lang}")
@@ -479,6 +819,56 @@ class SingleVideoPipeline:
         lang_key = re.sub(r"[^A-Za-z0-9_-]", "_", source_lang)
         return work_dir / f"{video_id}.{lang_key}.segmented.json"
 
+    def _cache_fingerprints(
+        self,
+        raw_subtitle: Path,
+        source_lang: str,
+        target_lang: str,
+        *,
+        track_kind: str | None = None,
+    ) -> dict[str, str]:
+        """Fingerprint each group of inputs that shapes the segmented and translated caches."""
+        ai = self.config.ai
+        translation = self.config.translation
+        model = {
+            "provider": ai.provider,
+            "model": ai.model,
+            "reasoning": ai.reasoning,
+            "reasoning_effort": ai.reasoning_effort,
+        }
+        fused_prompt = None
+        if translation.fused_segment_translation:
+            fused_prompt = build_fused_segment_translation_prompt(translation, source_lang, target_lang)
+        segmentation = {
+            "model": model,
+            "prompt": build_segment_prompt(source_lang),
+            "fused_prompt": fused_prompt,
+            "batch_size": translation.segmentation_batch_size,
+            "rule_segmentation": translation.rule_segmentation,
+            "rule_min_confidence": translation.rule_segmentation_min_confidence,
+        }
+        if translation.rule_segmentation:
+            # The track kind decides which batches may skip the LLM.
+            segmentation["track_kind"] = track_kind
+        if translation.window_minutes > 0:
+            # Window boundaries decide where sentences may be cut.
+            segmentation["window"] = [translation.window_minutes, translation.window_overlap_seconds]
+        with raw_subtitle.open("rb") as f:
+            source = hashlib.file_digest(f, "sha256").hexdigest()
+        return {
+            "source": source[:16],
+            "parser": str(PARSER_VERSION),
+            "segmentation": _fingerprint(segmentation),
+            "translation": _fingerprint(
+                {
+                    "model": model,
+                    "prompt": build_subtitle_translation_prompt(translation, source_lang, target_lang),
+                    "glossary": translation.glossary,
+                    "batch_size": translation.subtitle_batch_size,
+                }
+            ),
+        }
+
     def _segment_and_translate(
         self,
         cues: list,
@@ -487,23 +877,45 @@ class SingleVideoPipeline:
         source_lang: str,
         target_lang: str,
         *,
+        fingerprints: dict[str, str],
+        track_kind: str | None = None,
         resume: bool,
     ) -> list:
+        segmented_fingerprints = {name: fingerprints[name] for name in _SEGMENTED_CACHE_INPUTS}
         if resume and segmented_cache_path.exists():
             try:
-                cues = self.subtitle.load_cues(segmented_cache_path)
+                cues = self.subtitle.load_cues(segmented_cache_path, fingerprints=segmented_fingerprints)
                 self.logger.info(f"恢复任务：复用智能分句缓存 {segmented_cache_path}")
             except Exception as e:
                 self.logger.warning(f"智能分句缓存不可用，将重新分句: {e}")
-                cues = self.subtitle.segment_cues(cues, source_lang=source_lang)
-                self.subtitle.save_cues(cues, segmented_cache_path)
+                cues = self.subtitle.segment_cues(
+                    cues, source_lang=source_lang, target_lang=target_lang, track_kind=track_kind
+                )
+                self.subtitle.save_cues(cues, segmented_cache_path, fingerprints=segmented_fingerprints)
         else:
-            cues = self.subtitle.segment_cues(cues, source_lang=source_lang)
-            self.subtitle.save_cues(cues, segmented_cache_path)
+            cues = self.subtitle.segment_cues(cues, source_lang=source_lang, target_lang=target_lang, track_kind=track_kind)
+            self.subtitle.save_cues(cues, segmented_cache_path, fingerprints=segmented_fingerprints)
+        # A plain re-run starts clean; only --resume-job carries earlier translations over.
+        previous = self._previous_translations(translated_cache_path, fingerprints) if resume else None
+        if previous:
+            self.subtitle.reuse_translations(cues, previous)
         cues = self.subtitle.translate_segmented_cues(cues, source_lang=source_lang, target_lang=target_lang)
-        self.subtitle.save_cues(cues, translated_cache_path)
+        self.subtitle.save_cues(cues, translated_cache_path, fingerprints=fingerprints)
         return cues
 
+    def _previous_translations(self, translated_cache_path: Path, fingerprints: dict[str, str]) -> list | None:
+        """Translations from an earlier run with the same translation inputs, for incremental re-translation.
+
+        The source text and segmentation may differ; reuse_translations() aligns them.
+        """
+        if not translated_cache_path.exists():
+            return None
+        try:
+            return self.subtitle.load_cues(translated_cache_path, fingerprints={"translation": fingerprints["translation"]})
+        except Exception as e:
+            self.logger.info(f"已有字幕翻译缓存不可复用，将全部重新翻译: {e}")
+            return None
+
     def _can_reuse_video(self, path: Path) -> bool:
         if not path.exists() or path.stat().st_size <= 0:
             return False
@@ -519,36 +931,80 @@ class SingleVideoPipeline:
         rendered_path: Path,
         manifest_path: Path,
         ass_path: Path,
-        input_video: Path,
+        input_video: Path | None,
         profile_name: str,
+        *,
+        output: RenderOutputConfig | None = None,
     ) -> bool:
+        """Compare the manifest with the current inputs; input_video None means a streamed source.
+
+        A streamed render is matched by its recorded input_stream without
+        resolving the stream again, which would need the network.
+        """
         if not self._can_reuse_video(rendered_path) or not manifest_path.exists():
             return False
         try:
-            expected = self._render_manifest_payload(ass_path, input_video, profile_name)
+            expected = self._render_manifest_payload(ass_path, input_video, profile_name, output=output)
             actual = json.loads(manifest_path.read_text(encoding="utf-8"))
+            # The recorded encoding choice is derived from the compared inputs and settings.
+            actual.pop("encoding", None)
+            if input_video is None and not actual.pop("input_stream", None):
+                return False
             return actual == expected
         except Exception as e:
             self.logger.warning(f"恢复任务：压制缓存校验失败，将重新压制: {e}")
             return False
 
-    def _write_render_manifest(self, path: Path, ass_path: Path, input_video: Path, profile_name: str) -> None:
-        path.write_text(
-            json.dumps(self._render_manifest_payload(ass_path, input_video, profile_name), ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+    def _write_render_manifest(
+        self,
+        path: Path,
+        ass_path: Path,
+        input_video: Path | StreamSource,
+        profile_name: str,
+        *,
+        encoding: dict | None = None,
+        output: RenderOutputConfig | None = None,
+    ) -> None:
+        payload = self._render_manifest_payload(ass_path, input_video, profile_name, output=output)
+        if encoding is not None:
+            payload["encoding"] = encoding
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    def _render_manifest_payload(self, ass_path: Path, input_video: Path, profile_name: str) -> dict:
-        video_stat = input_video.stat()
+    def _render_manifest_payload(
+        self,
+        ass_path: Path,
+        input_video: Path | StreamSource | None,
+        profile_name: str,
+        *,
+        output: RenderOutputConfig | None = None,
+    ) -> dict:
         profile = getattr(self.config.render, profile_name).model_dump(mode="json")
-        return {
-            "ass_sha256": hashlib.sha256(ass_path.read_bytes()).hexdigest(),
-            "input_video": str(input_video.resolve()),
-            "input_size": video_stat.st_size,
-            "input_mtime_ns": video_stat.st_mtime_ns,
-            "profile_name": profile_name,
-            "profile": profile,
-        }
+        payload: dict = {"ass_sha256": hashlib.sha256(ass_path.read_bytes()).hexdigest()}
+        if isinstance(input_video, StreamSource):
+            # Format URLs expire; the selected format identifies the streamed source.
+            payload["input_stream"] = {
+                "format_id": input_video.format_id,
+                "width": input_video.width,
+                "height": input_video.height,
+            }
+        elif input_video is not None:
+            video_stat = input_video.stat()
+            payload.update(
+                input_video=str(input_video.resolve()),
+                input_size=video_stat.st_size,
+                input_mtime_ns=video_stat.st_mtime_ns,
+            )
+        payload.update(profile_name=profile_name, profile=profile)
+        if output is not None:
+            payload["output"] = output.model_dump(mode="json")
+        else:
+            adaptive = self.config.render.adaptive
+            if adaptive.enabled:
+                payload["adaptive"] = adaptive.model_dump(mode="json")
+            selective = self.config.render.selective
+            if selective.enabled and not self.config.render.extra_outputs:
+                payload["selective"] = selective.model_dump(mode="json")
+        return payload
 
     def _cleanup_workdir(self, work_dir: Path, *, preserve_suffixes: set[str]) -> None:
         try:
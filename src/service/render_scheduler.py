@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    """Encoder threads granted to one render slot."""
+
+    threads: int
+    lookahead_threads: int
+
+
+@dataclass(frozen=True)
+class RenderCapacity:
+    slots: int
+    budget: ThreadBudget
+    cores: int
+    memory_mb: int | None
+
+    def as_dict(self) -> dict:
+        return {
+            "slots": self.slots,
+            "threads": self.budget.threads,
+            "lookahead_threads": self.budget.lookahead_threads,
+            "cores": self.cores,
+            "memory_mb": self.memory_mb,
+        }
+
+
+def plan_render_capacity(config, *, cores: int | None = None, memory_mb: int | None = None) -> RenderCapacity:
+    """Concurrent encode slots and per-encode threads for this machine.
+
+    Without max_concurrent, slots are limited both by cores (at least
+    min_threads_per_encode each) and by memory (memory_per_encode_mb each).
+    x264 runs its lookahead on a sixth of its threads by default; that ratio is
+    kept but made explicit so it scales with the budget rather than the machine.
+    """
+    cores = max(1, cores or os.cpu_count() or 1)
+    memory_mb = memory_mb if memory_mb is not None else _total_memory_mb()
+    slots = config.max_concurrent
+    if slots is None:
+        slots = max(1, cores // config.min_threads_per_encode)
+        if memory_mb:
+            slots = max(1, min(slots, memory_mb // config.memory_per_encode_mb))
+    threads = config.threads_per_encode or max(1, cores // slots)
+    return RenderCapacity(
+        slots=slots,
+        budget=ThreadBudget(threads=threads, lookahead_threads=max(1, threads // 6)),
+        cores=cores,
+        memory_mb=memory_mb,
+    )
+
+
+class RenderScheduler:
+    """Admit renders from all y2b processes sharing state_db into a fixed number of slots.
+
+    The queue lives in the state database, so pipelines started as separate
+    ``y2b translate`` processes wait for each other; higher priority first, then
+    arrival order.
+    """
+
+    def __init__(self, state, config, *, logger=None, sleep: Callable[[float], None] = time.sleep):
+        self.state = state
+        self.config = config
+        self.logger = logger
+        self.capacity = plan_render_capacity(config)
+        self._sleep = sleep
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.enabled)
+
+    def queue_depth(self) -> int:
+        return self.state.render_queue_stats()["waiting"]
+
+    def stats(self) -> dict:
+        return {**self.state.render_queue_stats(), **self.capacity.as_dict()}
+
+    @contextmanager
+    def slot(
+        self,
+        job_id: str,
+        *,
+        priority: int = 0,
+        on_wait: Callable[[int], None] | None = None,
+    ) -> Iterator[ThreadBudget | None]:
+        """Hold a render slot for the block; yields None when the scheduler is off.
+
+        on_wait(ahead) is called whenever the number of renders queued ahead changes.
+        """
+        if not self.enabled:
+            yield None
+            return
+        ticket = self.state.enqueue_render(job_id, priority=priority)
+        try:
+            last_ahead: int | None = None
+            while True:
+                admitted, ahead = self.state.admit_render(ticket, self.capacity.slots)
+                if admitted:
+                    break
+                if ahead != last_ahead:
+                    last_ahead = ahead
+                    if on_wait:
+                        on_wait(ahead)
+                self._sleep(self.config.poll_seconds)
+            budget = self.capacity.budget
+            if self.logger:
+                self.logger.info(
+                    f"获得压制槽位（共 {self.capacity.slots} 个），编码线程 {budget.threads}，"
+                    f"lookahead 线程 {budget.lookahead_threads}"
+                )
+            yield budget
+        finally:
+            self.state.release_render(ticket)
+
+
+def _total_memory_mb() -> int | None:
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024))
+    except (AttributeError, OSError, ValueError):
+        return None
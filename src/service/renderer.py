@@ -1,8 +1,184 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import re
+import tempfile
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 
-from src.infra.ffmpeg import burn_ass_subtitle, get_video_resolution
+from src.infra.ffmpeg import (
+    RenderProgress,
+    RenderTarget,
+    StreamInput,
+    burn_ass_subtitle_outputs,
+    concat_segments_with_audio,
+    copy_video_segment,
+    count_video_packets,
+    encode_subtitled_segment,
+    encode_video,
+    extract_clip,
+    get_media_duration,
+    get_video_resolution,
+    measure_quality,
+    probe_media,
+    probe_video_stream,
+    render_preview,
+)
+from src.infra.process_watchdog import SubprocessStalledError
+from src.service.render_scheduler import ThreadBudget
+
+_ASS_TIME_RE = re.compile(r"^\s*(\d+):(\d{2}):(\d{2}(?:\.\d+)?)\s*$")
+# Source H.264 profiles that libx264 can reproduce for re-encoded spans.
+_X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+
+@dataclass
+class EncodingChoice:
+    """Per-video rate control picked by RenderService.choose_encoding()."""
+
+    crf: int
+    ssim: float
+    predicted_kbps: float
+    maxrate: str | None = None
+    bufsize: str | None = None
+    # crf -> {"ssim", "kbps"} measured on the sampled segments.
+    trials: dict[int, dict[str, float]] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["trials"] = {str(crf): values for crf, values in sorted(self.trials.items())}
+        return data
+
+
+@dataclass
+class RenderSpan:
+    """A keyframe-aligned slice of the source: re-encoded with subtitles, or stream-copied."""
+
+    start: float
+    end: float
+    encode: bool
+
+
+def ass_event_spans(ass_path: str | Path) -> list[tuple[float, float]]:
+    """Merged (start, end) seconds covered by Dialogue events of an ASS file."""
+    events: list[tuple[float, float]] = []
+    with Path(ass_path).open("r", encoding="utf-8-sig") as f:
+        for line in f:
+            if not line.startswith("Dialogue:"):
+                continue
+            fields = line[len("Dialogue:") :].split(",", 3)
+            start, end = (_ASS_TIME_RE.match(value) for value in fields[1:3])
+            if start and end:
+                events.append((_ass_seconds(start), _ass_seconds(end)))
+    merged: list[tuple[float, float]] = []
+    for start, end in sorted(events):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _ass_seconds(match: re.Match) -> float:
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def plan_render_spans(
+    events: list[tuple[float, float]],
+    keyframes: list[float],
+    duration: float,
+    *,
+    padding: float = 0.5,
+    min_copy_seconds: float = 10.0,
+) -> list[RenderSpan]:
+    """Cover [0, duration) with spans whose boundaries are keyframes (or the file ends).
+
+    Every padded subtitle event lies inside an encode span; subtitle-free gaps
+    shorter than min_copy_seconds are folded into the surrounding encode spans.
+    """
+    encode: list[list[float]] = []
+    for event_start, event_end in events:
+        low, high = max(0.0, event_start - padding), min(duration, event_end + padding)
+        if low >= duration:
+            break
+        index = bisect_right(keyframes, low) - 1
+        start = keyframes[index] if index >= 0 else 0.0
+        index = bisect_left(keyframes, high)
+        end = keyframes[index] if index < len(keyframes) else duration
+        if encode and start - encode[-1][1] < min_copy_seconds:
+            encode[-1][1] = max(encode[-1][1], end)
+        else:
+            encode.append([start, end])
+    if not encode:
+        return [RenderSpan(0.0, duration, False)]
+    if encode[0][0] < min_copy_seconds:
+        encode[0][0] = 0.0
+    if duration - encode[-1][1] < min_copy_seconds:
+        encode[-1][1] = duration
+
+    spans: list[RenderSpan] = []
+    position = 0.0
+    for start, end in encode:
+        if start > position:
+            spans.append(RenderSpan(position, start, False))
+        spans.append(RenderSpan(start, end, True))
+        position = end
+    if position < duration:
+        spans.append(RenderSpan(position, duration, False))
+    return spans
+
+
+def _frame_rate(value: str | None) -> float:
+    numerator, _, denominator = (value or "0/1").partition("/")
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _selective_unsupported_reason(info: dict, codec: str) -> str | None:
+    if codec != "libx264":
+        return f"编码器 {codec} 不是 libx264"
+    if info.get("codec_name") != "h264":
+        return f"源视频编码 {info.get('codec_name')} 不是 H.264"
+    if info.get("pix_fmt") != "yuv420p":
+        return f"源视频像素格式 {info.get('pix_fmt')} 不是 yuv420p"
+    if info.get("profile") not in _X264_PROFILES:
+        return f"源视频 H.264 profile {info.get('profile')} 无法匹配"
+    if info.get("field_order") not in {None, "", "unknown", "progressive"}:
+        return "源视频为隔行扫描"
+    rate = _frame_rate(info.get("r_frame_rate"))
+    if rate <= 0 or abs(rate - _frame_rate(info.get("avg_frame_rate"))) > 0.01:
+        return "源视频不是恒定帧率"
+    return None
+
+
+def _span_progress(
+    callback: Callable[[RenderProgress], None] | None,
+    *,
+    span: RenderSpan,
+    total_seconds: float,
+) -> Callable[[RenderProgress], None] | None:
+    """Rebase one span's ffmpeg progress (which starts at zero) onto the whole video."""
+    if callback is None:
+        return None
+    length = span.end - span.start
+
+    def report(snapshot: RenderProgress) -> None:
+        callback(
+            RenderProgress(
+                out_seconds=span.start + min(max(snapshot.out_seconds, 0.0), length),
+                fps=snapshot.fps,
+                speed=snapshot.speed,
+                total_seconds=total_seconds,
+            )
+        )
+
+    return report
 
 
 class RenderService:
@@ -13,25 +189,279 @@ class RenderService:
     def get_resolution(self, video_path: str | Path) -> tuple[int, int]:
         return get_video_resolution(video_path)
 
-    def burn_subtitle(
+    def choose_encoding(self, input_video: str | Path, *, profile: str | None = None) -> EncodingChoice | None:
+        """Pick a CRF (and maxrate under a size cap) for this video from a few sampled segments.
+
+        Returns None when render.adaptive is off or the profile is not CRF-based.
+        Samples are spread evenly over the video and encoded without subtitles;
+        the highest CRF whose mean SSIM still meets target_ssim wins, then CRF is
+        raised further while the predicted video size exceeds max_size_mb.
+        """
+        render_cfg = getattr(self.config, "render", None)
+        adaptive = getattr(render_cfg, "adaptive", None)
+        selected = profile or getattr(render_cfg, "profile", "quality")
+        encoding = getattr(render_cfg, selected, None)
+        if not getattr(adaptive, "enabled", False) or getattr(encoding, "crf", None) is None:
+            return None
+
+        duration = get_media_duration(input_video)
+        length = min(adaptive.sample_seconds, duration)
+        count = max(1, min(adaptive.sample_count, int(duration // adaptive.sample_seconds)))
+        starts = [(duration - length) * (index + 1) / (count + 1) for index in range(count)]
+        trials: dict[int, dict[str, float]] = {}
+        with tempfile.TemporaryDirectory(prefix="y2b-crf-") as tmp:
+            work = Path(tmp)
+            samples = [
+                extract_clip(input_video, work / f"sample{index}.mp4", seconds=length, start=start)
+                for index, start in enumerate(starts)
+            ]
+
+            def trial(crf: int) -> dict[str, float]:
+                if crf not in trials:
+                    ssim_total = 0.0
+                    size_total = 0
+                    for index, sample in enumerate(samples):
+                        encoded = encode_video(
+                            sample, work / f"sample{index}.crf{crf}.mp4", codec=encoding.codec, preset=encoding.preset, crf=crf
+                        )
+                        ssim_total += measure_quality(encoded, sample, metrics=("ssim",)).get("ssim", 0.0)
+                        size_total += encoded.stat().st_size
+                    trials[crf] = {
+                        "ssim": round(ssim_total / len(samples), 5),
+                        "kbps": round(size_total * 8 / (length * len(samples)) / 1000, 1),
+                    }
+                return trials[crf]
+
+            # SSIM falls as CRF rises, so binary-search the highest CRF meeting the target.
+            low, high = adaptive.min_crf, adaptive.max_crf
+            crf = low
+            while low <= high:
+                middle = (low + high) // 2
+                if trial(middle)["ssim"] >= adaptive.target_ssim:
+                    crf, low = middle, middle + 1
+                else:
+                    high = middle - 1
+
+            maxrate = bufsize = None
+            if adaptive.max_size_mb:
+                cap_kbps = adaptive.max_size_mb * 1024 * 1024 * 8 / duration / 1000
+                while trial(crf)["kbps"] > cap_kbps and crf < adaptive.max_crf:
+                    crf += 1
+                maxrate, bufsize = f"{int(cap_kbps)}k", f"{int(cap_kbps * 2)}k"
+            chosen = trial(crf)
+
+        choice = EncodingChoice(
+            crf=crf,
+            ssim=chosen["ssim"],
+            predicted_kbps=chosen["kbps"],
+            maxrate=maxrate,
+            bufsize=bufsize,
+            trials=trials,
+        )
+        if self.logger:
+            self.logger.info(
+                f"自适应编码：CRF {crf}（采样 SSIM {choice.ssim:.4f}，预计视频码率 {choice.predicted_kbps:g} kbps"
+                + (f"，maxrate {maxrate}" if maxrate else "")
+                + "）"
+            )
+        return choice
+
+    def preview(
         self,
         *,
         input_video: str | Path,
         ass_path: str | Path,
+        output_dir: str | Path,
+        at: list[float],
+        duration: float = 5.0,
+        still: bool = False,
+    ) -> list[tuple[Path, bool]]:
+        """Render QA previews at each timestamp; returns (path, reused) pairs.
+
+        Files are named after the ASS content hash, so an unchanged ASS reuses
+        earlier previews and an edited one renders fresh ones.
+        """
+        ass_hash = hashlib.sha256(Path(ass_path).read_bytes()).hexdigest()[:12]
+        fonts_dir = getattr(getattr(self.config, "subtitle_style", None), "fonts_dir", None)
+        results: list[tuple[Path, bool]] = []
+        for seconds in at:
+            stem = f"{Path(input_video).stem}.{ass_hash}.{seconds:09.3f}"
+            path = Path(output_dir) / (f"{stem}.jpg" if still else f"{stem}.{duration:g}s.mp4")
+            if path.exists() and path.stat().st_size > 0:
+                results.append((path, True))
+                continue
+            render_preview(
+                input_video=input_video,
+                ass_path=ass_path,
+                output=path,
+                at=seconds,
+                duration=duration,
+                still=still,
+                fonts_dir=fonts_dir,
+            )
+            results.append((path, False))
+        return results
+
+    def output_target(self, output_video: str | Path, output) -> RenderTarget:
+        """RenderTarget for one render.extra_outputs entry."""
+        return RenderTarget(
+            Path(output_video),
+            codec=output.codec,
+            preset=output.preset,
+            crf=output.crf,
+            bitrate=output.bitrate,
+            height=output.height,
+        )
+
+    def burn_subtitle(
+        self,
+        *,
+        input_video: str | Path | StreamInput,
+        ass_path: str | Path,
         output_video: str | Path,
         profile: str | None = None,
+        encoding_choice: EncodingChoice | None = None,
+        extra_targets: list[RenderTarget] | None = None,
+        progress_callback: Callable[[RenderProgress], None] | None = None,
+        thread_budget: ThreadBudget | None = None,
+        audio_input: StreamInput | None = None,
     ) -> Path:
+        """Render output_video with the profile; extra_targets share the same decode and libass pass.
+
+        thread_budget (from the render scheduler) is split evenly between the targets.
+        A StreamInput source (plus audio_input) is read over the network and always
+        rendered in full, since selective re-encoding needs a seekable local file.
+        """
         render_cfg = getattr(self.config, "render", None)
         selected = profile or getattr(render_cfg, "profile", "quality")
         encoding = getattr(render_cfg, selected, None)
-        return burn_ass_subtitle(
+        main = RenderTarget(
+            Path(output_video),
+            codec=getattr(encoding, "codec", "libx264"),
+            preset=getattr(encoding, "preset", "medium"),
+            crf=encoding_choice.crf if encoding_choice else getattr(encoding, "crf", 20),
+            bitrate=getattr(encoding, "bitrate", None),
+            maxrate=encoding_choice.maxrate if encoding_choice else None,
+            bufsize=encoding_choice.bufsize if encoding_choice else None,
+        )
+        targets = [main, *(extra_targets or [])]
+        if thread_budget:
+            for target in targets:
+                target.threads = max(1, thread_budget.threads // len(targets))
+                target.lookahead_threads = max(1, thread_budget.lookahead_threads // len(targets))
+        local = not isinstance(input_video, StreamInput)
+        if local and getattr(getattr(render_cfg, "selective", None), "enabled", False) and not extra_targets:
+            rendered = self._burn_selective(input_video, ass_path, main, progress_callback=progress_callback)
+            if rendered is not None:
+                return rendered
+        return burn_ass_subtitle_outputs(
             input_video=input_video,
             ass_path=ass_path,
-            output_video=output_video,
+            targets=targets,
             fonts_dir=getattr(getattr(self.config, "subtitle_style", None), "fonts_dir", None),
             logger=self.logger,
-            codec=getattr(encoding, "codec", "libx264"),
-            preset=getattr(encoding, "preset", "medium"),
-            crf=getattr(encoding, "crf", 20),
-            bitrate=getattr(encoding, "bitrate", None),
+            progress_callback=progress_callback,
+            stall_seconds=getattr(render_cfg, "stall_timeout_seconds", 0.0),
+            audio_input=audio_input,
+        )[0]
+
+    def _burn_selective(
+        self,
+        input_video: str | Path,
+        ass_path: str | Path,
+        target: RenderTarget,
+        *,
+        progress_callback: Callable[[RenderProgress], None] | None = None,
+    ) -> Path | None:
+        """Re-encode only subtitle-bearing spans; returns None to fall back to a full render.
+
+        Every span runs under the stall watchdog, and its progress is reported
+        as a position in the whole video. A stall is raised, not retried as a
+        full render.
+        """
+        selective = self.config.render.selective
+        stall_seconds = getattr(self.config.render, "stall_timeout_seconds", 0.0)
+        try:
+            info = probe_video_stream(input_video)
+            reason = _selective_unsupported_reason(info, target.codec)
+            if reason:
+                self._log_warning(f"选择性重编码不可用（{reason}），改为完整压制")
+                return None
+            # One video-only packet scan gives both the keyframes and the frame count the output must match.
+            source_packets = probe_media(input_video, packets=True)
+            spans = plan_render_spans(
+                ass_event_spans(ass_path),
+                source_packets.keyframes or [],
+                info["duration"],
+                padding=selective.padding_seconds,
+                min_copy_seconds=selective.min_copy_seconds,
+            )
+            copied = sum(span.end - span.start for span in spans if not span.encode)
+            if not copied:
+                self._log_info("选择性重编码：没有可直接复制的无字幕片段，改为完整压制")
+                return None
+            # Boundaries are keyframe times; half a frame of slack absorbs rounding in ffprobe's output.
+            slack = 0.5 / _frame_rate(info.get("r_frame_rate"))
+            fonts_dir = getattr(getattr(self.config, "subtitle_style", None), "fonts_dir", None)
+            target.output.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(prefix=".y2b-spans-", dir=target.output.parent) as tmp:
+                segments: list[Path] = []
+                for index, span in enumerate(spans):
+                    segment = Path(tmp) / f"{index:05d}.ts"
+                    span_progress = _span_progress(progress_callback, span=span, total_seconds=info["duration"])
+                    if span.encode:
+                        encode_subtitled_segment(
+                            input_video,
+                            ass_path,
+                            segment,
+                            start=max(0.0, span.start - slack),
+                            duration=span.end - span.start,
+                            codec=target.codec,
+                            preset=target.preset,
+                            crf=target.crf,
+                            profile=_X264_PROFILES[info["profile"]],
+                            pix_fmt=info["pix_fmt"],
+                            bitrate=target.bitrate,
+                            maxrate=target.maxrate,
+                            bufsize=target.bufsize,
+                            fonts_dir=fonts_dir,
+                            threads=target.threads,
+                            lookahead_threads=target.lookahead_threads,
+                            progress_callback=span_progress,
+                            stall_seconds=stall_seconds,
+                        )
+                    else:
+                        copy_video_segment(
+                            input_video,
+                            segment,
+                            start=span.start + slack,
+                            duration=span.end - span.start - 2 * slack,
+                            progress_callback=span_progress,
+                            stall_seconds=stall_seconds,
+                        )
+                    segments.append(segment)
+                joined = concat_segments_with_audio(segments, input_video, Path(tmp) / "joined.mp4")
+                if count_video_packets(joined) != source_packets.video_packets:
+                    self._log_warning("选择性重编码结果帧数与源视频不一致，改为完整压制")
+                    return None
+                os.replace(joined, target.output)
+        except SubprocessStalledError:
+            raise
+        except Exception as e:
+            self._log_warning(f"选择性重编码失败，改为完整压制: {e}")
+            return None
+        self._log_info(
+            f"选择性重编码：{sum(span.encode for span in spans)} 段重编码，"
+            f"{sum(not span.encode for span in spans)} 段直接复制（{copied / info['duration']:.0%} 时长）"
         )
+        if progress_callback:
+            progress_callback(RenderProgress(out_seconds=info["duration"], total_seconds=info["duration"], done=True))
+        return target.output
+
+    def _log_info(self, message: str) -> None:
+        if self.logger:
+            self.logger.info(message)
+
+    def _log_warning(self, message: str) -> None:
+        if self.logger:
+            self.logger.warning(message)
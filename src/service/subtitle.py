@@ -1,25 +1,197 @@
 from __future__ import annotations
 
+import contextvars
+import difflib
 import html
 import json
 import math
+import os
 import re
-import unicodedata
+import statistics
+import sys
+import xml.etree.ElementTree as ET
+import zlib
+from collections.abc import Iterable, Iterator
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import lru_cache, partial
 from pathlib import Path
+from typing import NamedTuple, TextIO, TypeVar
 
+from src.infra.ai_client import llm_stage
+from src.service import text_layout
 
+
+_T = TypeVar("_T")
+# Bump when parsing or caption clean-up changes the cues produced from the same
+# subtitle file; cached segmentations are fingerprinted with it.
+PARSER_VERSION = 2
+_CUE_CACHE_FORMAT = "y2b-cues"
+_CUE_CACHE_VERSION = 1
+_CUE_CACHE_FIELDS = ("start", "end", "text", "translation", "word_starts")
+_CUE_CACHE_BLOCK_SIZE = 1000
 _FILLER_WORDS = {"um", "uh", "er", "erm", "hmm", "mm", "mmm", "yeah", "yep", "yup", "oh", "ah"}
 _EDGE_FILLER_WORDS = {"um", "uh", "er", "erm", "hmm", "mm", "mmm", "yeah", "yep", "yup"}
-
-
-@dataclass
+_CONTINUATION_END_WORDS = frozenset({
+    "a", "an", "the", "of", "to", "in", "on", "at", "for", "with", "as", "by",
+    "and", "or", "but", "if", "when", "while", "that", "which", "who", "from", "into",
+    "we", "can", "could", "would", "should", "will", "our", "your", "their", "this",
+    "these", "those", "is", "are", "was", "were", "be", "being", "been",
+})
+_NEW_SENTENCE_START_WORDS = frozenset({
+    "over", "first", "let's", "there", "this", "what", "now", "turning",
+    "annualized", "lastly", "if", "when", "all", "coming",
+})
+_CONTINUATION_START_WORDS = frozenset({
+    "of", "to", "in", "on", "at", "for", "with", "as", "by", "and", "or", "but",
+    "that", "which", "who", "from", "into", "than", "then", "the", "a", "an", "up",
+    "elements", "asset", "assets", "method", "methods", "function", "data", "frame",
+})
+
+_WORD_RE = re.compile(r"[A-Za-z0-9']+")
+_INLINE_TIMESTAMP_RE = re.compile(r"<\d{2}:\d{2}:\d{2}\.\d{3}>")
+_INLINE_TIMESTAMP_SPLIT_RE = re.compile(r"(<\d{2}:\d{2}:\d{2}\.\d{3}>)")
+# Also matches inline timestamps, so one substitution strips all cue markup.
+_MARKUP_TAG_RE = re.compile(r"<[^>]+>")
+_SENTENCE_END_RE = re.compile(r"[.!?。！？…]['\")\]]*$")
+_CLAUSE_END_RE = re.compile(r"[.,!?;:。，！？；：…]['\")\]]*$")
+_ABBREVIATION_END_RE = re.compile(r"\b(?:mr|mrs|ms|dr|prof|inc|ltd|vs|etc)\.$")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+([,.;:!?])")
+_DEDUPE_KEY_RE = re.compile(r"^[^\w']+|[^\w']+$")
+_HAS_CONTENT_RE = re.compile(r"[A-Za-z0-9\u4e00-\u9fff]")
+_EDGE_FILLER_PATTERN = "|".join(sorted(map(re.escape, _EDGE_FILLER_WORDS), key=len, reverse=True))
+_LEADING_FILLER_RE = re.compile(rf"^(?:{_EDGE_FILLER_PATTERN})(?:[,.!?:;\-–—]+|\s+)+", re.IGNORECASE)
+_TRAILING_FILLER_RE = re.compile(rf"(?:\s+|[,.!?:;\-–—]+)(?:{_EDGE_FILLER_PATTERN})$", re.IGNORECASE)
+_ASR_TERM_REPLACEMENTS = tuple(
+    (re.compile(pattern, re.IGNORECASE), replacement)
+    for pattern, replacement in (
+        (r"\bread\s+CSV\b", "read_csv"),
+        (r"\bdrop\s+n\s+a\b", "dropna"),
+        (r"\btwo\s+period\b", "to_period"),
+        (r"\bDot\s+Plot\b", "plot()"),
+        (r"\by\s+Finance\b", "yfinance"),
+        (r"\bIn-Place\b", "inplace"),
+        (r"\bN\s+A\b", "NA"),
+    )
+)
+
+
+class _LexicalFeatures(NamedTuple):
+    ends_with_continuation: bool
+    starts_with_continuation: bool
+    starts_new_sentence: bool
+    sentence_complete: bool
+    word_count: int
+
+
+@lru_cache(maxsize=65536)
+def _lexical_features(text: str) -> _LexicalFeatures:
+    # The post-passes ask the same questions about the same cue texts many times.
+    words = _WORD_RE.findall(text.lower())
+    stripped = text.strip()
+    sentence_complete = bool(
+        stripped
+        and _SENTENCE_END_RE.search(stripped)
+        # Avoid treating common abbreviations as sentence endings.
+        and not _ABBREVIATION_END_RE.search(stripped.lower())
+    )
+    return _LexicalFeatures(
+        ends_with_continuation=bool(words) and words[-1] in _CONTINUATION_END_WORDS,
+        starts_with_continuation=bool(words) and words[0] in _CONTINUATION_START_WORDS,
+        starts_new_sentence=bool(words) and words[0] in _NEW_SENTENCE_START_WORDS,
+        sentence_complete=sentence_complete,
+        word_count=len(text.split()),
+    )
+
+
+# slots: long livestream tracks hold 100k+ raw cues, and a per-instance __dict__
+# roughly doubles their footprint.
+@dataclass(slots=True)
 class SubtitleCue:
     start: float
     end: float
     text: str
     translation: str | None = None
+    # Start time of each source word, kept when cues are merged from word-timed tokens
+    # (json3 / karaoke VTT). A single-word cue without it simply starts at .start.
+    word_starts: list[float] | None = None
+
+
+@contextmanager
+def _atomic_text_output(path: Path) -> Iterator[TextIO]:
+    """Write through a sibling temp file that replaces path only after a complete, synced write."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        with tmp.open("w", encoding="utf-8", buffering=1 << 16) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _write_cue_block(f: TextIO, cues: list[SubtitleCue]) -> None:
+    lines = [
+        json.dumps([cue.start, cue.end, cue.text, cue.translation, cue.word_starts], ensure_ascii=False, separators=(",", ":"))
+        + "\n"
+        for cue in cues
+    ]
+    crc = 0
+    for line in lines:
+        crc = zlib.crc32(line.encode("utf-8"), crc)
+    # One write per block: a crash mid-append leaves at most a block without its checksum line.
+    f.write("".join(lines) + json.dumps({"count": len(lines), "crc32": f"{crc:08x}"}) + "\n")
+
+
+def _read_cue_cache_header(line: str, *, fingerprints: dict[str, str] | None) -> dict:
+    try:
+        header = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise RuntimeError("字幕缓存格式无效") from e
+    if not isinstance(header, dict) or header.get("format") != _CUE_CACHE_FORMAT:
+        raise RuntimeError("字幕缓存格式无效")
+    if header.get("version") != _CUE_CACHE_VERSION:
+        raise RuntimeError(f"字幕缓存版本不受支持: {header.get('version')}")
+    cached = header.get("fingerprints") or {}
+    changed = [name for name, value in (fingerprints or {}).items() if cached.get(name) != value]
+    if changed:
+        raise RuntimeError(f"字幕缓存已过期（{'、'.join(changed)} 已变化）")
+    return header
+
+
+def _cue_from_record(record: list) -> SubtitleCue:
+    if not isinstance(record, list) or len(record) != len(_CUE_CACHE_FIELDS):
+        raise ValueError(f"字幕缓存条目无效: {record!r}")
+    return SubtitleCue(*record)
+
+
+def _legacy_cached_cues(raw_text: str) -> Iterator[SubtitleCue]:
+    raw = json.loads(raw_text)
+    if not isinstance(raw, list):
+        raise RuntimeError("字幕缓存格式无效")
+    for item in raw:
+        if not isinstance(item, dict):
+            raise RuntimeError("字幕缓存为空或包含无效条目")
+        yield SubtitleCue(**item)
+
+
+def _cue_match_key(text: str) -> str:
+    # Case, punctuation and spacing edits don't change what needs translating.
+    return " ".join(_NON_WORD_RE.split(text.casefold())).strip()
+
+
+def _with_next(items: Iterable[_T]) -> Iterator[tuple[_T, _T | None]]:
+    iterator = iter(items)
+    current = next(iterator, None)
+    while current is not None:
+        nxt = next(iterator, None)
+        yield current, nxt
+        current = nxt
 
 
 class SubtitleService:
@@ -27,33 +199,196 @@ class SubtitleService:
         self.config = config
         self.translator = translator
         self.logger = logger
+        self._clean_text_cache: dict[str, str] = {}
 
     def parse(self, path: str | Path) -> list[SubtitleCue]:
+        return list(self.iter_cues(path))
+
+    def iter_cues(self, path: str | Path) -> Iterator[SubtitleCue]:
+        """Yield parsed cues one by one while reading the file line by line."""
         path = Path(path)
-        if path.suffix.lower() == ".srt":
-            return self._parse_srt(path)
-        return self._parse_vtt(path)
+        suffix = path.suffix.lower()
+        if suffix == ".json3":
+            yield from self._dedupe_rolling_cues(self._iter_timed_events(self._json3_events(path)))
+            return
+        if suffix == ".srv3":
+            yield from self._dedupe_rolling_cues(self._iter_timed_events(self._srv3_events(path)))
+            return
+        # Universal newlines turn \r\n and bare \r into \n, like the old whole-file replace.
+        with path.open("r", encoding="utf-8", errors="ignore") as f:
+            lines = (line.rstrip("\n") for line in f)
+            if suffix == ".srt":
+                yield from self._dedupe_rolling_cues(self._iter_srt(lines))
+            else:
+                yield from self._dedupe_rolling_cues(self._iter_vtt(lines))
+
+    def save_cues(
+        self,
+        cues: Iterable[SubtitleCue],
+        path: str | Path,
+        *,
+        fingerprints: dict[str, str] | None = None,
+    ) -> Path:
+        """Write a cue cache: a header line, then checksummed blocks of one JSON array per cue.
 
-    def save_cues(self, cues: list[SubtitleCue], path: str | Path) -> Path:
+        fingerprints names the inputs the cues were derived from (source file,
+        parser, prompts, model...); load_cues() refuses the cache when any of
+        the fingerprints it is given differs.
+        """
         output = Path(path)
-        output.parent.mkdir(parents=True, exist_ok=True)
-        output.write_text(
-            json.dumps([cue.__dict__ for cue in cues], ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        with _atomic_text_output(output) as f:
+            header = {"format": _CUE_CACHE_FORMAT, "version": _CUE_CACHE_VERSION, "fingerprints": fingerprints or {}}
+            f.write(json.dumps({**header, "fields": _CUE_CACHE_FIELDS}, ensure_ascii=False) + "\n")
+            block: list[SubtitleCue] = []
+            for cue in cues:
+                block.append(cue)
+                if len(block) >= _CUE_CACHE_BLOCK_SIZE:
+                    _write_cue_block(f, block)
+                    block = []
+            if block:
+                _write_cue_block(f, block)
         return output
 
-    def load_cues(self, path: str | Path) -> list[SubtitleCue]:
-        raw = json.loads(Path(path).read_text(encoding="utf-8"))
-        if not isinstance(raw, list):
-            raise RuntimeError("字幕缓存格式无效")
-        cues = [SubtitleCue(**item) for item in raw if isinstance(item, dict)]
-        if len(cues) != len(raw) or not cues:
+    def append_cues(self, cues: list[SubtitleCue], path: str | Path) -> None:
+        """Append one checksummed block, e.g. a finished translation batch, to an existing cache."""
+        cache = Path(path)
+        with cache.open("r", encoding="utf-8") as f:
+            _read_cue_cache_header(f.readline(), fingerprints=None)
+        if not cues:
+            return
+        with cache.open("a", encoding="utf-8") as f:
+            _write_cue_block(f, cues)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def iter_cached_cues(self, path: str | Path, *, fingerprints: dict[str, str] | None = None) -> Iterator[SubtitleCue]:
+        """Stream cues from a cache, validating each block's checksum before yielding it.
+
+        Legacy caches (one indented JSON array) carry no fingerprints and are
+        only accepted when none are required. A trailing
+        block without its checksum line is an interrupted append and is dropped.
+        """
+        with Path(path).open("r", encoding="utf-8") as f:
+            first = f.readline()
+            if first.lstrip().startswith("["):
+                if fingerprints:
+                    raise RuntimeError("旧版字幕缓存没有输入指纹，无法确认是否过期")
+                yield from _legacy_cached_cues(first + f.read())
+                return
+            _read_cue_cache_header(first, fingerprints=fingerprints)
+            pending: list[str] = []
+            crc = 0
+            for line in f:
+                if line.startswith("["):
+                    pending.append(line)
+                    crc = zlib.crc32(line.encode("utf-8"), crc)
+                elif line.strip():
+                    block = json.loads(line)
+                    if not isinstance(block, dict) or block.get("count") != len(pending) or block.get("crc32") != f"{crc:08x}":
+                        raise RuntimeError("字幕缓存校验失败")
+                    # One parse per block instead of one per line.
+                    for record in json.loads(f"[{','.join(pending)}]"):
+                        yield _cue_from_record(record)
+                    pending = []
+                    crc = 0
+            if pending and self.logger:
+                self.logger.warning(f"字幕缓存末尾有未完成的追加批次，已忽略 {len(pending)} 条: {path}")
+
+    def load_cues(self, path: str | Path, *, fingerprints: dict[str, str] | None = None) -> list[SubtitleCue]:
+        try:
+            cues = list(self.iter_cached_cues(path, fingerprints=fingerprints))
+        except (TypeError, ValueError) as e:
+            # json.JSONDecodeError is a ValueError; bad records raise TypeError.
+            raise RuntimeError(f"字幕缓存格式无效: {e}") from e
+        if not cues:
             raise RuntimeError("字幕缓存为空或包含无效条目")
         return cues
 
-    def segment_cues(self, cues: list[SubtitleCue], *, source_lang: str) -> list[SubtitleCue]:
-        return self._segment_cues_with_deepseek(cues, source_lang=source_lang)
+    def segment_cues(
+        self,
+        cues: list[SubtitleCue],
+        *,
+        source_lang: str,
+        target_lang: str | None = None,
+        track_kind: str | None = None,
+    ) -> list[SubtitleCue]:
+        """Group caption tokens into sentence-like cues.
+
+        With translation.fused_segment_translation enabled and a target_lang given,
+        each batch asks for ranges and translations in one call; the returned cues
+        then already carry translations and translate_segmented_cues() only fills
+        the ones that post-processing merged or split.
+
+        track_kind is "manual", "asr" or None (unknown); ASR tracks never take
+        the rule segmentation fast path.
+        """
+        fused_target = target_lang if self.config.translation.fused_segment_translation else None
+        return self._segment_cues_with_deepseek(
+            cues, source_lang=source_lang, target_lang=fused_target, track_kind=track_kind
+        )
+
+    def iter_translated_windows(
+        self,
+        cues: Iterable[SubtitleCue],
+        *,
+        source_lang: str,
+        target_lang: str,
+        window_seconds: float,
+        overlap_seconds: float = 60.0,
+        track_kind: str | None = None,
+        resume_after: float | None = None,
+    ) -> Iterator[list[SubtitleCue]]:
+        """Segment and translate a long track one time window at a time.
+
+        Only one window of raw cues is held at once. A window is closed at a
+        natural break inside its last overlap_seconds (a sentence end, else the
+        longest pause); the raw cues after that break open the next window, so
+        no sentence is segmented without the words that follow it.
+
+        Window boundaries depend only on the raw cues, so an interrupted run can
+        pass the start of its last translated cue as resume_after: windows that
+        begin at or before it were already done and are skipped without a call.
+        """
+        buffer: list[SubtitleCue] = []
+        for cue in cues:
+            if buffer and cue.start >= buffer[0].start + window_seconds:
+                split = self._window_break(buffer, overlap_seconds=overlap_seconds)
+                window, buffer = buffer[:split], buffer[split:]
+                if resume_after is None or window[0].start > resume_after:
+                    yield self._segment_and_translate_window(
+                        window, source_lang=source_lang, target_lang=target_lang, track_kind=track_kind
+                    )
+            buffer.append(cue)
+        if buffer and (resume_after is None or buffer[0].start > resume_after):
+            yield self._segment_and_translate_window(
+                buffer, source_lang=source_lang, target_lang=target_lang, track_kind=track_kind
+            )
+
+    def _window_break(self, buffer: list[SubtitleCue], *, overlap_seconds: float) -> int:
+        """Index of the first raw cue of the next window; always leaves a non-empty window."""
+        zone_start = buffer[-1].end - overlap_seconds
+        first = next((idx for idx, cue in enumerate(buffer) if idx > 0 and cue.start >= zone_start), len(buffer))
+        for idx in range(len(buffer) - 1, first - 1, -1):
+            if _SENTENCE_END_RE.search(buffer[idx - 1].text):
+                return idx
+        if first >= len(buffer):
+            return len(buffer)
+        return max(range(first, len(buffer)), key=lambda idx: buffer[idx].start - buffer[idx - 1].end)
+
+    def _segment_and_translate_window(
+        self,
+        window: list[SubtitleCue],
+        *,
+        source_lang: str,
+        target_lang: str,
+        track_kind: str | None = None,
+    ) -> list[SubtitleCue]:
+        if self.logger:
+            self.logger.info(
+                f"分窗处理 {self._ass_time(window[0].start)} - {self._ass_time(window[-1].end)}: {len(window)} 条原始字幕"
+            )
+        segmented = self.segment_cues(window, source_lang=source_lang, target_lang=target_lang, track_kind=track_kind)
+        return self.translate_segmented_cues(segmented, source_lang=source_lang, target_lang=target_lang)
 
     def translate_segmented_cues(
         self,
@@ -64,7 +399,9 @@ class SubtitleService:
     ) -> list[SubtitleCue]:
         batch_size = max(1, int(self.config.translation.subtitle_batch_size))
         concurrency = int(self.config.translation.subtitle_concurrency)
-        batches = [cues[i : i + batch_size] for i in range(0, len(cues), batch_size)]
+        # Cues translated during fused segmentation keep their translation.
+        pending = [cue for cue in cues if cue.translation is None]
+        batches = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
         translated_total = 0
         if concurrency <= 1 or len(batches) <= 1:
             translated_batches = [
@@ -73,8 +410,16 @@ class SubtitleService:
             ]
         else:
             with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+                # Each worker runs in a copy of this context so the run's usage listener follows it.
                 futures = [
-                    pool.submit(self._translate_one_batch, i, batch, source_lang=source_lang, target_lang=target_lang)
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        self._translate_one_batch,
+                        i,
+                        batch,
+                        source_lang=source_lang,
+                        target_lang=target_lang,
+                    )
                     for i, batch in enumerate(batches)
                 ]
                 translated_batches = [future.result() for future in futures]
@@ -84,9 +429,67 @@ class SubtitleService:
                 translated_total += 1
         self._repair_missing_translations(cues, source_lang=source_lang, target_lang=target_lang)
         if self.logger:
+            reused = len(cues) - len(pending)
+            if reused:
+                self.logger.info(f"复用已有译文（分句阶段或增量缓存）: {reused} 条")
             self.logger.info(f"字幕翻译完成，共 {translated_total} 条")
         return cues
 
+    def reuse_translations(
+        self,
+        cues: list[SubtitleCue],
+        previous: list[SubtitleCue],
+        *,
+        context: int = 1,
+        max_time_drift: float = 1.5,
+    ) -> int:
+        """Copy translations from a previous translated cache onto unchanged cues.
+
+        Cues are aligned by normalized text in order; a text match only counts if
+        its time offset stays within max_time_drift of the typical offset, so a
+        globally shifted track still matches. Cues within ``context`` positions
+        of an added or changed cue are left untranslated too, so the LLM sees
+        the edited span with its neighbours. Returns the number of cues reused.
+        """
+        if not cues or not previous:
+            return 0
+        matcher = difflib.SequenceMatcher(
+            None,
+            [_cue_match_key(cue.text) for cue in previous],
+            [_cue_match_key(cue.text) for cue in cues],
+            autojunk=False,
+        )
+        pairs = [
+            (old_idx + k, new_idx + k)
+            for old_idx, new_idx, size in matcher.get_matching_blocks()
+            for k in range(size)
+        ]
+        if not pairs:
+            return 0
+        offset = statistics.median(cues[new].start - previous[old].start for old, new in pairs)
+        matched: dict[int, str] = {}
+        for old, new in pairs:
+            translation = previous[old].translation
+            if abs(cues[new].start - previous[old].start - offset) > max_time_drift:
+                continue
+            # A translation equal to the source is the fallback for a failed batch, not a result.
+            if translation and translation.strip() and translation != previous[old].text:
+                matched[new] = translation
+
+        changed = [idx for idx in range(len(cues)) if idx not in matched]
+        for idx in changed:
+            for near in range(max(0, idx - context), min(len(cues), idx + context + 1)):
+                matched.pop(near, None)
+        reused = 0
+        for idx, translation in matched.items():
+            if cues[idx].translation is None:
+                cues[idx].translation = translation
+                reused += 1
+        if self.logger:
+            pending = sum(1 for cue in cues if cue.translation is None)
+            self.logger.info(f"增量翻译：复用 {reused} 条已有译文，{pending} 条需要重新翻译")
+        return reused
+
     def _repair_missing_translations(self, cues: list[SubtitleCue], *, source_lang: str, target_lang: str) -> None:
         """Retry single lines that came back empty despite having real content.
 
@@ -100,13 +503,16 @@ class SubtitleService:
             return
         if self.logger:
             self.logger.warning(f"检测到 {len(suspects)} 条疑似翻译缺失/错位，正在逐条补译")
-        for cue in suspects:
-            try:
-                [fixed] = self._translate_lines_resilient([cue.text], source_lang=source_lang, target_lang=target_lang)
-                cue.translation = fixed
-            except Exception as e:
-                if self.logger:
-                    self.logger.warning(f"补译失败，保留空翻译: {cue.text!r}: {e}")
+        with llm_stage("repair"):
+            for cue in suspects:
+                try:
+                    [fixed] = self._translate_lines_resilient(
+                        [cue.text], source_lang=source_lang, target_lang=target_lang
+                    )
+                    cue.translation = fixed
+                except Exception as e:
+                    if self.logger:
+                        self.logger.warning(f"补译失败，保留空翻译: {cue.text!r}: {e}")
 
     def _looks_translatable(self, text: str) -> bool:
         words = re.findall(r"[A-Za-z']+", text.lower())
@@ -133,14 +539,20 @@ class SubtitleService:
 
     def write_bilingual_ass(
         self,
-        cues: list[SubtitleCue],
+        cues: Iterable[SubtitleCue],
         output_path: str | Path,
         *,
         width: int,
         height: int,
     ) -> Path:
         output = Path(output_path)
-        output.parent.mkdir(parents=True, exist_ok=True)
+        # The render manifest hashes this file, so it must never exist half-written.
+        with _atomic_text_output(output) as f:
+            self.stream_bilingual_ass(cues, f, width=width, height=height)
+        return output
+
+    def stream_bilingual_ass(self, cues: Iterable[SubtitleCue], sink: TextIO, *, width: int, height: int) -> int:
+        """Lay out cues one at a time and write ASS to sink; returns the number of Dialogue lines."""
         style = self.config.subtitle_style
         cn_size = max(24, round(height * style.cn_font_ratio))
         en_size = max(16, round(height * style.en_font_ratio))
@@ -170,7 +582,8 @@ Style: EN,{style.font_en},{en_size},&H00FFFFFF,&H000000FF,&H00000000,&HAA000000,
 [Events]
 Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 """
-        lines = [header]
+        sink.write(header)
+        dialogues = 0
         cn_max_width = self._subtitle_max_display_width(width, cn_size, language="cjk")
         en_max_width = self._subtitle_max_display_width(width, en_size, language="latin")
         for cue in cues:
@@ -196,11 +609,12 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 )
                 cn = r"{\q2}" + self._ass_escape(cn_text)
                 en = self._ass_escape(en_wrapped)
-                lines.append(f"Dialogue: 1,{start},{end},CN,,0,0,{cn_margin},,{cn}\n")
-                lines.append(f"Dialogue: 0,{start},{end},EN,,0,0,{en_margin},,{en}\n")
-
-        output.write_text("".join(lines), encoding="utf-8")
-        return output
+                sink.write(
+                    f"Dialogue: 1,{start},{end},CN,,0,0,{cn_margin},,{cn}\n"
+                    f"Dialogue: 0,{start},{end},EN,,0,0,{en_margin},,{en}\n"
+                )
+                dialogues += 2
+        return dialogues
 
     def _split_cue_for_single_line_cn(self, cue: SubtitleCue, *, max_chars: int) -> list[SubtitleCue]:
         cn_text = re.sub(r"\s+", " ", (cue.translation or cue.text or "").strip())
@@ -219,6 +633,9 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             return [cue]
 
         en_parts = self._split_text_for_parallel_cues(cue.text, len(cn_parts))
+        cuts = None
+        if len(en_parts) == len(cn_parts) and all(en_parts) and " ".join(en_parts).split() == cue.text.split():
+            cuts = self._word_boundary_cuts(cue, self._part_word_bounds(en_parts), min_duration=min_part_duration)
         weights = [max(1, self._display_width(part)) for part in cn_parts]
         total_weight = sum(weights)
         result: list[SubtitleCue] = []
@@ -226,6 +643,9 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         for index, (cn_part, weight) in enumerate(zip(cn_parts, weights, strict=True)):
             if index == len(cn_parts) - 1:
                 current_end = cue.end
+            elif cuts:
+                # Switch lines when the matching English words are spoken.
+                current_end = cuts[index]
             else:
                 current_end = current_start + duration * weight / total_weight
                 current_end = min(cue.end, max(current_start + min_part_duration, current_end))
@@ -254,72 +674,147 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             return [*text_parts[: parts - 1], " ".join(text_parts[parts - 1 :]).strip()]
         return [*text_parts, *[""] * (parts - len(text_parts))]
 
-    def _parse_vtt(self, path: Path) -> list[SubtitleCue]:
-        text = path.read_text(encoding="utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
-        lines = text.split("\n")
-        cues: list[SubtitleCue] = []
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip("\ufeff ")
+    def _iter_vtt(self, lines: Iterator[str]) -> Iterator[SubtitleCue]:
+        pending: str | None = None
+        while True:
+            if pending is not None:
+                raw, pending = pending, None
+            else:
+                raw = next(lines, None)
+                if raw is None:
+                    return
+            line = raw.strip("\ufeff ")
             if not line or line == "WEBVTT" or line.startswith(("NOTE", "STYLE", "REGION")):
-                i += 1
                 continue
-            if "-->" not in line and i + 1 < len(lines) and "-->" in lines[i + 1]:
-                i += 1
-                line = lines[i].strip()
             if "-->" not in line:
-                i += 1
-                continue
+                # A cue identifier line is followed by the timing line.
+                pending = next(lines, None)
+                if pending is None or "-->" not in pending:
+                    continue
+                line, pending = pending.strip(), None
             start, end = self._parse_time_range(line)
-            i += 1
             # YouTube VTT may put a whitespace-only line immediately after the timing line.
             # Treat leading blank lines as cue padding, not as cue terminators.
-            while i < len(lines) and not lines[i].strip():
-                i += 1
             body: list[str] = []
-            while i < len(lines) and lines[i].strip():
-                body.append(lines[i].strip())
-                i += 1
+            for raw in lines:
+                row = raw.strip()
+                if row:
+                    body.append(row)
+                elif body:
+                    break
             raw_body = self._pick_vtt_body_text(body)
-            if re.search(r"<\d{2}:\d{2}:\d{2}\.\d{3}>", raw_body):
-                for timed_cue in self._split_timed_vtt_cue(start, end, raw_body):
-                    self._append_cue(cues, timed_cue)
+            if _INLINE_TIMESTAMP_RE.search(raw_body):
+                yield from self._split_timed_vtt_cue(start, end, raw_body)
             else:
                 clean = self._clean_text(raw_body)
                 if clean and (end - start) >= 0.2:
-                    self._append_cue(cues, SubtitleCue(start=start, end=end, text=clean))
-            i += 1
-        return cues
+                    yield SubtitleCue(start=start, end=end, text=clean)
 
-    def _segment_cues_with_deepseek(self, cues: list[SubtitleCue], *, source_lang: str) -> list[SubtitleCue]:
+    def _segment_cues_with_deepseek(
+        self,
+        cues: list[SubtitleCue],
+        *,
+        source_lang: str,
+        target_lang: str | None = None,
+        track_kind: str | None = None,
+    ) -> list[SubtitleCue]:
         if not cues:
             return []
         cues = self._trim_unusually_long_cues(cues)
         batch_size = int(self.config.translation.segmentation_batch_size)
         concurrency = int(self.config.translation.segmentation_concurrency)
         batches = [(offset, cues[offset : offset + batch_size]) for offset in range(0, len(cues), batch_size)]
+        if target_lang:
+            llm_segment_batch = partial(self._segment_translate_one_batch, source_lang=source_lang, target_lang=target_lang)
+        else:
+            llm_segment_batch = partial(self._segment_one_batch, source_lang=source_lang)
+        # Well-punctuated regions (typically uploader-provided tracks) are segmented locally.
+        rule_batches = {
+            idx for idx, (_, batch) in enumerate(batches) if self._prefers_rule_segmentation(batch, track_kind=track_kind)
+        }
+        if self.logger and rule_batches:
+            self.logger.info(f"规则分句快速路径: {len(rule_batches)}/{len(batches)} 个批次无需调用 LLM")
+
+        def segment_batch(idx: int, batch: list[SubtitleCue]) -> list[SubtitleCue]:
+            if idx in rule_batches:
+                return self._merge_sentence_fragments(batch)
+            return llm_segment_batch(idx, batch)
+
         if concurrency <= 1 or len(batches) <= 1:
-            segmented_batches = [self._segment_one_batch(idx, batch, source_lang=source_lang) for idx, (_, batch) in enumerate(batches)]
+            segmented_batches = [segment_batch(idx, batch) for idx, (_, batch) in enumerate(batches)]
         else:
             with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
                 futures = [
-                    pool.submit(self._segment_one_batch, idx, batch, source_lang=source_lang)
+                    pool.submit(contextvars.copy_context().run, segment_batch, idx, batch)
                     for idx, (_, batch) in enumerate(batches)
                 ]
                 segmented_batches = [future.result() for future in futures]
         segmented: list[SubtitleCue] = []
         for grouped in segmented_batches:
             segmented.extend(grouped)
-        segmented = self._repair_continuation_boundaries(segmented)
-        segmented = self._close_short_gaps(segmented)
-        segmented = self._trim_unusually_long_cues(segmented)
-        segmented = self._merge_orphan_short_cues(segmented)
-        segmented = self._clean_filler_cues(segmented)
-        segmented = self._close_short_gaps(segmented)
+        segmented = self._post_process_segmented(segmented)
         if self.logger:
             self.logger.info(f"DeepSeek 智能分句完成: {len(cues)} -> {len(segmented)} 条")
         return segmented
 
+    def _post_process_segmented(self, segmented: list[SubtitleCue]) -> list[SubtitleCue]:
+        """Run the post-segmentation clean-up rules.
+
+        Continuation repair iterates to a fixpoint over the whole list first.
+        The other five stages (gap closing, long-cue trimming, orphan merging,
+        filler cleanup, then gap closing again) are chained generators with at
+        most one cue of look-ahead or look-behind each: they are pulled through
+        together without building intermediate lists, but every stage still
+        visits every cue. The output matches running the stages one after
+        another over full lists.
+        """
+        segmented = self._repair_continuation_boundaries(segmented)
+        stream = self._iter_close_short_gaps(segmented)
+        stream = self._iter_trim_unusually_long_cues(stream)
+        stream = self._iter_merge_orphan_short_cues(stream)
+        stream = self._iter_clean_filler_cues(stream)
+        stream = self._iter_close_short_gaps(stream)
+        return list(stream)
+
+    def _prefers_rule_segmentation(self, cues: list[SubtitleCue], *, track_kind: str | None = None) -> bool:
+        cfg = self.config.translation
+        if not cfg.rule_segmentation or track_kind == "asr":
+            return False
+        return self._rule_segmentation_confidence(cues) >= cfg.rule_segmentation_min_confidence
+
+    def _rule_segmentation_confidence(self, cues: list[SubtitleCue]) -> float:
+        """Estimate how safely a region can be segmented without the LLM (0..1).
+
+        Uploader-provided tracks carry real sentence punctuation and cue-sized
+        lines; ASR tracks have almost no terminal punctuation, long unpunctuated
+        runs and word-sized cues, so they score near zero.
+        """
+        word_counts = [len(cue.text.split()) for cue in cues]
+        total_words = sum(word_counts)
+        if not cues or total_words == 0:
+            return 0.0
+
+        terminal_marks = 0
+        longest_run = 0
+        run = 0
+        for cue in cues:
+            for word in cue.text.split():
+                run += 1
+                if _SENTENCE_END_RE.search(word):
+                    terminal_marks += 1
+                    longest_run = max(longest_run, run)
+                    run = 0
+        longest_run = max(longest_run, run)
+        punctuated_ends = sum(1 for cue in cues if _CLAUSE_END_RE.search(cue.text.strip()))
+
+        # About one sentence end per 20 words is the floor for real punctuation.
+        density_score = min(1.0, terminal_marks / total_words / 0.05)
+        run_score = min(1.0, 40 / longest_run)
+        ends_score = min(1.0, punctuated_ends / len(cues) / 0.5)
+        durations = [cue.end - cue.start for cue in cues]
+        length_score = 1.0 if statistics.median(word_counts) >= 3 and statistics.median(durations) >= 1.0 else 0.0
+        return min(density_score, run_score) * (0.5 + 0.25 * ends_score + 0.25 * length_score)
+
     def _segment_one_batch(self, batch_index: int, batch: list[SubtitleCue], *, source_lang: str) -> list[SubtitleCue]:
         if self.logger:
             self.logger.info(f"分句批次 {batch_index + 1}: {len(batch)} 个字幕 token")
@@ -334,13 +829,46 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 self.logger.warning(f"智能分句失败，使用规则分句回退: {e}")
             return self._merge_sentence_fragments(batch)
 
-    def _apply_ai_ranges(self, cues: list[SubtitleCue], ranges: list[dict[str, int]]) -> list[SubtitleCue]:
+    def _segment_translate_one_batch(
+        self,
+        batch_index: int,
+        batch: list[SubtitleCue],
+        *,
+        source_lang: str,
+        target_lang: str,
+    ) -> list[SubtitleCue]:
+        if self.logger:
+            self.logger.info(f"分句翻译批次 {batch_index + 1}: {len(batch)} 个字幕 token")
+        try:
+            segments = self.translator.segment_and_translate_batch(
+                [cue.text for cue in batch],
+                source_lang=source_lang,
+                target_lang=target_lang,
+            )
+            return self._apply_ai_ranges(batch, segments, translations=[str(item["text"]) for item in segments])
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"分句翻译合并调用失败，该批次回退为先分句后翻译: {e}")
+            return self._segment_one_batch(batch_index, batch, source_lang=source_lang)
+
+    def _apply_ai_ranges(
+        self,
+        cues: list[SubtitleCue],
+        ranges: list[dict[str, int]],
+        *,
+        translations: list[str] | None = None,
+    ) -> list[SubtitleCue]:
+        """Turn validated token ranges into cues.
+
+        translations, when given, are aligned with ranges; a range that has to be
+        re-split for length keeps translation=None so it is translated afterwards.
+        """
         if not ranges:
             raise RuntimeError("分句返回空结果")
         result: list[SubtitleCue] = []
         expected_start = 0
         last_index = len(cues) - 1
-        for item in ranges:
+        for range_index, item in enumerate(ranges):
             start = int(item["start"])
             end = int(item["end"])
             if start != expected_start or end < start or end > last_index:
@@ -356,6 +884,8 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                         start=group[0].start,
                         end=group[-1].end,
                         text=text,
+                        translation=translations[range_index] if translations is not None else None,
+                        word_starts=self._group_word_starts(group),
                     )
                 )
             expected_start = end + 1
@@ -386,6 +916,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                             start=current.start,
                             end=nxt.end,
                             text=merged_text,
+                            word_starts=self._group_word_starts([current, nxt]),
                         )
                         repaired.append(merged)
                         i += 2
@@ -412,7 +943,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         max_words = 15
 
         merged: list[SubtitleCue] = []
-        current = SubtitleCue(start=cues[0].start, end=cues[0].end, text=cues[0].text)
+        current = SubtitleCue(start=cues[0].start, end=cues[0].end, text=cues[0].text, word_starts=self._word_starts(cues[0]))
 
         for cue in cues[1:]:
             gap = cue.start - current.end
@@ -440,9 +971,10 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             if should_merge:
                 current.end = max(current.end, cue.end)
                 current.text = self._clean_caption_text(combined_text)
+                current.word_starts = self._group_word_starts([current, cue])
                 continue
             merged.append(current)
-            current = SubtitleCue(start=cue.start, end=cue.end, text=cue.text)
+            current = SubtitleCue(start=cue.start, end=cue.end, text=cue.text, word_starts=self._word_starts(cue))
 
         merged.append(current)
         if self.logger and len(merged) != len(cues):
@@ -455,16 +987,19 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         If two subtitles are separated by only a very short gap, extend the previous
         subtitle to the next subtitle's start time so the screen transitions directly.
         """
-        if len(cues) < 2:
-            return cues
+        return list(self._iter_close_short_gaps(cues))
+
+    def _iter_close_short_gaps(self, cues: Iterable[SubtitleCue]) -> Iterator[SubtitleCue]:
         threshold = 0.30
-        for prev, nxt in zip(cues, cues[1:]):
-            gap = nxt.start - prev.end
-            if 0 <= gap <= threshold:
-                prev.end = nxt.start
-            elif -threshold <= gap < 0:
-                prev.end = nxt.start
-        return cues
+        prev: SubtitleCue | None = None
+        for cue in cues:
+            if prev is not None:
+                if -threshold <= cue.start - prev.end <= threshold:
+                    prev.end = cue.start
+                yield prev
+            prev = cue
+        if prev is not None:
+            yield prev
 
     def _merge_orphan_short_cues(self, cues: list[SubtitleCue]) -> list[SubtitleCue]:
         """Attach tiny trailing fragments to adjacent subtitles.
@@ -473,38 +1008,42 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         e.g. "games incredible" + "story".  If a very short cue touches the
         previous cue and the combined line is still modest, merge it back.
         """
-        if len(cues) < 2:
-            return cues
+        return list(self._iter_merge_orphan_short_cues(cues))
 
-        merged: list[SubtitleCue] = []
+    def _iter_merge_orphan_short_cues(self, cues: Iterable[SubtitleCue]) -> Iterator[SubtitleCue]:
+        prev: SubtitleCue | None = None
         changed = 0
         for cue in cues:
-            if not merged:
-                merged.append(cue)
+            if prev is None:
+                prev = cue
                 continue
 
-            prev = merged[-1]
             gap = cue.start - prev.end
-            cue_words = re.findall(r"[A-Za-z0-9']+", cue.text)
-            combined_text = self._clean_caption_text(f"{prev.text} {cue.text}".strip())
-            combined_duration = cue.end - prev.start
+            # Cheap checks first; the cleaned combined text is only needed for candidates.
             should_attach_to_prev = (
                 0 <= gap <= 0.35
-                and len(cue_words) <= 2
+                and len(_WORD_RE.findall(cue.text)) <= 2
+                and cue.end - prev.start <= 7.0
                 and not self._looks_sentence_complete(prev.text)
-                and len(combined_text.split()) <= 18
-                and combined_duration <= 7.0
             )
             if should_attach_to_prev:
+                combined_text = self._clean_caption_text(f"{prev.text} {cue.text}".strip())
+                should_attach_to_prev = len(combined_text.split()) <= 18
+            if should_attach_to_prev:
+                prev.word_starts = self._group_word_starts([prev, cue])
                 prev.end = cue.end
                 prev.text = combined_text
+                # The old translation no longer covers the attached words.
+                prev.translation = None
                 changed += 1
                 continue
-            merged.append(cue)
+            yield prev
+            prev = cue
 
+        if prev is not None:
+            yield prev
         if self.logger and changed:
             self.logger.info(f"已合并孤立短字幕: {changed} 条")
-        return merged
 
     def _trim_unusually_long_cues(self, cues: list[SubtitleCue]) -> list[SubtitleCue]:
         """Shorten or split captions that are too long for comfortable reading.
@@ -515,16 +1054,15 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         segmentation, also split very dense long cues on word boundaries so a single
         subtitle does not stay on screen for 8-10 seconds.
         """
-        if not cues:
-            return []
+        return list(self._iter_trim_unusually_long_cues(cues))
 
-        trimmed: list[SubtitleCue] = []
+    def _iter_trim_unusually_long_cues(self, cues: Iterable[SubtitleCue]) -> Iterator[SubtitleCue]:
         trim_changed = 0
         split_changed = 0
-        for idx, cue in enumerate(cues):
+        for cue, nxt in _with_next(cues):
             duration = cue.end - cue.start
             if duration <= 0:
-                trimmed.append(cue)
+                yield cue
                 continue
 
             candidate = cue
@@ -532,8 +1070,8 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             trigger_duration = max(6.0, reasonable_duration * 1.8, reasonable_duration + 1.5)
             if duration > trigger_duration:
                 new_end = cue.start + reasonable_duration
-                if idx + 1 < len(cues) and cues[idx + 1].start > cue.start:
-                    new_end = min(new_end, cues[idx + 1].start)
+                if nxt is not None and nxt.start > cue.start:
+                    new_end = min(new_end, nxt.start)
                 new_end = max(cue.start + 0.35, min(new_end, cue.end))
                 if new_end < cue.end - 0.25:
                     candidate = SubtitleCue(
@@ -541,20 +1079,20 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                         end=new_end,
                         text=cue.text,
                         translation=cue.translation,
+                        word_starts=cue.word_starts,
                     )
                     trim_changed += 1
 
             split = self._split_overlong_cue(candidate)
             if len(split) > 1:
                 split_changed += 1
-            trimmed.extend(split)
+            yield from split
 
         if self.logger:
             if trim_changed:
                 self.logger.info(f"已修剪异常超长字幕: {trim_changed} 条")
             if split_changed:
                 self.logger.info(f"已拆分过长字幕: {split_changed} 条")
-        return trimmed
 
     def _split_overlong_cue(self, cue: SubtitleCue) -> list[SubtitleCue]:
         duration = cue.end - cue.start
@@ -578,13 +1116,71 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             return [cue]
 
         part_count = len(text_parts)
+        word_bounds = self._part_word_bounds(text_parts) if words and len(words) >= parts * 3 else None
+        cuts = self._word_boundary_cuts(cue, word_bounds, min_duration=0.35) if word_bounds else None
         result: list[SubtitleCue] = []
         for i, part_text in enumerate(text_parts):
+            if cuts:
+                # Cut where the words were actually spoken.
+                start = cue.start if i == 0 else cuts[i - 1]
+                end = cue.end if i == part_count - 1 else cuts[i]
+                first, last = word_bounds[i], word_bounds[i + 1]
+                part_starts = [self._word_time(cue, k) for k in range(first, last)]
+                result.append(SubtitleCue(start=start, end=end, text=part_text, word_starts=part_starts))
+                continue
             start = cue.start + duration * i / part_count
             end = cue.start + duration * (i + 1) / part_count
-            result.append(SubtitleCue(start=start, end=end, text=part_text, translation=cue.translation))
+            result.append(SubtitleCue(start=start, end=end, text=part_text))
         return result
 
+    def _word_starts(self, cue: SubtitleCue) -> list[float] | None:
+        if cue.word_starts:
+            return cue.word_starts
+        if len(cue.text.split()) == 1:
+            return [cue.start]
+        return None
+
+    def _group_word_starts(self, cues: list[SubtitleCue]) -> list[float] | None:
+        # Only keep timings when every word's start is actually known.
+        starts: list[float] = []
+        for cue in cues:
+            cue_starts = self._word_starts(cue)
+            if cue_starts is None:
+                return None
+            starts.extend(cue_starts)
+        return starts
+
+    def _word_time(self, cue: SubtitleCue, word_index: int) -> float:
+        """Start time of the word at word_index in cue.text.
+
+        Text clean-up (deduping, filler stripping, ASR term fixes) can change the
+        word count after timings were collected; indices are then mapped
+        proportionally onto the recorded word starts.
+        """
+        starts = cue.word_starts
+        count = len(cue.text.split())
+        if not starts or not count:
+            return cue.start
+        if len(starts) != count:
+            word_index = round(word_index * len(starts) / count)
+        return min(max(starts[min(word_index, len(starts) - 1)], cue.start), cue.end)
+
+    def _part_word_bounds(self, parts: list[str]) -> list[int]:
+        bounds = [0]
+        for part in parts:
+            bounds.append(bounds[-1] + len(part.split()))
+        return bounds
+
+    def _word_boundary_cuts(self, cue: SubtitleCue, word_bounds: list[int], *, min_duration: float) -> list[float] | None:
+        # Only cues carrying real per-word timings (json3 / karaoke VTT merges) get word cuts.
+        if not cue.word_starts:
+            return None
+        cuts = [self._word_time(cue, bound) for bound in word_bounds[1:-1]]
+        edges = [cue.start, *cuts, cue.end]
+        if any(right - left < min_duration for left, right in zip(edges, edges[1:])):
+            return None
+        return cuts
+
     def _split_words_evenly(self, words: list[str], parts: int) -> list[str]:
         boundaries: list[int] = []
         for i in range(1, parts):
@@ -619,24 +1215,22 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         return max(1.2, compact_chars * 0.12 + 0.8)
 
     def _clean_caption_text(self, text: str) -> str:
-        text = self._dedupe_repeated_words(text)
-        text = self._strip_edge_fillers(text)
-        text = self._normalize_asr_terms(text)
-        text = re.sub(r"\s+([,.;:!?])", r"\1", text)
-        return re.sub(r"\s+", " ", text).strip()
+        cached = self._clean_text_cache.get(text)
+        if cached is not None:
+            return cached
+        cleaned = self._dedupe_repeated_words(text)
+        cleaned = self._strip_edge_fillers(cleaned)
+        cleaned = self._normalize_asr_terms(cleaned)
+        cleaned = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", cleaned)
+        cleaned = _WHITESPACE_RE.sub(" ", cleaned).strip()
+        if len(self._clean_text_cache) >= 65536:
+            self._clean_text_cache.clear()
+        self._clean_text_cache[text] = cleaned
+        return cleaned
 
     def _normalize_asr_terms(self, text: str) -> str:
-        replacements = (
-            (r"\bread\s+CSV\b", "read_csv"),
-            (r"\bdrop\s+n\s+a\b", "dropna"),
-            (r"\btwo\s+period\b", "to_period"),
-            (r"\bDot\s+Plot\b", "plot()"),
-            (r"\by\s+Finance\b", "yfinance"),
-            (r"\bIn-Place\b", "inplace"),
-            (r"\bN\s+A\b", "NA"),
-        )
-        for pattern, replacement in replacements:
-            text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+        for pattern, replacement in _ASR_TERM_REPLACEMENTS:
+            text = pattern.sub(replacement, text)
         return text
 
     def _dedupe_repeated_words(self, text: str) -> str:
@@ -676,18 +1270,19 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         return " ".join(result).strip()
 
     def _dedupe_key(self, word: str) -> str:
-        return re.sub(r"^[^\w']+|[^\w']+$", "", word.lower())
+        return _DEDUPE_KEY_RE.sub("", word.lower())
 
     def _clean_filler_cues(self, cues: list[SubtitleCue]) -> list[SubtitleCue]:
-        if not cues:
-            return []
+        return list(self._iter_clean_filler_cues(cues))
 
-        cleaned: list[SubtitleCue] = []
+    def _iter_clean_filler_cues(self, cues: Iterable[SubtitleCue]) -> Iterator[SubtitleCue]:
+        # The last kept cue is held back because following filler cues may extend it.
+        last: SubtitleCue | None = None
         dropped = 0
         for cue in cues:
             if self._is_filler_only_cue(cue):
-                if cleaned and 0 <= cue.start - cleaned[-1].end <= 0.6:
-                    cleaned[-1].end = max(cleaned[-1].end, cue.end)
+                if last is not None and 0 <= cue.start - last.end <= 0.6:
+                    last.end = max(last.end, cue.end)
                 dropped += 1
                 continue
 
@@ -695,11 +1290,15 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             if not text:
                 dropped += 1
                 continue
-            cleaned.append(SubtitleCue(cue.start, cue.end, text, cue.translation))
+            cue.text = text
+            if last is not None:
+                yield last
+            last = cue
 
+        if last is not None:
+            yield last
         if self.logger and dropped:
             self.logger.info(f"已清理无意义语气词字幕: {dropped} 条")
-        return cleaned
 
     def _is_filler_only_cue(self, cue: SubtitleCue) -> bool:
         words = re.findall(r"[A-Za-z']+", cue.text.lower())
@@ -712,15 +1311,14 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         text = (text or "").strip()
         if not text:
             return text
-        pattern = "|".join(sorted(map(re.escape, _EDGE_FILLER_WORDS), key=len, reverse=True))
         while True:
-            stripped = re.sub(rf"^(?:{pattern})(?:[,.!?:;\-–—]+|\s+)+", "", text, flags=re.IGNORECASE).strip()
-            if stripped == text or not re.search(r"[A-Za-z0-9\u4e00-\u9fff]", stripped):
+            stripped = _LEADING_FILLER_RE.sub("", text).strip()
+            if stripped == text or not _HAS_CONTENT_RE.search(stripped):
                 break
             text = stripped
         while True:
-            stripped = re.sub(rf"(?:\s+|[,.!?:;\-–—]+)(?:{pattern})$", "", text, flags=re.IGNORECASE).strip()
-            if stripped == text or not re.search(r"[A-Za-z0-9\u4e00-\u9fff]", stripped):
+            stripped = _TRAILING_FILLER_RE.sub("", text).strip()
+            if stripped == text or not _HAS_CONTENT_RE.search(stripped):
                 break
             text = stripped
         return text
@@ -731,62 +1329,37 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         This gives the sentence merger more legal cut points, so we can avoid
         awkward fragments such as "first five or n" separated from "elements".
         """
-        raw_text = raw_text.strip()
-        parts = re.split(r"(<\d{2}:\d{2}:\d{2}\.\d{3}>)", raw_text)
+        # split() with a capture group alternates text, timestamp, text, ...
+        parts = _INLINE_TIMESTAMP_SPLIT_RE.split(raw_text.strip())
         result: list[SubtitleCue] = []
         current_start = start
-        current_text = ""
-        for part in parts:
-            if not part:
-                continue
-            if re.fullmatch(r"<\d{2}:\d{2}:\d{2}\.\d{3}>", part):
-                ts = self._parse_time(part.strip("<>"))
-                clean = self._clean_text(current_text)
-                if clean:
-                    result.append(SubtitleCue(start=current_start, end=max(current_start + 0.05, ts), text=clean))
-                current_start = ts
-                current_text = ""
-            else:
-                current_text += part
+        current_text = parts[0]
+        for stamp, text in zip(parts[1::2], parts[2::2]):
+            ts = self._parse_time(stamp[1:-1])
+            clean = self._clean_text(current_text)
+            if clean:
+                # Word tokens repeat constantly across a long track; share one string per word.
+                result.append(SubtitleCue(start=current_start, end=max(current_start + 0.05, ts), text=sys.intern(clean)))
+            current_start = ts
+            current_text = text
         clean = self._clean_text(current_text)
         if clean:
-            result.append(SubtitleCue(start=current_start, end=end, text=clean))
+            result.append(SubtitleCue(start=current_start, end=end, text=sys.intern(clean)))
         return [cue for cue in result if cue.text and cue.end > cue.start]
 
     def _ends_with_continuation_word(self, text: str) -> bool:
-        words = re.findall(r"[A-Za-z0-9']+", text.lower())
-        if not words:
-            return False
-        return words[-1] in {
-            "a", "an", "the", "of", "to", "in", "on", "at", "for", "with", "as", "by",
-            "and", "or", "but", "if", "when", "while", "that", "which", "who", "from", "into",
-            "we", "can", "could", "would", "should", "will", "our", "your", "their", "this",
-            "these", "those", "is", "are", "was", "were", "be", "being", "been",
-        }
+        return _lexical_features(text).ends_with_continuation
 
     def _starts_new_sentence_word(self, text: str) -> bool:
-        words = re.findall(r"[A-Za-z0-9']+", text.lower())
-        if not words:
-            return False
-        return words[0] in {
-            "over", "first", "let's", "there", "this", "what", "now", "turning",
-            "annualized", "lastly", "if", "when", "all", "coming",
-        }
+        return _lexical_features(text).starts_new_sentence
 
     def _starts_with_continuation_word(self, text: str) -> bool:
-        words = re.findall(r"[A-Za-z0-9']+", text.lower())
-        if not words:
-            return False
-        return words[0] in {
-            "of", "to", "in", "on", "at", "for", "with", "as", "by", "and", "or", "but",
-            "that", "which", "who", "from", "into", "than", "then", "the", "a", "an", "up",
-            "elements", "asset", "assets", "method", "methods", "function", "data", "frame",
-        }
+        return _lexical_features(text).starts_with_continuation
 
     def _has_soft_continuation_boundary(self, left: str, right: str) -> bool:
         """Catch ASR phrase splits without treating common words as global glue."""
-        left_words = re.findall(r"[A-Za-z0-9']+", left.lower())
-        right_words = re.findall(r"[A-Za-z0-9']+", right.lower())
+        left_words = _WORD_RE.findall(left.lower())
+        right_words = _WORD_RE.findall(right.lower())
         if not left_words or not right_words:
             return False
         left_tail = " ".join(left_words[-4:])
@@ -798,33 +1371,80 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         )
 
     def _looks_sentence_complete(self, text: str) -> bool:
-        text = text.strip()
-        if not text:
-            return False
-        if re.search(r"[.!?。！？…]['\")\]]*$", text):
-            # Avoid treating common abbreviations as sentence endings.
-            lower = text.lower()
-            if re.search(r"\b(?:mr|mrs|ms|dr|prof|inc|ltd|vs|etc)\.$", lower):
-                return False
-            return True
-        return False
-
-    def _parse_srt(self, path: Path) -> list[SubtitleCue]:
-        text = path.read_text(encoding="utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
-        blocks = re.split(r"\n\s*\n", text)
-        cues: list[SubtitleCue] = []
-        for block in blocks:
-            rows = [r.strip() for r in block.split("\n") if r.strip()]
-            if not rows:
+        return _lexical_features(text).sentence_complete
+
+    def _json3_events(self, path: Path) -> Iterator[tuple[int, int, list[tuple[int, str]]]]:
+        """Yield (start_ms, end_ms, [(word_start_ms, text), ...]) from YouTube json3 captions."""
+        data = json.loads(path.read_text(encoding="utf-8", errors="ignore"))
+        for event in data.get("events") or []:
+            segs = event.get("segs")
+            if not segs:
                 continue
-            timing_idx = next((idx for idx, row in enumerate(rows) if "-->" in row), -1)
-            if timing_idx < 0:
+            start = int(event.get("tStartMs") or 0)
+            end = start + int(event.get("dDurationMs") or 0)
+            yield start, end, [(start + int(seg.get("tOffsetMs") or 0), str(seg.get("utf8") or "")) for seg in segs]
+
+    def _srv3_events(self, path: Path) -> Iterator[tuple[int, int, list[tuple[int, str]]]]:
+        """Yield the same event tuples from YouTube srv3 (timedtext format 3) XML."""
+        for _, elem in ET.iterparse(path, events=("end",)):
+            if elem.tag != "p":
                 continue
-            start, end = self._parse_time_range(rows[timing_idx])
-            clean = self._clean_text(" ".join(rows[timing_idx + 1 :]))
-            if clean and (end - start) >= 0.2:
-                self._append_cue(cues, SubtitleCue(start=start, end=end, text=clean))
-        return cues
+            start = int(elem.get("t") or 0)
+            end = start + int(elem.get("d") or 0)
+            words = [(start + int(s.get("t") or 0), "".join(s.itertext())) for s in elem.iter("s")]
+            yield start, end, words or [(start, "".join(elem.itertext()))]
+            elem.clear()
+
+    def _iter_timed_events(self, events: Iterable[tuple[int, int, list[tuple[int, str]]]]) -> Iterator[SubtitleCue]:
+        """Turn caption events into cues, one per word where per-word offsets exist.
+
+        ASR events stay on screen while the next line is spoken, so an event is
+        clipped to the start of the next non-empty one. Segs without strictly
+        increasing offsets (styling runs in uploader tracks) are joined into
+        one cue for the event.
+        """
+        non_empty = (event for event in events if any(text.strip() for _, text in event[2]))
+        for (start_ms, end_ms, words), nxt in _with_next(non_empty):
+            if nxt is not None and start_ms < nxt[0] < end_ms:
+                end_ms = nxt[0]
+            start, end = start_ms / 1000, end_ms / 1000
+            if len(words) == 1 or any(left[0] >= right[0] for left, right in zip(words, words[1:])):
+                clean = self._clean_text("".join(text for _, text in words))
+                if clean and (end - start) >= 0.2:
+                    yield SubtitleCue(start=start, end=end, text=clean)
+                continue
+            for (word_ms, text), following in _with_next(words):
+                clean = self._clean_text(text)
+                if not clean:
+                    continue
+                word_start = word_ms / 1000
+                word_end = following[0] / 1000 if following is not None else end
+                # Word tokens repeat constantly across a long track; share one string per word.
+                cue = SubtitleCue(start=word_start, end=max(word_start + 0.05, word_end), text=sys.intern(clean))
+                if cue.end > cue.start and cue.start < end:
+                    yield cue
+
+    def _iter_srt(self, lines: Iterator[str]) -> Iterator[SubtitleCue]:
+        rows: list[str] = []
+        for raw in lines:
+            row = raw.strip()
+            if row:
+                rows.append(row)
+                continue
+            if rows:
+                yield from self._srt_block_cue(rows)
+                rows = []
+        if rows:
+            yield from self._srt_block_cue(rows)
+
+    def _srt_block_cue(self, rows: list[str]) -> Iterator[SubtitleCue]:
+        timing_idx = next((idx for idx, row in enumerate(rows) if "-->" in row), -1)
+        if timing_idx < 0:
+            return
+        start, end = self._parse_time_range(rows[timing_idx])
+        clean = self._clean_text(" ".join(rows[timing_idx + 1 :]))
+        if clean and (end - start) >= 0.2:
+            yield SubtitleCue(start=start, end=end, text=clean)
 
     def _translate_lines_resilient(self, lines: list[str], *, source_lang: str, target_lang: str) -> list[str]:
         try:
@@ -846,12 +1466,19 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 *self._translate_lines_resilient(lines[mid:], source_lang=source_lang, target_lang=target_lang),
             ]
 
-    def _append_cue(self, cues: list[SubtitleCue], cue: SubtitleCue) -> None:
-        # YouTube auto captions may contain duplicate overlapping cues.
-        if cues and cues[-1].text == cue.text and abs(cues[-1].start - cue.start) < 1.0:
-            cues[-1].end = max(cues[-1].end, cue.end)
-            return
-        cues.append(cue)
+    def _dedupe_rolling_cues(self, cues: Iterable[SubtitleCue]) -> Iterator[SubtitleCue]:
+        # YouTube auto captions may contain duplicate overlapping cues; the last cue is
+        # held back until the next one shows it is not extended by a duplicate.
+        last: SubtitleCue | None = None
+        for cue in cues:
+            if last is not None and last.text == cue.text and abs(last.start - cue.start) < 1.0:
+                last.end = max(last.end, cue.end)
+                continue
+            if last is not None:
+                yield last
+            last = cue
+        if last is not None:
+            yield last
 
     def _pick_vtt_body_text(self, body: list[str]) -> str:
         if not body:
@@ -860,7 +1487,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         non_empty = [line.strip() for line in body if line.strip()]
         if not non_empty:
             return ""
-        if any(re.search(r"<\d{2}:\d{2}:\d{2}\.\d{3}>", line) for line in non_empty):
+        if any(_INLINE_TIMESTAMP_RE.search(line) for line in non_empty):
             return non_empty[-1]
         return " ".join(non_empty)
 
@@ -882,11 +1509,11 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         return int(h) * 3600 + int(m) * 60 + float(s)
 
     def _clean_text(self, text: str) -> str:
-        text = re.sub(r"<\d{2}:\d{2}:\d{2}\.\d{3}>", "", text)
-        text = re.sub(r"<[^>]+>", "", text)
-        text = html.unescape(text)
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
+        if "<" in text:
+            text = _MARKUP_TAG_RE.sub("", text)
+        if "&" in text:
+            text = html.unescape(text)
+        return " ".join(text.split())
 
     def _ass_time(self, seconds: float) -> str:
         centiseconds = int(round(max(0.0, seconds) * 100))
@@ -909,39 +1536,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         max_lines: int | None = 3,
         label: str | None = None,
     ) -> str:
-        text = re.sub(r"\s+", " ", (text or "").strip())
-        if not text or self._display_width(text) <= max_chars:
-            return text
-
-        chunks: list[str] = []
-        current = ""
-        pending_space = False
-        for token in re.split(r"(\s+)", text):
-            if not token:
-                continue
-            if token.isspace():
-                pending_space = bool(current)
-                continue
-
-            parts = [token]
-            if self._display_width(token) > max_chars:
-                parts = self._split_by_display_width(token, max_chars)
-
-            for part in parts:
-                if not part:
-                    continue
-                separator = " " if pending_space and current else ""
-                candidate = f"{current}{separator}{part}" if current else part
-                if current and self._display_width(candidate) > max_chars:
-                    chunks.append(current.strip())
-                    current = part.strip()
-                else:
-                    current = candidate
-                pending_space = False
-
-        if current.strip():
-            chunks.append(current.strip())
-
+        chunks = text_layout.wrap_lines(text, max_chars)
         if max_lines is not None and len(chunks) > max_lines and self.logger:
             cue_label = label or "字幕"
             self.logger.warning(
@@ -951,114 +1546,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         return "\n".join(chunks)
 
     def _split_by_display_width(self, text: str, max_width: int) -> list[str]:
-        text = (text or "").strip()
-        if not text:
-            return []
-        atoms = self._wrap_atoms(text)
-        chunks: list[str] = []
-        start = 0
-        while start < len(atoms):
-            while start < len(atoms) and atoms[start][1] == "space":
-                start += 1
-            if start >= len(atoms):
-                break
-
-            width = 0
-            end = start
-            while end < len(atoms) and width + self._display_width(atoms[end][0]) <= max_width:
-                width += self._display_width(atoms[end][0])
-                end += 1
-
-            if end == len(atoms):
-                chunk = "".join(atom for atom, _ in atoms[start:end]).strip()
-                if chunk:
-                    chunks.append(chunk)
-                break
-
-            if end == start:
-                pieces = self._split_long_atom(atoms[start][0], max_width)
-                chunks.extend(pieces[:-1])
-                atoms[start] = (pieces[-1], atoms[start][1])
-                if len(pieces) == 1:
-                    start += 1
-                continue
-
-            boundary = self._choose_wrap_boundary(atoms, start, end, max_width)
-            chunk = "".join(atom for atom, _ in atoms[start:boundary]).strip()
-            if chunk:
-                chunks.append(chunk)
-            start = boundary
-
-        return chunks
-
-    def _wrap_atoms(self, text: str) -> list[tuple[str, str]]:
-        atoms: list[tuple[str, str]] = []
-        pattern = re.compile(r"[A-Za-z0-9_]+(?:[._'-][A-Za-z0-9_]+)*|\s+|.", re.DOTALL)
-        for match in pattern.finditer(text):
-            token = match.group(0)
-            if token.isspace():
-                atoms.append((" ", "space"))
-            elif re.fullmatch(r"[A-Za-z0-9_]+(?:[._'-][A-Za-z0-9_]+)*", token):
-                atoms.append((token, "word"))
-            elif all(self._is_cjk(char) for char in token):
-                atoms.append((token, "cjk"))
-            else:
-                atoms.append((token, "punct" if self._is_wrap_punctuation(token) else "other"))
-        return atoms
-
-    def _choose_wrap_boundary(
-        self,
-        atoms: list[tuple[str, str]],
-        start: int,
-        end: int,
-        max_width: int,
-    ) -> int:
-        candidates: list[tuple[int, int, int]] = []
-        width = 0
-        for pos in range(start + 1, end + 1):
-            width += self._display_width(atoms[pos - 1][0])
-            priority = self._wrap_boundary_priority(atoms, pos)
-            if priority > 0:
-                candidates.append((priority, width, pos))
-        if not candidates:
-            return end
-
-        preferred = [item for item in candidates if item[1] >= max_width * 0.45]
-        pool = preferred or candidates
-        priority = max(item[0] for item in pool)
-        return max(item[2] for item in pool if item[0] == priority)
-
-    def _wrap_boundary_priority(self, atoms: list[tuple[str, str]], pos: int) -> int:
-        previous_text, previous_kind = atoms[pos - 1]
-        next_kind = atoms[pos][1] if pos < len(atoms) else "end"
-        if previous_kind == "space":
-            return 5
-        if self._is_wrap_punctuation(previous_text):
-            return 6
-        if next_kind == "punct" and atoms[pos][0] not in {'“', '‘', '（', '(', '《', '「'}:
-            return 0
-        if previous_kind in {"word", "cjk"} and next_kind in {"word", "cjk"} and previous_kind != next_kind:
-            return 4
-        if previous_kind == "cjk" and next_kind == "cjk":
-            return 1
-        return 0
-
-    def _split_long_atom(self, text: str, max_width: int) -> list[str]:
-        chunks: list[str] = []
-        current = ""
-        width = 0
-        for char in text:
-            char_width = self._display_width(char)
-            if current and width + char_width > max_width:
-                chunks.append(current)
-                current = char
-                width = char_width
-            else:
-                current += char
-                width += char_width
-        if current:
-            chunks.append(current)
-        return chunks
+        return text_layout.split_by_display_width(text, max_width)
 
     def _subtitle_line_count(self, text: str) -> int:
         return max(1, len((text or "").splitlines()))
@@ -1081,14 +1569,5 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             return max(72, min(118, round(available_width / max(1, font_size * 0.55))))
         return max(48, min(76, round(available_width / max(1, font_size * 0.50))))
 
-    def _is_wrap_punctuation(self, text: str) -> bool:
-        return bool(text) and text[-1] in "，。！？、；：）」》】』』,.!?;:)]}"
-
-    def _is_cjk(self, char: str) -> bool:
-        return "\u3400" <= char <= "\u9fff" or "\uf900" <= char <= "\ufaff"
-
     def _display_width(self, text: str) -> int:
-        width = 0
-        for char in text:
-            width += 2 if unicodedata.east_asian_width(char) in {"F", "W"} else 1
-        return width
+        return text_layout.display_width(text)
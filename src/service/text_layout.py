@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+
+
+# Display width (1 or 2 columns) of every BMP code point, looked up by ord().
+# Built once at import; astral characters fall back to unicodedata.
+_BMP_WIDTHS = bytes(2 if unicodedata.east_asian_width(chr(i)) in "FW" else 1 for i in range(0x10000))
+
+
+def _wide_ranges_pattern(widths: bytes) -> str:
+    ranges: list[str] = []
+    start = None
+    for code, width in enumerate([*widths, 1]):
+        if width == 2 and start is None:
+            start = code
+        elif width != 2 and start is not None:
+            first, last = re.escape(chr(start)), re.escape(chr(code - 1))
+            ranges.append(first if start == code - 1 else f"{first}-{last}")
+            start = None
+    return f"[{''.join(ranges)}]"
+
+
+# The same table as a character class, so whole strings are measured by one C-level scan.
+_WIDE_BMP_RE = re.compile(_wide_ranges_pattern(_BMP_WIDTHS))
+_ATOM_RE = re.compile(r"(?P<word>[A-Za-z0-9_]+(?:[._'-][A-Za-z0-9_]+)*)|(?P<space>\s+)|.", re.DOTALL)
+_WRAP_PUNCTUATION = frozenset("，。！？、；：）」》】』,.!?;:)]}")
+_OPENING_PUNCTUATION = frozenset({"“", "‘", "（", "(", "《", "「"})
+
+Atom = tuple[str, str]
+
+
+def char_width(char: str) -> int:
+    code = ord(char)
+    if code < 0x10000:
+        return _BMP_WIDTHS[code]
+    return 2 if unicodedata.east_asian_width(char) in {"F", "W"} else 1
+
+
+def display_width(text: str) -> int:
+    """Terminal-style width of text: East Asian wide/fullwidth characters count as 2."""
+    if text.isascii():
+        return len(text)
+    if max(text) > "\uffff":
+        return sum(map(char_width, text))
+    # Narrow characters are what remains after removing the wide ones.
+    return 2 * len(text) - len(_WIDE_BMP_RE.sub("", text))
+
+
+@lru_cache(maxsize=65536)
+def atom_width(atom: str) -> int:
+    # Subtitle words and CJK characters repeat heavily across a track.
+    return display_width(atom)
+
+
+def is_cjk(char: str) -> bool:
+    return "\u3400" <= char <= "\u9fff" or "\uf900" <= char <= "\ufaff"
+
+
+def is_wrap_punctuation(text: str) -> bool:
+    return bool(text) and text[-1] in _WRAP_PUNCTUATION
+
+
+def wrap_atoms(text: str) -> list[Atom]:
+    """Split text into (token, kind) wrap units; kind is word/space/cjk/punct/other."""
+    atoms: list[Atom] = []
+    for match in _ATOM_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "space":
+            atoms.append((" ", "space"))
+        elif kind == "word":
+            atoms.append((match.group(0), "word"))
+        else:
+            char = match.group(0)
+            atoms.append((char, _char_kind(char)))
+    return atoms
+
+
+@lru_cache(maxsize=8192)
+def _char_kind(char: str) -> str:
+    if is_cjk(char):
+        return "cjk"
+    return "punct" if is_wrap_punctuation(char) else "other"
+
+
+def wrap_lines(text: str, max_width: int) -> list[str]:
+    """Greedy whitespace wrap; tokens wider than max_width are split by split_by_display_width()."""
+    text = re.sub(r"\s+", " ", (text or "").strip())
+    if not text:
+        return []
+    if display_width(text) <= max_width:
+        return [text]
+
+    chunks: list[str] = []
+    current = ""
+    current_width = 0
+    for token in text.split(" "):
+        token_width = atom_width(token)
+        if token_width <= max_width:
+            parts = [(token, token_width)]
+        else:
+            parts = [(part, display_width(part)) for part in split_by_display_width(token, max_width)]
+        # Only the first piece of a token is separated from the line by a space.
+        separator = " "
+        for part, part_width in parts:
+            if current and current_width + len(separator) + part_width > max_width:
+                chunks.append(current)
+                current, current_width = part, part_width
+            elif current:
+                current, current_width = f"{current}{separator}{part}", current_width + len(separator) + part_width
+            else:
+                current, current_width = part, part_width
+            separator = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_by_display_width(text: str, max_width: int) -> list[str]:
+    """Split text into chunks no wider than max_width, preferring punctuation and script boundaries."""
+    text = (text or "").strip()
+    if not text:
+        return []
+    atoms = wrap_atoms(text)
+    # offsets[i] is the width of atoms[:i], so any run of atoms is measured in O(1).
+    offsets = [0, *accumulate(atom_width(token) for token, _ in atoms)]
+    chunks: list[str] = []
+    start = 0
+    while start < len(atoms):
+        while start < len(atoms) and atoms[start][1] == "space":
+            start += 1
+        if start >= len(atoms):
+            break
+
+        # Every atom is at least one column wide, so offsets is strictly increasing.
+        end = bisect_right(offsets, offsets[start] + max_width, lo=start) - 1
+
+        if end == len(atoms):
+            chunk = "".join(atom for atom, _ in atoms[start:end]).strip()
+            if chunk:
+                chunks.append(chunk)
+            break
+
+        if end == start:
+            pieces = _split_long_atom(atoms[start][0], max_width)
+            chunks.extend(pieces[:-1])
+            if len(pieces) == 1:
+                start += 1
+            else:
+                atoms[start] = (pieces[-1], atoms[start][1])
+                shrink = offsets[start + 1] - offsets[start] - display_width(pieces[-1])
+                offsets[start + 1 :] = [offset - shrink for offset in offsets[start + 1 :]]
+            continue
+
+        boundary = _choose_wrap_boundary(atoms, offsets, start, end, max_width)
+        chunk = "".join(atom for atom, _ in atoms[start:boundary]).strip()
+        if chunk:
+            chunks.append(chunk)
+        start = boundary
+
+    return chunks
+
+
+def _choose_wrap_boundary(atoms: list[Atom], offsets: list[int], start: int, end: int, max_width: int) -> int:
+    candidates: list[tuple[int, int, int]] = []
+    for pos in range(start + 1, end + 1):
+        priority = _wrap_boundary_priority(atoms, pos)
+        if priority > 0:
+            candidates.append((priority, offsets[pos] - offsets[start], pos))
+    if not candidates:
+        return end
+
+    preferred = [item for item in candidates if item[1] >= max_width * 0.45]
+    pool = preferred or candidates
+    priority = max(item[0] for item in pool)
+    return max(item[2] for item in pool if item[0] == priority)
+
+
+def _wrap_boundary_priority(atoms: list[Atom], pos: int) -> int:
+    previous_text, previous_kind = atoms[pos - 1]
+    next_kind = atoms[pos][1] if pos < len(atoms) else "end"
+    if previous_kind == "space":
+        return 5
+    if is_wrap_punctuation(previous_text):
+        return 6
+    if next_kind == "punct" and atoms[pos][0] not in _OPENING_PUNCTUATION:
+        return 0
+    if previous_kind in {"word", "cjk"} and next_kind in {"word", "cjk"} and previous_kind != next_kind:
+        return 4
+    if previous_kind == "cjk" and next_kind == "cjk":
+        return 1
+    return 0
+
+
+def _split_long_atom(text: str, max_width: int) -> list[str]:
+    chunks: list[str] = []
+    current = ""
+    width = 0
+    for char in text:
+        width_of_char = char_width(char)
+        if current and width + width_of_char > max_width:
+            chunks.append(current)
+            current = char
+            width = width_of_char
+        else:
+            current += char
+            width += width_of_char
+    if current:
+        chunks.append(current)
+    return chunks
@@ -1,17 +1,35 @@
 from __future__ import annotations
 
-from src.infra.ai_client import segment_subtitle_ranges, suggest_bilibili_metadata, translate_subtitle_lines, translate_title
+from src.infra.ai_client import (
+    UsageListener,
+    current_llm_stage,
+    llm_stage,
+    segment_and_translate_subtitle_lines,
+    segment_subtitle_ranges,
+    suggest_bilibili_metadata,
+    translate_subtitle_lines,
+    translate_title,
+)
 
 
 class TranslatorService:
-    def __init__(self, config, logger):
+    def __init__(self, config, logger, usage_listener: UsageListener | None = None):
         self.config = config
         self.logger = logger
+        # Fixed listener for standalone callers (benchmarks); pipeline runs scope theirs with llm_usage_listener.
+        self.usage_listener = usage_listener
 
     def translate_title(self, title: str, prefix: str | None = None) -> str:
         prefix = prefix if prefix is not None else self.config.bilibili.title_prefix
         try:
-            translated = translate_title(title, self.config.ai, self.config.translation, logger=self.logger)
+            with llm_stage("title"):
+                translated = translate_title(
+                    title,
+                    self.config.ai,
+                    self.config.translation,
+                    logger=self.logger,
+                    usage_listener=self.usage_listener,
+                )
             translated = self._post_process_title(translated, title)
             return prefix + translated
         except Exception as e:
@@ -25,14 +43,17 @@ class TranslatorService:
         source_lang: str | None = None,
         target_lang: str | None = None,
     ) -> list[str]:
-        return translate_subtitle_lines(
-            lines,
-            ai_cfg=self.config.ai,
-            translation_cfg=self.config.translation,
-            source_lang=source_lang or self.config.translation.source_lang,
-            target_lang=target_lang or self.config.translation.target_lang,
-            logger=self.logger,
-        )
+        # Callers such as the missing-translation repair pass set their own stage.
+        with llm_stage(current_llm_stage() or "translation"):
+            return translate_subtitle_lines(
+                lines,
+                ai_cfg=self.config.ai,
+                translation_cfg=self.config.translation,
+                source_lang=source_lang or self.config.translation.source_lang,
+                target_lang=target_lang or self.config.translation.target_lang,
+                logger=self.logger,
+                usage_listener=self.usage_listener,
+            )
 
     def segment_subtitle_batch(
         self,
@@ -40,22 +61,44 @@ class TranslatorService:
         *,
         source_lang: str | None = None,
     ) -> list[dict[str, int]]:
-        return segment_subtitle_ranges(
-            lines,
-            ai_cfg=self.config.ai,
-            source_lang=source_lang or self.config.translation.source_lang,
-            logger=self.logger,
-        )
+        with llm_stage(current_llm_stage() or "segmentation"):
+            return segment_subtitle_ranges(
+                lines,
+                ai_cfg=self.config.ai,
+                source_lang=source_lang or self.config.translation.source_lang,
+                logger=self.logger,
+                usage_listener=self.usage_listener,
+            )
+
+    def segment_and_translate_batch(
+        self,
+        lines: list[str],
+        *,
+        source_lang: str | None = None,
+        target_lang: str | None = None,
+    ) -> list[dict[str, object]]:
+        with llm_stage("segment_translate"):
+            return segment_and_translate_subtitle_lines(
+                lines,
+                ai_cfg=self.config.ai,
+                translation_cfg=self.config.translation,
+                source_lang=source_lang or self.config.translation.source_lang,
+                target_lang=target_lang or self.config.translation.target_lang,
+                logger=self.logger,
+                usage_listener=self.usage_listener,
+            )
 
     def suggest_bilibili_metadata(self, payload: dict) -> dict[str, object]:
-        raw = suggest_bilibili_metadata(
-            payload,
-            ai_cfg=self.config.ai,
-            tid_whitelist=self.config.bilibili.tid_whitelist,
-            tag_min_count=self.config.bilibili.tag_min_count,
-            tag_max_count=self.config.bilibili.tag_max_count,
-            logger=self.logger,
-        )
+        with llm_stage("bilibili_metadata"):
+            raw = suggest_bilibili_metadata(
+                payload,
+                ai_cfg=self.config.ai,
+                tid_whitelist=self.config.bilibili.tid_whitelist,
+                tag_min_count=self.config.bilibili.tag_min_count,
+                tag_max_count=self.config.bilibili.tag_max_count,
+                logger=self.logger,
+                usage_listener=self.usage_listener,
+            )
         return self._normalize_bilibili_metadata(raw)
 
     def _normalize_bilibili_metadata(self, raw: dict) -> dict[str, object]:
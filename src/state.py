@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import os
 import sqlite3
+import threading
 import time
 import uuid
 from pathlib import Path
@@ -29,10 +31,13 @@ class StateRepository:
 
     def __init__(self, db_path: str):
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(db_path)
+        # LLM usage is recorded from translation worker threads; writes are serialized by _lock.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
         self._init_tables()
         self._migrate_jobs_table()
+        self._migrate_llm_usage_table()
 
     def _init_tables(self):
         self.conn.execute(
@@ -56,13 +61,62 @@ class StateRepository:
             )
             """
         )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                cache_miss_tokens INTEGER DEFAULT 0,
+                latency_ms INTEGER DEFAULT 0,
+                retries INTEGER DEFAULT 0,
+                retry_wait_ms INTEGER DEFAULT 0,
+                cost REAL,
+                created_at INTEGER
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_job ON llm_usage(job_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage(created_at)")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS render_queue (
+                ticket TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                priority INTEGER DEFAULT 0,
+                state TEXT NOT NULL,
+                enqueued_at REAL NOT NULL
+            )
+            """
+        )
         self.conn.commit()
 
+    # Per-job totals once kept on jobs; they are now summed from llm_usage in get_job().
+    _DROPPED_COLUMNS = ("prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
     def _migrate_jobs_table(self):
         cols = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)").fetchall()}
         for col, col_type in self._COLUMNS.items():
             if col not in cols:
                 self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {col_type}")
+        for col in self._DROPPED_COLUMNS:
+            if col in cols:
+                try:
+                    self.conn.execute(f"ALTER TABLE jobs DROP COLUMN {col}")
+                except sqlite3.OperationalError:
+                    # SQLite < 3.35 cannot drop columns; the stale values are simply never read.
+                    pass
+        self.conn.commit()
+
+    def _migrate_llm_usage_table(self):
+        cols = {row["name"] for row in self.conn.execute("PRAGMA table_info(llm_usage)").fetchall()}
+        if "retry_wait_ms" not in cols:
+            self.conn.execute("ALTER TABLE llm_usage ADD COLUMN retry_wait_ms INTEGER DEFAULT 0")
         self.conn.commit()
 
     def close(self):
@@ -87,7 +141,7 @@ class StateRepository:
             """
             UPDATE jobs
             SET status='interrupted', current_step='上次执行已中断，可使用 --resume-job 恢复', updated_at=?
-            WHERE status NOT IN ('completed', 'uploaded', 'failed', 'interrupted')
+            WHERE status NOT IN ('completed', 'uploaded', 'failed', 'stalled', 'interrupted')
             """,
             (now,),
         )
@@ -105,11 +159,116 @@ class StateRepository:
         sets = ", ".join(f"{k}=?" for k in keys)
         values = [fields[k] for k in keys]
         values.append(job_id)
-        self.conn.execute(f"UPDATE jobs SET {sets} WHERE job_id=?", values)
-        self.conn.commit()
+        with self._lock:
+            self.conn.execute(f"UPDATE jobs SET {sets} WHERE job_id=?", values)
+            self.conn.commit()
+
+    def record_llm_usage(
+        self,
+        job_id: str,
+        *,
+        stage: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        cache_miss_tokens: int,
+        latency_ms: int,
+        retries: int,
+        retry_wait_ms: int = 0,
+        cost: float | None = None,
+    ) -> None:
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT INTO llm_usage(
+                    job_id, stage, model, prompt_tokens, completion_tokens, cached_tokens,
+                    cache_miss_tokens, latency_ms, retries, retry_wait_ms, cost, created_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    stage,
+                    model,
+                    int(prompt_tokens),
+                    int(completion_tokens),
+                    int(cached_tokens),
+                    int(cache_miss_tokens),
+                    int(latency_ms),
+                    int(retries),
+                    int(retry_wait_ms),
+                    cost,
+                    int(time.time()),
+                ),
+            )
+            self.conn.commit()
+
+    # Aggregate expressions shared by the per-job and rollup usage reports.
+    _USAGE_AGGREGATES = """
+        COUNT(*) AS calls,
+        SUM(prompt_tokens) AS prompt_tokens,
+        SUM(completion_tokens) AS completion_tokens,
+        SUM(cached_tokens) AS cached_tokens,
+        SUM(cache_miss_tokens) AS cache_miss_tokens,
+        SUM(retries) AS retries,
+        CAST(AVG(latency_ms) AS INTEGER) AS avg_latency_ms,
+        SUM(retry_wait_ms) AS retry_wait_ms,
+        SUM(cost) AS cost
+    """
+
+    def llm_usage_by_stage(self, job_id: str) -> list[dict[str, Any]]:
+        cur = self.conn.execute(
+            f"""
+            SELECT stage, model, {self._USAGE_AGGREGATES}
+            FROM llm_usage
+            WHERE job_id=?
+            GROUP BY stage, model
+            ORDER BY MIN(id)
+            """,
+            (job_id,),
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+    def llm_usage_rollup(self, *, group_by: str = "day", days: int | None = None) -> list[dict[str, Any]]:
+        keys = {
+            "day": "date(created_at, 'unixepoch', 'localtime')",
+            "model": "model",
+            "stage": "stage",
+        }
+        if group_by not in keys:
+            raise ValueError(f"未知用量汇总维度: {group_by}")
+        where = ""
+        params: tuple[Any, ...] = ()
+        if days:
+            where = "WHERE created_at >= ?"
+            params = (int(time.time()) - int(days) * 86400,)
+        cur = self.conn.execute(
+            f"""
+            SELECT {keys[group_by]} AS bucket, {self._USAGE_AGGREGATES}
+            FROM llm_usage
+            {where}
+            GROUP BY bucket
+            ORDER BY bucket DESC
+            """,
+            params,
+        )
+        return [dict(row) for row in cur.fetchall()]
 
     def get_job(self, job_id: str) -> dict[str, Any] | None:
-        cur = self.conn.execute("SELECT * FROM jobs WHERE job_id=?", (job_id,))
+        """Return the job row plus its prompt cache totals summed from the usage ledger."""
+        columns = ", ".join(f"jobs.{col}" for col in ("job_id", *self._COLUMNS))
+        cur = self.conn.execute(
+            f"""
+            SELECT {columns},
+                COALESCE(SUM(u.cached_tokens), 0) AS prompt_cache_hit_tokens,
+                COALESCE(SUM(u.cache_miss_tokens), 0) AS prompt_cache_miss_tokens
+            FROM jobs LEFT JOIN llm_usage u ON u.job_id = jobs.job_id
+            WHERE jobs.job_id=?
+            GROUP BY jobs.job_id
+            """,
+            (job_id,),
+        )
         row = cur.fetchone()
         return None if row is None else dict(row)
 
@@ -120,5 +279,81 @@ class StateRepository:
         )
         return [dict(row) for row in cur.fetchall()]
 
+    def enqueue_render(self, job_id: str, *, priority: int = 0) -> str:
+        ticket = uuid.uuid4().hex
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO render_queue(ticket, job_id, pid, priority, state, enqueued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (ticket, job_id, os.getpid(), int(priority), "waiting", time.time()),
+            )
+            self.conn.commit()
+        return ticket
+
+    def admit_render(self, ticket: str, capacity: int) -> tuple[bool, int]:
+        """Start ticket if it heads the waiting queue and a slot is free; returns (admitted, waiting ahead).
+
+        Higher priority goes first, then enqueue order. Entries of processes that
+        died without releasing their slot are dropped first.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge_dead_render_entries()
+                running = self.conn.execute("SELECT COUNT(*) FROM render_queue WHERE state='running'").fetchone()[0]
+                waiting = [
+                    row["ticket"]
+                    for row in self.conn.execute(
+                        "SELECT ticket FROM render_queue WHERE state='waiting' ORDER BY priority DESC, enqueued_at, ticket"
+                    )
+                ]
+                ahead = waiting.index(ticket) if ticket in waiting else 0
+                admitted = ticket in waiting and ahead == 0 and running < capacity
+                if admitted:
+                    self.conn.execute("UPDATE render_queue SET state='running' WHERE ticket=?", (ticket,))
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        return admitted, ahead
+
+    def release_render(self, ticket: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM render_queue WHERE ticket=?", (ticket,))
+            self.conn.commit()
+
+    def render_queue_stats(self) -> dict[str, int]:
+        with self._lock:
+            self._purge_dead_render_entries()
+            self.conn.commit()
+            rows = self.conn.execute("SELECT state, COUNT(*) AS n FROM render_queue GROUP BY state").fetchall()
+        counts = {row["state"]: int(row["n"]) for row in rows}
+        return {"running": counts.get("running", 0), "waiting": counts.get("waiting", 0)}
+
+    def _purge_dead_render_entries(self) -> None:
+        pids = {row["pid"] for row in self.conn.execute("SELECT DISTINCT pid FROM render_queue")}
+        for pid in pids:
+            if not _pid_alive(int(pid)):
+                self.conn.execute("DELETE FROM render_queue WHERE pid=?", (pid,))
+
     def mark_job_failed(self, job_id: str, error: str) -> None:
         self.update_job(job_id, status="failed", error=error, current_step="失败")
+
+    def mark_job_stalled(self, job_id: str, error: str) -> None:
+        self.update_job(
+            job_id,
+            status="stalled",
+            error=error,
+            current_step="子进程长时间没有进度已终止，可使用 --resume-job 恢复",
+        )
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -1,7 +1,20 @@
+import threading
 from types import SimpleNamespace
 
+import pytest
+
 from src.config.config import load_config
-from src.infra.ai_client import OpenAICompatibleLLMClient
+from src.infra.ai_client import (
+    LLMAPIError,
+    LLMFatalError,
+    LLMRetriableError,
+    OpenAICompatibleLLMClient,
+    build_subtitle_translation_prompt,
+    llm_stage,
+    llm_usage_listener,
+)
+from src.infra.llm_mock_server import MockLLMServerConfig, start_mock_llm_server
+from src.infra.llm_replay import get_replay_store
 
 
 def test_ai_client_adds_non_thinking_instruction(monkeypatch):
@@ -20,3 +33,152 @@ def test_ai_client_adds_non_thinking_instruction(monkeypatch):
     client = OpenAICompatibleLLMClient(load_config().ai)
     assert client.translate_text("text", system_prompt="translate") == "translated"
     assert "非思考模式" in captured["messages"][0]["content"]
+
+
+def test_ai_client_reports_prompt_cache_usage(monkeypatch):
+    recorded = []
+
+    class Completions:
+        def create(self, **_kwargs):
+            message = SimpleNamespace(content="translated")
+            usage = SimpleNamespace(
+                prompt_tokens=120,
+                completion_tokens=8,
+                prompt_cache_hit_tokens=100,
+                prompt_cache_miss_tokens=20,
+            )
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr("src.infra.ai_client._get_openai_client", lambda *_args: fake_client)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test-key")
+
+    client = OpenAICompatibleLLMClient(load_config().ai, usage_listener=recorded.append)
+    client.translate_text("text", system_prompt="translate")
+
+    assert len(recorded) == 1
+    assert recorded[0].prompt_cache_hit_tokens == 100
+    assert recorded[0].prompt_cache_miss_tokens == 20
+    assert recorded[0].completion_tokens == 8
+
+
+def test_scoped_usage_listener_follows_its_own_context(monkeypatch):
+    class Completions:
+        def create(self, **_kwargs):
+            message = SimpleNamespace(content="translated")
+            usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr("src.infra.ai_client._get_openai_client", lambda *_args: fake_client)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test-key")
+    client = OpenAICompatibleLLMClient(load_config().ai)
+    first, second = [], []
+
+    def run(recorded, text):
+        with llm_usage_listener(recorded.append):
+            client.translate_text(text, system_prompt="translate")
+
+    threads = [threading.Thread(target=run, args=args) for args in ((first, "a"), (second, "b"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.translate_text("outside", system_prompt="translate")
+
+    assert len(first) == 1
+    assert len(second) == 1
+
+
+def test_subtitle_prompt_puts_glossary_before_language_variables():
+    prompt = build_subtitle_translation_prompt(load_config().translation, "en", "zh-CN")
+
+    assert prompt.index("术语表") < prompt.index("源语言：en")
+    assert prompt.rstrip().endswith("目标语言：zh-CN。")
+
+
+def test_ai_client_usage_carries_stage_and_retry_count(monkeypatch):
+    recorded = []
+    attempts = {"count": 0}
+    clock = {"now": 100.0}
+
+    class Completions:
+        def create(self, **_kwargs):
+            attempts["count"] += 1
+            clock["now"] += 0.5
+            if attempts["count"] == 1:
+                raise LLMAPIError("busy", status_code=503)
+            message = SimpleNamespace(content="{}")
+            usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr("src.infra.ai_client._get_openai_client", lambda *_args: fake_client)
+    monkeypatch.setattr("src.infra.ai_client.time.monotonic", lambda: clock["now"])
+    monkeypatch.setattr("src.infra.ai_client.random.uniform", lambda _low, _high: 0.0)
+
+    def sleep(seconds):
+        clock["now"] += seconds
+
+    monkeypatch.setattr("src.infra.ai_client.time.sleep", sleep)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test-key")
+
+    client = OpenAICompatibleLLMClient(load_config().ai, usage_listener=recorded.append)
+    with llm_stage("bilibili_metadata"):
+        client.complete_json({"title": "x"}, system_prompt="meta")
+
+    assert recorded[0].stage == "bilibili_metadata"
+    assert recorded[0].retries == 1
+    # Only the successful attempt counts as latency; the failed attempt and backoff are retry wait.
+    assert recorded[0].latency_ms == 500
+    assert recorded[0].retry_wait_ms == 1500
+    assert recorded[0].prompt_cache_miss_tokens == 10
+
+
+def test_ai_client_replays_recorded_responses_offline(monkeypatch, tmp_path):
+    calls = []
+
+    class Completions:
+        def create(self, **_kwargs):
+            calls.append("live")
+            message = SimpleNamespace(content="recorded")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr("src.infra.ai_client._get_openai_client", lambda *_args: fake_client)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test-key")
+    ai_cfg = load_config().ai
+    ai_cfg.replay_path = str(tmp_path / "replay.jsonl")
+
+    ai_cfg.replay_mode = "record"
+    assert OpenAICompatibleLLMClient(ai_cfg).translate_text("text", system_prompt="translate") == "recorded"
+
+    get_replay_store.cache_clear()
+    monkeypatch.delenv("DEEPSEEK_API_KEY")
+    ai_cfg.replay_mode = "replay"
+    client = OpenAICompatibleLLMClient(ai_cfg)
+
+    assert client.translate_text("text", system_prompt="translate") == "recorded"
+    assert calls == ["live"]
+    with pytest.raises(LLMFatalError, match="回放记录"):
+        client.translate_text("other text", system_prompt="translate")
+
+
+@pytest.mark.parametrize("client_timeout, hold_seconds", [(0.3, 5.0), (5.0, 0.3)])
+def test_mock_server_timeout_fault_is_retried_by_client(monkeypatch, client_timeout, hold_seconds):
+    # Whether the client times out first or the server drops the connection, the fault must be retriable.
+    monkeypatch.setattr("src.infra.ai_client.time.sleep", lambda _seconds: None)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test-key")
+    server_config = MockLLMServerConfig(latency_ms=0, latency_distribution="fixed", timeout_rate=1.0, timeout_seconds=hold_seconds)
+    with start_mock_llm_server(server_config) as server:
+        ai_cfg = load_config().ai
+        ai_cfg.base_url = server.base_url
+        ai_cfg.timeout = client_timeout
+        ai_cfg.max_retries = 1
+        client = OpenAICompatibleLLMClient(ai_cfg)
+
+        with pytest.raises(LLMRetriableError):
+            client.translate_text("text", system_prompt="translate")
+
+        assert server.stats.requests == 2
+        assert server.stats.faults == {"timeout": 2}
@@ -0,0 +1,108 @@
+from src.config.config import load_config
+from src.infra.llm_mock_server import MockLLMServerConfig
+from src.service.benchmark import (
+    run_layout_benchmark,
+    run_llm_benchmark,
+    run_render_benchmark,
+    run_subtitle_benchmark,
+    run_window_benchmark,
+    synthetic_cues,
+    write_synthetic_vtt,
+)
+from src.service.subtitle import SubtitleService
+
+
+def test_synthetic_cues_are_deterministic():
+    assert synthetic_cues(5, seed=3) == synthetic_cues(5, seed=3)
+    assert len(synthetic_cues(5)) == 5
+
+
+def test_llm_benchmark_translates_through_mock_server():
+    config = load_config()
+    config.translation.subtitle_batch_size = 10
+
+    result = run_llm_benchmark(
+        config,
+        cue_count=40,
+        server_config=MockLLMServerConfig(latency_ms=0, latency_distribution="fixed", seed=1),
+        include_segmentation=True,
+    )
+
+    assert result["input_cues"] == 40
+    assert result["untranslated_cues"] == 0
+    assert result["llm_calls"] == result["mock_server"]["requests"]
+    assert result["cached_tokens"] > 0
+
+
+def test_llm_benchmark_fused_mode_uses_fewer_calls():
+    # One synthetic cue per range keeps every fused range within the length limits.
+    server_config = MockLLMServerConfig(latency_ms=0, latency_distribution="fixed", segment_size=1, seed=1)
+    config = load_config()
+    config.translation.subtitle_batch_size = 2
+    two_pass = run_llm_benchmark(config, cue_count=40, server_config=server_config, include_segmentation=True)
+    config.translation.fused_segment_translation = True
+
+    fused = run_llm_benchmark(config, cue_count=40, server_config=server_config, include_segmentation=True)
+
+    assert fused["fused_segment_translation"] is True
+    assert fused["untranslated_cues"] == 0
+    assert fused["llm_calls"] < two_pass["llm_calls"]
+
+
+def test_synthetic_vtt_parses_as_word_timed_auto_captions(tmp_path):
+    path = write_synthetic_vtt(tmp_path / "long.en.vtt", hours=0.05, seed=2)
+
+    cues = SubtitleService(load_config(), translator=None).parse(path)
+
+    assert len(cues) > 200
+    assert all(len(cue.text.split()) == 1 for cue in cues)
+    assert cues[-1].end <= 0.05 * 3600 + 0.01
+
+
+def test_subtitle_benchmark_reports_time_and_memory():
+    result = run_subtitle_benchmark(load_config(), hours=0.05)
+
+    assert result["raw_cues"] > result["segmented_cues"] > 0
+    assert result["bytes_per_raw_cue"] > 0
+    assert result["parse_seconds"] >= 0
+
+
+def test_layout_benchmark_covers_cjk_and_latin_sets():
+    result = run_layout_benchmark(load_config(), cue_count=50)
+
+    # CJK-heavy translations are split into several single-line cues; Latin ones stay whole.
+    assert result["cjk_dialogue_lines"] > 100
+    assert result["latin_dialogue_lines"] == 100
+    assert result["latin_seconds"] >= 0
+
+
+def test_window_benchmark_compares_whole_and_windowed_flows():
+    result = run_window_benchmark(load_config(), hours=0.5, window_minutes=3)
+
+    assert result["whole_cues"] > 0
+    assert result["windowed_cues"] > 0
+    assert result["windowed_peak_mb"] < result["whole_peak_mb"]
+
+
+def test_render_benchmark_reports_every_profile(monkeypatch, tmp_path):
+    from src.infra.ffmpeg import RenderProgress
+
+    def fake_clip(output, **_kwargs):
+        return output.write_bytes(b"clip")
+
+    def fake_burn(*, output_video, codec, progress_callback, **_kwargs):
+        if codec == "h264_videotoolbox":
+            raise RuntimeError("ffmpeg 字幕压制失败:\nUnknown encoder")
+        output_video.write_bytes(b"x" * 12500)
+        progress_callback(RenderProgress(out_seconds=10.0, frame=300, total_seconds=10.0, done=True))
+
+    monkeypatch.setattr("src.service.benchmark.make_test_pattern", lambda output, **kwargs: fake_clip(output))
+    monkeypatch.setattr("src.service.benchmark.burn_ass_subtitle", fake_burn)
+    monkeypatch.setattr("src.service.benchmark.measure_quality", lambda *_args: {"psnr": 40.0, "ssim": 0.98})
+
+    result = run_render_benchmark(load_config(), seconds=10.0)
+
+    assert result["frames"] == 300
+    assert result["profiles"]["quality"]["bitrate_kbps"] == 10.0
+    assert result["profiles"]["quality"]["psnr"] == 40.0
+    assert result["profiles"]["fast"]["error"] == "Unknown encoder"
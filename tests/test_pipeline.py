@@ -1,10 +1,15 @@
+import json
 from pathlib import Path
 
 import pytest
 
-from src.config.config import load_config
-from src.service.pipeline import SingleVideoPipeline
-from src.service.subtitle import SubtitleCue
+from src.config.config import RenderOutputConfig, load_config
+from src.infra.ffmpeg import RenderProgress, StreamHTTPError, StreamInput
+from src.infra.process_watchdog import SubprocessStalledError
+from src.infra.yt_dlp import StreamSource
+from src.service.pipeline import RenderProgressReporter, SingleVideoPipeline
+from src.service.renderer import EncodingChoice, RenderService
+from src.service.subtitle import SubtitleCue, SubtitleService
 from src.state import StateRepository
 
 
@@ -61,13 +66,17 @@ class FakeSubtitle:
         cues[0].translation = "你好"
         return cues
 
-    def save_cues(self, cues, path):
+    def save_cues(self, cues, path, **_kwargs):
         Path(path).write_text("cached", encoding="utf-8")
 
-    def load_cues(self, _path):
+    def load_cues(self, _path, **_kwargs):
         self.calls.append("load_cache")
         return [SubtitleCue(0, 1, "Hello", "你好")]
 
+    def reuse_translations(self, _cues, _previous):
+        self.calls.append("reuse_translations")
+        return 0
+
     def write_bilingual_ass(self, _cues, path, **_kwargs):
         self.calls.append("ass")
         Path(path).write_text("ass", encoding="utf-8")
@@ -89,9 +98,17 @@ class FakeRenderer:
     def get_resolution(self, _path):
         return (1920, 1080)
 
-    def burn_subtitle(self, *, output_video, profile=None, **_kwargs):
-        self.calls.append(f"render:{profile}")
-        Path(output_video).write_bytes(b"rendered")
+    def choose_encoding(self, _input_video, *, profile=None):
+        self.calls.append("choose_encoding")
+        return EncodingChoice(crf=24, ssim=0.986, predicted_kbps=1800.0, trials={24: {"ssim": 0.986, "kbps": 1800.0}})
+
+    def output_target(self, output_video, output):
+        return RenderService().output_target(output_video, output)
+
+    def burn_subtitle(self, *, output_video, profile=None, encoding_choice=None, extra_targets=None, **_kwargs):
+        self.calls.append(f"render:{profile}" + (f":crf{encoding_choice.crf}" if encoding_choice else ""))
+        for path in [Path(output_video), *(target.output for target in extra_targets or [])]:
+            path.write_bytes(b"rendered")
 
 
 class FakeUploader:
@@ -110,7 +127,8 @@ def pipeline(tmp_path, monkeypatch, calls, *, subtitle_ok=True):
     cfg = load_config()
     cfg.download_dir = str(tmp_path / "downloads")
     cfg.output_dir = str(tmp_path / "output")
-    repo = StateRepository(str(tmp_path / "state.db"))
+    cfg.state_db = str(tmp_path / "state.db")
+    repo = StateRepository(cfg.state_db)
     job_id = repo.create_job(url="https://youtu.be/video1")
     pipe = SingleVideoPipeline(cfg, Logger(), repo)
     work_dir = Path(cfg.download_dir) / "video1"
@@ -122,6 +140,135 @@ def pipeline(tmp_path, monkeypatch, calls, *, subtitle_ok=True):
     return pipe, repo, job_id, work_dir
 
 
+def test_pipeline_marks_stalled_render_distinctly(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls)
+
+    def stalled_burn(**_kwargs):
+        raise SubprocessStalledError("ffmpeg 字幕压制", 600, ["Stream #0:0: Video: h264"])
+
+    pipe.renderer.burn_subtitle = stalled_burn
+
+    with pytest.raises(SubprocessStalledError):
+        pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True)
+
+    job = repo.get_job(job_id)
+    assert job["status"] == "stalled"
+    assert "Stream #0:0" in job["error"]
+    repo.close()
+
+
+def test_pipeline_streams_source_into_render_without_downloading(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls)
+    pipe.config.render.stream_source = True
+    source = StreamSource(
+        video=StreamInput("https://media.example/video"),
+        audio=StreamInput("https://media.example/audio"),
+        format_id="137+140",
+        width=1280,
+        height=720,
+    )
+    ass_sizes = []
+    rendered = {}
+    fetch_metadata = pipe.downloader.fetch_metadata
+
+    def metadata_with_formats(url):
+        meta = fetch_metadata(url)
+        # The HLS 1080p format is the largest listed but excluded by the stream selector.
+        meta["formats"] = [
+            {"format_id": "96", "protocol": "m3u8_native", "vcodec": "avc1", "acodec": "mp4a", "width": 1920, "height": 1080},
+            {"format_id": "18", "protocol": "https", "vcodec": "avc1", "acodec": "mp4a", "width": 640, "height": 360},
+            {"format_id": "137", "protocol": "https", "vcodec": "avc1", "acodec": "none", "width": 1280, "height": 720},
+            {"format_id": "140", "protocol": "https", "vcodec": "none", "acodec": "mp4a", "language": "en"},
+        ]
+        return meta
+
+    def resolve_stream(_url):
+        calls.append("stream")
+        return source
+
+    def write_ass(_cues, path, *, width, height):
+        calls.append("ass")
+        ass_sizes.append((width, height))
+        Path(path).write_text("ass", encoding="utf-8")
+
+    def burn_subtitle(**kwargs):
+        rendered.update(kwargs)
+        Path(kwargs["output_video"]).write_bytes(b"rendered")
+
+    pipe.downloader.fetch_metadata = metadata_with_formats
+    pipe.downloader.resolve_stream = resolve_stream
+    pipe.subtitle.write_bilingual_ass = write_ass
+    pipe.renderer.burn_subtitle = burn_subtitle
+
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True)
+
+    # URLs are resolved after translation and ASS, right before the render.
+    assert calls.index("translate_subtitle") < calls.index("ass") < calls.index("stream")
+    assert "video" not in calls
+    assert ass_sizes == [(1280, 720)]
+    assert rendered["input_video"] is source.video
+    assert rendered["audio_input"] is source.audio
+    manifest = json.loads((tmp_path / "output" / "video1.bilingual.render.json").read_text(encoding="utf-8"))
+    assert manifest["input_stream"]["format_id"] == "137+140"
+    assert "input_video" not in manifest
+    repo.close()
+
+
+def test_resumed_streamed_render_reuses_output_without_resolving(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls)
+    pipe.config.render.stream_source = True
+
+    def resolve_stream(_url):
+        calls.append("stream")
+        return StreamSource(video=StreamInput("https://media.example/video"), audio=None, format_id="22", width=1280, height=720)
+
+    pipe.downloader.resolve_stream = resolve_stream
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True)
+    assert calls.count("render:None") == 1
+
+    def unreachable(_url):
+        raise RuntimeError("yt-dlp unavailable")
+
+    pipe.downloader.resolve_stream = unreachable
+    calls.clear()
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, resume=True)
+
+    assert "render:None" not in calls
+    assert "video" not in calls
+    repo.close()
+
+
+def test_streamed_render_re_resolves_then_downloads_on_http_errors(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls)
+    pipe.config.render.stream_source = True
+    inputs = []
+
+    def resolve_stream(_url):
+        calls.append("stream")
+        return StreamSource(video=StreamInput("https://media.example/video"), audio=None, format_id="22", width=1280, height=720)
+
+    def burn_subtitle(*, input_video, output_video, **_kwargs):
+        inputs.append(input_video)
+        if isinstance(input_video, StreamInput):
+            raise StreamHTTPError("ffmpeg 字幕压制失败:\nServer returned 403 Forbidden (access denied)")
+        Path(output_video).write_bytes(b"rendered")
+
+    pipe.downloader.resolve_stream = resolve_stream
+    pipe.renderer.burn_subtitle = burn_subtitle
+
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True)
+
+    assert calls[-3:] == ["stream", "stream", "video"]
+    assert len(inputs) == 3 and isinstance(inputs[-1], Path)
+    manifest = json.loads((tmp_path / "output" / "video1.bilingual.render.json").read_text(encoding="utf-8"))
+    assert "input_stream" not in manifest and manifest["input_video"].endswith("video1.mp4")
+    repo.close()
+
+
 def test_pipeline_checks_subtitle_before_downloading_video(tmp_path, monkeypatch):
     calls = []
     pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls, subtitle_ok=False)
@@ -280,6 +427,39 @@ def test_resume_continues_from_segmented_cache(tmp_path, monkeypatch):
     repo.close()
 
 
+def test_resume_reuses_previous_translations_incrementally(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, work_dir = pipeline(tmp_path, monkeypatch, calls)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    (work_dir / "video1.en-zh-CN.translated.json").write_text("cached", encoding="utf-8")
+
+    def load_cues(_path, *, fingerprints=None):
+        # The source changed, so only the translation fingerprint still matches.
+        if "source" in (fingerprints or {}):
+            raise RuntimeError("字幕缓存指纹不匹配")
+        return [SubtitleCue(0, 1, "Hello", "你好")]
+
+    pipe.subtitle.load_cues = load_cues
+
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, resume=True, keep_files=True)
+
+    assert calls.index("segment") < calls.index("reuse_translations") < calls.index("translate_subtitle")
+    repo.close()
+
+
+def test_fresh_run_does_not_inherit_previous_translations(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, work_dir = pipeline(tmp_path, monkeypatch, calls)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    (work_dir / "video1.en-zh-CN.translated.json").write_text("cached", encoding="utf-8")
+
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, keep_files=True)
+
+    assert "reuse_translations" not in calls
+    assert "translate_subtitle" in calls
+    repo.close()
+
+
 def test_resume_rerenders_when_translation_changes_ass(tmp_path, monkeypatch):
     calls = []
     pipe, repo, job_id, work_dir = pipeline(tmp_path, monkeypatch, calls)
@@ -306,3 +486,186 @@ def test_resume_rerenders_when_translation_changes_ass(tmp_path, monkeypatch):
     assert "ass" in calls
     assert "render:None" in calls
     repo.close()
+
+
+def test_cache_fingerprints_change_only_for_affected_stages(tmp_path, monkeypatch):
+    pipe, repo, _job_id, _work_dir = pipeline(tmp_path, monkeypatch, [])
+    raw = tmp_path / "video1.en.vtt"
+    raw.write_text("WEBVTT\n", encoding="utf-8")
+    base = pipe._cache_fingerprints(raw, "en", "zh-CN")
+
+    pipe.config.translation.glossary = {"DataFrame": "数据框"}
+    glossary = pipe._cache_fingerprints(raw, "en", "zh-CN")
+    pipe.config.ai.model = "other-model"
+    model = pipe._cache_fingerprints(raw, "en", "zh-CN")
+    raw.write_text("WEBVTT\n\n00:00.000 --> 00:01.000\nfixed\n", encoding="utf-8")
+    source = pipe._cache_fingerprints(raw, "en", "zh-CN")
+
+    assert [name for name in base if base[name] != glossary[name]] == ["translation"]
+    assert [name for name in base if glossary[name] != model[name]] == ["segmentation", "translation"]
+    assert [name for name in base if model[name] != source[name]] == ["source"]
+    repo.close()
+
+
+def test_stale_translation_cache_keeps_valid_segmentation(tmp_path, monkeypatch):
+    pipe, repo, _job_id, _work_dir = pipeline(tmp_path, monkeypatch, [])
+    raw = tmp_path / "video1.en.vtt"
+    raw.write_text("WEBVTT\n", encoding="utf-8")
+    subtitle = SubtitleService(pipe.config, translator=None)
+    fingerprints = pipe._cache_fingerprints(raw, "en", "zh-CN")
+    cues = [SubtitleCue(0, 1, "Hello", "你好")]
+    subtitle.save_cues(cues, tmp_path / "translated.json", fingerprints=fingerprints)
+
+    pipe.config.translation.glossary = {"Hello": "哈喽"}
+    changed = pipe._cache_fingerprints(raw, "en", "zh-CN")
+
+    with pytest.raises(RuntimeError, match="translation 已变化"):
+        subtitle.load_cues(tmp_path / "translated.json", fingerprints=changed)
+    segmented = {name: changed[name] for name in ("source", "parser", "segmentation")}
+    assert subtitle.load_cues(tmp_path / "translated.json", fingerprints=segmented) == cues
+    repo.close()
+
+
+def test_windowed_translation_streams_cues_into_cache_and_ass(tmp_path, monkeypatch):
+    pipe, repo, job_id, work_dir = pipeline(tmp_path, monkeypatch, [])
+    raw = work_dir / "video1.en.vtt"
+
+    def download_subtitle(_url, _base_dir, *, video_id, source_lang, logger=None):
+        blocks = [f"00:{i // 60:02d}:{i % 60:02d}.000 --> 00:{i // 60:02d}:{i % 60:02d}.900\nword{i}{'.' if i % 20 == 19 else ''}" for i in range(180)]
+        raw.parent.mkdir(parents=True, exist_ok=True)
+        raw.write_text("WEBVTT\n\n" + "\n\n".join(blocks) + "\n", encoding="utf-8")
+        return raw
+
+    class EchoTranslator:
+        def segment_subtitle_batch(self, lines, *, source_lang: str):
+            return [{"start": i, "end": min(len(lines), i + 5) - 1} for i in range(0, len(lines), 5)]
+
+        def translate_subtitle_batch(self, lines, *, source_lang: str, target_lang: str):
+            return [f"译：{line}" for line in lines]
+
+    pipe.config.translation.window_minutes = 1
+    pipe.config.translation.window_overlap_seconds = 15
+    pipe.config.translation.rule_segmentation = False
+    pipe.downloader.download_subtitle = download_subtitle
+    pipe.subtitle = SubtitleService(pipe.config, EchoTranslator(), Logger())
+
+    record = pipe.run("https://youtu.be/video1", job_id=job_id, keep_files=True, stop_after="ass")
+
+    cached = pipe.subtitle.load_cues(work_dir / "video1.en-zh-CN.translated.json")
+    assert " ".join(cue.text for cue in cached).replace(".", "").split() == [f"word{i}" for i in range(180)]
+    assert all(cue.translation for cue in cached)
+    assert not (work_dir / "video1.en-zh-CN.translated.json.partial").exists()
+    assert Path(record["subtitle_path"]).read_text(encoding="utf-8").count("Dialogue:") >= len(cached)
+    repo.close()
+
+
+def test_windowed_translation_resumes_after_last_complete_window(tmp_path, monkeypatch):
+    pipe, repo, job_id, work_dir = pipeline(tmp_path, monkeypatch, [])
+    raw = work_dir / "video1.en.vtt"
+
+    def download_subtitle(_url, _base_dir, *, video_id, source_lang, logger=None):
+        blocks = [f"00:{i // 60:02d}:{i % 60:02d}.000 --> 00:{i // 60:02d}:{i % 60:02d}.900\nword{i}{'.' if i % 20 == 19 else ''}" for i in range(180)]
+        raw.parent.mkdir(parents=True, exist_ok=True)
+        raw.write_text("WEBVTT\n\n" + "\n\n".join(blocks) + "\n", encoding="utf-8")
+        return raw
+
+    class CountingTranslator:
+        def __init__(self, interrupt_at: int | None = None):
+            self.interrupt_at = interrupt_at
+            self.translated: list[list[str]] = []
+
+        def segment_subtitle_batch(self, lines, *, source_lang: str):
+            return [{"start": i, "end": min(len(lines), i + 5) - 1} for i in range(0, len(lines), 5)]
+
+        def translate_subtitle_batch(self, lines, *, source_lang: str, target_lang: str):
+            if len(self.translated) + 1 == self.interrupt_at:
+                raise KeyboardInterrupt
+            self.translated.append(list(lines))
+            return [f"译：{line}" for line in lines]
+
+    pipe.config.translation.window_minutes = 1
+    pipe.config.translation.window_overlap_seconds = 15
+    pipe.config.translation.subtitle_concurrency = 1
+    pipe.downloader.download_subtitle = download_subtitle
+    first = CountingTranslator(interrupt_at=2)
+    pipe.subtitle = SubtitleService(pipe.config, first, Logger())
+    with pytest.raises(KeyboardInterrupt):
+        pipe.run("https://youtu.be/video1", job_id=job_id, keep_files=True, stop_after="translation")
+    partial = work_dir / "video1.en-zh-CN.translated.json.partial"
+    with partial.open("a", encoding="utf-8") as f:
+        f.write('[61.0,62.0,"torn","append",null]\n')
+
+    second = CountingTranslator()
+    pipe.subtitle = SubtitleService(pipe.config, second, Logger())
+    pipe.run("https://youtu.be/video1", job_id=job_id, keep_files=True, stop_after="translation", resume=True)
+
+    assert not set(first.translated[0]) & {line for batch in second.translated for line in batch}
+    cached = pipe.subtitle.load_cues(work_dir / "video1.en-zh-CN.translated.json")
+    assert " ".join(cue.text for cue in cached).replace(".", "").split() == [f"word{i}" for i in range(180)]
+    assert all(cue.translation for cue in cached)
+    repo.close()
+
+
+def test_render_progress_reporter_rate_limits_job_updates(tmp_path, monkeypatch):
+    repo = StateRepository(str(tmp_path / "state.db"))
+    job_id = repo.create_job(url="https://youtu.be/video1")
+    clock = iter([0.0, 1.0, 6.0, 7.0])
+    monkeypatch.setattr("src.service.pipeline.time.monotonic", lambda: next(clock))
+    reporter = RenderProgressReporter(repo, Logger(), job_id, interval_seconds=5.0)
+
+    reporter(RenderProgress(out_seconds=30, fps=48, speed=2, total_seconds=120))
+    reporter(RenderProgress(out_seconds=40, fps=48, speed=2, total_seconds=120))
+    assert repo.get_job(job_id)["current_step"] == "压制 25.0%，48 fps，速度 2x，剩余约 0:45"
+    reporter(RenderProgress(out_seconds=60, fps=48, speed=2, total_seconds=120))
+    assert repo.get_job(job_id)["progress"] == 75
+    reporter(RenderProgress(out_seconds=120, total_seconds=120, done=True))
+
+    job = repo.get_job(job_id)
+    assert job["progress"] == 81
+    assert job["current_step"] == "压制 100.0%"
+    repo.close()
+
+
+def test_adaptive_encoding_choice_is_recorded_and_reused(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls)
+    pipe.config.render.adaptive.enabled = True
+
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, keep_files=True)
+
+    manifest = json.loads((Path(pipe.config.output_dir) / "video1.bilingual.render.json").read_text(encoding="utf-8"))
+    assert calls[-2:] == ["choose_encoding", "render:None:crf24"]
+    assert manifest["encoding"]["crf"] == 24
+    assert manifest["adaptive"]["target_ssim"] == pipe.config.render.adaptive.target_ssim
+
+    calls.clear()
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, resume=True, keep_files=True)
+    assert "choose_encoding" not in calls
+
+    pipe.config.render.adaptive.target_ssim = 0.99
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, resume=True, keep_files=True)
+    assert calls[-2:] == ["choose_encoding", "render:None:crf24"]
+    repo.close()
+
+
+def test_extra_outputs_render_in_one_pass_with_own_manifests(tmp_path, monkeypatch):
+    calls = []
+    pipe, repo, job_id, _work_dir = pipeline(tmp_path, monkeypatch, calls)
+    pipe.config.render.extra_outputs = [RenderOutputConfig(name="preview", codec="libx264", crf=28, height=480)]
+    output_dir = Path(pipe.config.output_dir)
+
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, keep_files=True)
+
+    assert calls.count("render:None") == 1
+    assert (output_dir / "video1.bilingual.preview.mp4").exists()
+    manifest = json.loads((output_dir / "video1.bilingual.preview.render.json").read_text(encoding="utf-8"))
+    assert manifest["output"]["height"] == 480
+
+    calls.clear()
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, resume=True, keep_files=True)
+    assert "render:None" not in calls
+
+    pipe.config.render.extra_outputs[0].crf = 30
+    pipe.run("https://youtu.be/video1", job_id=job_id, no_upload=True, resume=True, keep_files=True)
+    assert calls.count("render:None") == 1
+    repo.close()
@@ -1,16 +1,47 @@
+import json
+import os
+import shutil
+import subprocess
+from collections import OrderedDict
+
+import pytest
+
 from src.config.config import load_config
-from src.infra.ffmpeg import burn_ass_subtitle
-from src.service.renderer import RenderService
+from src.infra.ffmpeg import (
+    MediaInfo,
+    ProgressParser,
+    RenderProgress,
+    RenderTarget,
+    StreamHTTPError,
+    StreamInput,
+    burn_ass_subtitle,
+    burn_ass_subtitle_outputs,
+    count_video_packets,
+    encode_subtitled_segment,
+    get_media_duration,
+    get_video_resolution,
+    has_ffmpeg_filter,
+    make_test_pattern,
+    measure_quality,
+    probe_keyframes,
+    probe_video_stream,
+    render_preview,
+    set_probe_cache_dir,
+)
+from src.config.config import RenderSchedulerConfig
+from src.service.render_scheduler import RenderScheduler, ThreadBudget, plan_render_capacity
+from src.service.renderer import EncodingChoice, RenderService, RenderSpan, ass_event_spans, plan_render_spans
+from src.state import StateRepository
 
 
 def test_render_service_passes_fast_profile_to_ffmpeg(monkeypatch, tmp_path):
     captured = {}
 
-    def fake_burn(**kwargs):
-        captured.update(kwargs)
-        return tmp_path / "output.mp4"
+    def fake_burn(*, targets, **_kwargs):
+        captured.update(vars(targets[0]))
+        return [target.output for target in targets]
 
-    monkeypatch.setattr("src.service.renderer.burn_ass_subtitle", fake_burn)
+    monkeypatch.setattr("src.service.renderer.burn_ass_subtitle_outputs", fake_burn)
 
     RenderService(load_config()).burn_subtitle(
         input_video=tmp_path / "in.mp4",
@@ -24,6 +55,106 @@ def test_render_service_passes_fast_profile_to_ffmpeg(monkeypatch, tmp_path):
     assert captured["bitrate"] == "6M"
 
 
+def test_render_capacity_limits_slots_by_cores_and_memory():
+    config = RenderSchedulerConfig(enabled=True)
+
+    assert plan_render_capacity(config, cores=16, memory_mb=64_000).slots == 4
+    memory_bound = plan_render_capacity(config, cores=16, memory_mb=4_500)
+    assert memory_bound.slots == 2
+    assert memory_bound.budget == ThreadBudget(threads=8, lookahead_threads=1)
+    fixed = plan_render_capacity(RenderSchedulerConfig(max_concurrent=3, threads_per_encode=5), cores=16, memory_mb=None)
+    assert (fixed.slots, fixed.budget.threads) == (3, 5)
+
+
+def test_render_scheduler_admits_by_priority_within_capacity(tmp_path):
+    state = StateRepository(str(tmp_path / "state.db"))
+    running = state.enqueue_render("running")
+    assert state.admit_render(running, 1) == (True, 0)
+    low = state.enqueue_render("low", priority=0)
+    high = state.enqueue_render("high", priority=5)
+
+    assert state.render_queue_stats() == {"running": 1, "waiting": 2}
+    assert state.admit_render(low, 1) == (False, 1)
+    assert state.admit_render(high, 1) == (False, 0)
+
+    state.release_render(running)
+    assert state.admit_render(low, 1) == (False, 1)
+    assert state.admit_render(high, 1) == (True, 0)
+    state.release_render(high)
+
+    # "next" queues behind "low" (same priority, enqueued earlier) until low finishes.
+    scheduler = RenderScheduler(
+        state,
+        RenderSchedulerConfig(enabled=True, max_concurrent=1, threads_per_encode=6),
+        sleep=lambda _seconds: state.release_render(low),
+    )
+    waits: list[int] = []
+    with scheduler.slot("next", on_wait=waits.append) as budget:
+        assert budget == ThreadBudget(threads=6, lookahead_threads=1)
+        assert state.render_queue_stats() == {"running": 1, "waiting": 0}
+    assert waits == [1]
+    assert scheduler.queue_depth() == 0
+    state.close()
+
+
+def test_probe_cache_skips_scratch_dirs_and_prunes_at_startup(monkeypatch, tmp_path):
+    commands: list[list[str]] = []
+    _fake_ffprobe(monkeypatch, commands)
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    stale = cache / "stale.json"
+    stale.write_text("{}", encoding="utf-8")
+    old = stale.stat().st_mtime - 31 * 86400
+    os.utime(stale, (old, old))
+    (cache / "fresh.json").write_text("{}", encoding="utf-8")
+    (cache / "left.json.1.2.partial").write_text("{}", encoding="utf-8")
+
+    set_probe_cache_dir(cache)
+    try:
+        assert sorted(path.name for path in cache.iterdir()) == ["fresh.json"]
+        scratch = tmp_path / ".y2b-spans-abc123_x" / "joined.mp4"
+        scratch.parent.mkdir()
+        scratch.write_bytes(b"video")
+        assert count_video_packets(scratch) == 3
+    finally:
+        set_probe_cache_dir(None)
+
+    assert sorted(path.name for path in cache.iterdir()) == ["fresh.json"]
+
+
+def test_thread_budget_is_split_between_outputs(monkeypatch, tmp_path):
+    captured = {}
+
+    class Process:
+        stdout = []
+
+        def wait(self):
+            return 0
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+
+    def fake_popen(cmd, **_kwargs):
+        captured["cmd"] = cmd
+        return Process()
+
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", fake_popen)
+    cfg = load_config()
+    cfg.render.profile = "quality"
+
+    RenderService(cfg).burn_subtitle(
+        input_video=tmp_path / "in.mp4",
+        ass_path=tmp_path / "in.ass",
+        output_video=tmp_path / "full.mp4",
+        extra_targets=[RenderTarget(tmp_path / "preview.mp4", height=480)],
+        thread_budget=ThreadBudget(threads=8, lookahead_threads=2),
+    )
+
+    cmd = captured["cmd"]
+    assert cmd.count("-threads") == 2
+    assert cmd[cmd.index("-threads") + 1] == "4"
+    assert "threads=4:lookahead-threads=1" in cmd
+
+
 def test_ffmpeg_fast_encoding_builds_hardware_command(monkeypatch, tmp_path):
     captured = {}
 
@@ -53,4 +184,571 @@ def test_ffmpeg_fast_encoding_builds_hardware_command(monkeypatch, tmp_path):
 
     assert "h264_videotoolbox" in captured["cmd"]
     assert "-crf" not in captured["cmd"]
+    assert captured["cmd"][captured["cmd"].index("-progress") + 1] == "pipe:1"
     assert captured["cmd"][captured["cmd"].index("-b:v") + 1] == "6M"
+
+
+def test_progress_parser_reads_blocks_and_banner_duration():
+    parser = ProgressParser()
+    lines = [
+        "Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'in.mp4':",
+        "  Duration: 00:02:00.00, start: 0.000000, bitrate: 4000 kb/s",
+        "frame=1500",
+        "fps=50.00",
+        "out_time_us=60000000",
+        "out_time=00:01:00.000000",
+        "speed=2.5x",
+        "progress=continue",
+    ]
+
+    snapshots = [snapshot for line in lines if (snapshot := parser.feed(line))]
+
+    assert len(snapshots) == 1
+    snapshot = snapshots[0]
+    assert (snapshot.frame, snapshot.fps, snapshot.speed) == (1500, 50.0, 2.5)
+    assert snapshot.fraction == 0.5
+    assert snapshot.eta_seconds == 24.0
+    done = [parser.feed(line) for line in ("speed=N/A", "progress=end")][-1]
+    assert done.done and done.speed is None and done.eta_seconds == 0.0
+
+
+def test_ffmpeg_reports_progress_and_keeps_banner_for_errors(monkeypatch, tmp_path):
+    class Process:
+        stdout = [
+            "  Duration: 00:00:10.00, start: 0.000000\n",
+            "out_time_us=5000000\n",
+            "speed=1x\n",
+            "progress=continue\n",
+            "Error while filtering\n",
+        ]
+
+        def wait(self):
+            return 1
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", lambda *_args, **_kwargs: Process())
+    snapshots = []
+
+    with pytest.raises(RuntimeError) as excinfo:
+        burn_ass_subtitle(
+            input_video=tmp_path / "input.mp4",
+            ass_path=tmp_path / "subtitle.ass",
+            output_video=tmp_path / "output.mp4",
+            progress_callback=snapshots.append,
+        )
+
+    assert [snapshot.fraction for snapshot in snapshots] == [0.5]
+    assert "Error while filtering" in str(excinfo.value)
+    assert "out_time_us" not in str(excinfo.value)
+
+
+def _fake_ffprobe(monkeypatch, commands: list[list[str]]):
+    def fake_run(cmd, **_kwargs):
+        commands.append(cmd)
+        data = {
+            "format": {"duration": "12.5", "format_name": "mov,mp4"},
+            "streams": [
+                {"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080},
+                {"index": 1, "codec_type": "audio", "codec_name": "aac"},
+            ],
+        }
+        return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps(data), stderr="")
+
+    class PacketScan:
+        returncode = 0
+
+        def __init__(self, cmd):
+            commands.append(cmd)
+            self.stdout = iter(["2.000000,K__\n", "0.000000,K__\n", "1.000000,___\n"])
+
+        def communicate(self):
+            return "", ""
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda name: name)
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.run", fake_run)
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", lambda cmd, **_kwargs: PacketScan(cmd))
+    monkeypatch.setattr("src.infra.ffmpeg._probe_memory", OrderedDict())
+
+
+def test_probe_media_runs_ffprobe_once_per_file_version(monkeypatch, tmp_path):
+    video = tmp_path / "input.mp4"
+    video.write_bytes(b"video")
+    commands: list[list[str]] = []
+    _fake_ffprobe(monkeypatch, commands)
+    monkeypatch.setattr("src.infra.ffmpeg._probe_cache_dir", tmp_path / "cache")
+
+    assert get_video_resolution(video) == (1920, 1080)
+    assert get_media_duration(video) == 12.5
+    assert probe_video_stream(video)["codec_name"] == "h264"
+    assert len(commands) == 1
+
+    # A fresh process finds the entry on disk.
+    monkeypatch.setattr("src.infra.ffmpeg._probe_memory", OrderedDict())
+    assert get_video_resolution(video) == (1920, 1080)
+    assert len(commands) == 1
+
+    # Packets come from a separate, video-only scan added to the cached entry.
+    assert probe_keyframes(video) == [0.0, 2.0]
+    assert count_video_packets(video) == 3
+    assert len(commands) == 2
+    assert commands[1][commands[1].index("-select_streams") + 1] == "v:0"
+    assert "csv=p=0" in commands[1]
+
+    stat = video.stat()
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    get_video_resolution(video)
+    assert len(commands) == 3
+
+
+def test_measure_quality_parses_psnr_ssim_and_vmaf(monkeypatch, tmp_path):
+    captured = {}
+
+    class Result:
+        returncode = 0
+        stdout = ""
+        stderr = (
+            "[Parsed_psnr_2 @ 0x1] PSNR y:41.20 u:44.01 v:44.50 average:42.013 min:38.1 max:47.2\n"
+            "[Parsed_ssim_3 @ 0x2] SSIM Y:0.981 (17.2) U:0.99 (20.0) V:0.99 (20.1) All:0.9853 (18.3)\n"
+            "[Parsed_libvmaf_4 @ 0x3] VMAF score: 93.41\n"
+        )
+
+    def fake_run(cmd, **_kwargs):
+        captured["cmd"] = cmd
+        return Result()
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+    monkeypatch.setattr("src.infra.ffmpeg.has_ffmpeg_filter", lambda name: name == "libvmaf")
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.run", fake_run)
+
+    scores = measure_quality(tmp_path / "out.mp4", tmp_path / "ref.mp4")
+
+    assert scores == {"psnr": 42.013, "ssim": 0.9853, "vmaf": 93.41}
+    assert "[d2][r2]libvmaf" in captured["cmd"][captured["cmd"].index("-lavfi") + 1]
+
+
+def _fake_sampling(monkeypatch, encoded: list[int]):
+    def fake_encode(_sample, output, *, crf, **_kwargs):
+        encoded.append(crf)
+        # Bitrate halves every 6 CRF steps, as it roughly does for x264.
+        output.write_bytes(b"x" * int(4_000_000 * 2 ** (-(crf - 18) / 6)))
+        return output
+
+    monkeypatch.setattr("src.service.renderer.get_media_duration", lambda _path: 600.0)
+    monkeypatch.setattr("src.service.renderer.extract_clip", lambda _input, output, **_kwargs: output)
+    monkeypatch.setattr("src.service.renderer.encode_video", fake_encode)
+    monkeypatch.setattr(
+        "src.service.renderer.measure_quality",
+        lambda encoded, _ref, **_kwargs: {"ssim": 1.0 - int(encoded.name.split("crf")[1].split(".")[0]) * 0.0006},
+    )
+
+
+def test_choose_encoding_picks_highest_crf_meeting_target_ssim(monkeypatch):
+    encoded: list[int] = []
+    _fake_sampling(monkeypatch, encoded)
+    config = load_config()
+    config.render.adaptive.enabled = True
+    config.render.adaptive.target_ssim = 0.985
+
+    choice = RenderService(config).choose_encoding("in.mp4", profile="quality")
+
+    # 1 - 25 * 0.0006 = 0.985 is the last CRF meeting the target.
+    assert choice.crf == 25
+    assert choice.maxrate is None
+    assert len(set(encoded)) < config.render.adaptive.max_crf - config.render.adaptive.min_crf
+    assert RenderService(config).choose_encoding("in.mp4", profile="fast") is None
+
+
+def test_choose_encoding_raises_crf_and_sets_maxrate_under_size_cap(monkeypatch):
+    _fake_sampling(monkeypatch, [])
+    config = load_config()
+    config.render.adaptive.enabled = True
+    config.render.adaptive.target_ssim = 0.985
+    config.render.adaptive.max_size_mb = 200
+
+    choice = RenderService(config).choose_encoding("in.mp4", profile="quality")
+
+    # 200 MiB over 600 s allows ~2796 kbps; CRF 27 samples at ~2828 kbps, CRF 28 at ~2520 kbps.
+    assert choice.crf == 28
+    assert choice.predicted_kbps <= 2796
+    assert choice.maxrate == "2796k"
+    assert choice.bufsize == "5592k"
+
+
+def test_multi_output_burn_decodes_once_and_splits(monkeypatch, tmp_path):
+    captured = {}
+
+    class Process:
+        stdout = []
+
+        def wait(self):
+            return 0
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+
+    def fake_popen(cmd, **_kwargs):
+        captured["cmd"] = cmd
+        return Process()
+
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", fake_popen)
+
+    outputs = burn_ass_subtitle_outputs(
+        input_video=tmp_path / "input.mp4",
+        ass_path=tmp_path / "subtitle.ass",
+        targets=[
+            RenderTarget(tmp_path / "full.mp4", crf=20),
+            RenderTarget(tmp_path / "preview.mp4", preset="veryfast", crf=28, height=480),
+        ],
+    )
+
+    cmd = captured["cmd"]
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert cmd.count("-i") == 1
+    assert graph.count("ass=filename=") == 1
+    assert ",split=2[s0][s1]" in graph
+    assert "[s1]scale=-2:480[v1]" in graph
+    # Each output's options precede its own path.
+    assert cmd.index("[v0]") < cmd.index(str(tmp_path / "full.mp4")) < cmd.index("[v1]") < cmd.index(str(tmp_path / "preview.mp4"))
+    assert outputs == [tmp_path / "full.mp4", tmp_path / "preview.mp4"]
+
+
+def test_streamed_burn_reads_video_and_audio_urls_with_reconnect(monkeypatch, tmp_path):
+    captured = {}
+
+    class Process:
+        stdout = []
+
+        def wait(self):
+            return 0
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+
+    def fake_popen(cmd, **_kwargs):
+        captured["cmd"] = cmd
+        return Process()
+
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", fake_popen)
+
+    burn_ass_subtitle_outputs(
+        input_video=StreamInput("https://media.example/video", headers={"User-Agent": "UA"}),
+        audio_input=StreamInput("https://media.example/audio"),
+        ass_path=tmp_path / "subtitle.ass",
+        targets=[RenderTarget(tmp_path / "out.mp4")],
+    )
+
+    cmd = captured["cmd"]
+    video_at = cmd.index("https://media.example/video")
+    audio_at = cmd.index("https://media.example/audio")
+    assert cmd[video_at - 1] == "-i" and cmd[audio_at - 1] == "-i"
+    assert cmd.count("-reconnect") == 2
+    assert cmd[cmd.index("-headers") + 1] == "User-Agent: UA\r\n"
+    assert cmd.index("-headers") < video_at < audio_at
+    assert ["-map", "0:v:0", "-map", "1:a:0"] == cmd[cmd.index("-vf") + 2 : cmd.index("-vf") + 6]
+
+
+def test_preview_clip_seeks_input_and_keeps_subtitle_timestamps(monkeypatch, tmp_path):
+    captured = {}
+
+    class Result:
+        returncode = 0
+        stderr = ""
+
+    def fake_run(cmd, **_kwargs):
+        captured["cmd"] = cmd
+        return Result()
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.run", fake_run)
+
+    render_preview(input_video=tmp_path / "in.mp4", ass_path=tmp_path / "a.ass", output=tmp_path / "p.mp4", at=260.0)
+
+    cmd = captured["cmd"]
+    assert cmd.index("-ss") < cmd.index("-copyts") < cmd.index("-i")
+    assert cmd[cmd.index("-ss") + 1] == "260.000"
+    assert cmd[cmd.index("-preset") + 1] == "ultrafast"
+    assert cmd[cmd.index("-vf") + 1].endswith(",setpts=PTS-STARTPTS")
+
+
+def test_preview_reuses_artifacts_until_ass_changes(monkeypatch, tmp_path):
+    rendered = []
+
+    def fake_preview(*, output, at, **_kwargs):
+        rendered.append(at)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_bytes(b"preview")
+        return output
+
+    monkeypatch.setattr("src.service.renderer.render_preview", fake_preview)
+    ass = tmp_path / "video1.bilingual.ass"
+    ass.write_text("v1", encoding="utf-8")
+    service = RenderService(load_config())
+
+    def preview(*at):
+        return service.preview(input_video=tmp_path / "video1.mp4", ass_path=ass, output_dir=tmp_path / "previews", at=list(at))
+
+    first = preview(260.0, 600.0)
+    again = preview(260.0)
+    ass.write_text("v2", encoding="utf-8")
+    edited = preview(260.0)
+
+    assert [reused for _path, reused in first] == [False, False]
+    assert again == [(first[0][0], True)]
+    assert edited[0][0] != first[0][0] and edited[0][1] is False
+    assert rendered == [260.0, 600.0, 260.0]
+
+
+def test_ass_event_spans_merge_overlapping_dialogue(tmp_path):
+    ass = tmp_path / "a.ass"
+    ass.write_text(
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        "Dialogue: 1,0:00:20.00,0:00:25.00,CN,,0,0,60,,你好，世界\n"
+        "Dialogue: 0,0:00:20.00,0:00:25.00,EN,,0,0,20,,Hello, world\n"
+        "Dialogue: 0,0:00:24.50,0:00:30.00,EN,,0,0,20,,next\n"
+        "Dialogue: 0,1:00:01.25,1:00:02.00,EN,,0,0,20,,late\n",
+        encoding="utf-8",
+    )
+
+    assert ass_event_spans(ass) == [(20.0, 30.0), (3601.25, 3602.0)]
+
+
+def test_plan_render_spans_aligns_to_keyframes_and_skips_short_gaps():
+    keyframes = [float(t) for t in range(0, 100, 2)]
+
+    spans = plan_render_spans([(20.0, 25.0), (27.0, 30.0), (70.0, 72.0)], keyframes, 100.0, padding=0.5, min_copy_seconds=10)
+
+    assert spans == [
+        RenderSpan(0.0, 18.0, False),
+        RenderSpan(18.0, 32.0, True),
+        RenderSpan(32.0, 68.0, False),
+        RenderSpan(68.0, 74.0, True),
+        RenderSpan(74.0, 100.0, False),
+    ]
+    assert plan_render_spans([(3.0, 95.0)], keyframes, 100.0) == [RenderSpan(0.0, 100.0, True)]
+
+
+def _selective_service(monkeypatch, tmp_path, *, codec_name="h264", packets=(300, 300)):
+    calls = []
+    monkeypatch.setattr(
+        "src.service.renderer.probe_video_stream",
+        lambda _path: {
+            "codec_name": codec_name,
+            "profile": "High",
+            "pix_fmt": "yuv420p",
+            "r_frame_rate": "30/1",
+            "avg_frame_rate": "30/1",
+            "duration": 100.0,
+        },
+    )
+    joined_packets, source_packets = packets
+    source = MediaInfo(
+        duration=100.0,
+        format_name="mov,mp4",
+        streams=[],
+        keyframes=[float(t) for t in range(0, 100, 2)],
+        video_packets=source_packets,
+    )
+    monkeypatch.setattr("src.service.renderer.probe_media", lambda _path, **_kwargs: source)
+
+    def fake_encode(_input, _ass, output, *, start, profile, **_kwargs):
+        calls.append(("encode", round(start, 3), profile))
+        output.write_bytes(b"enc")
+
+    def fake_copy(_input, output, *, start, duration, progress_callback=None, **_kwargs):
+        calls.append(("copy", round(start, 3), round(duration, 3)))
+        if progress_callback:
+            progress_callback(RenderProgress(out_seconds=duration, speed=20.0))
+        output.write_bytes(b"copy")
+
+    def fake_concat(segments, _audio, output):
+        calls.append(("concat", len(segments)))
+        output.write_bytes(b"joined")
+        return output
+
+    def fake_full(*, targets, **_kwargs):
+        calls.append(("full",))
+        return [target.output for target in targets]
+
+    monkeypatch.setattr("src.service.renderer.encode_subtitled_segment", fake_encode)
+    monkeypatch.setattr("src.service.renderer.copy_video_segment", fake_copy)
+    monkeypatch.setattr("src.service.renderer.concat_segments_with_audio", fake_concat)
+    monkeypatch.setattr("src.service.renderer.count_video_packets", lambda _path: joined_packets)
+    monkeypatch.setattr("src.service.renderer.burn_ass_subtitle_outputs", fake_full)
+    ass = tmp_path / "a.ass"
+    ass.write_text("Dialogue: 0,0:00:20.00,0:00:25.00,EN,,0,0,20,,Hello\n", encoding="utf-8")
+    config = load_config()
+    config.render.selective.enabled = True
+    return RenderService(config), ass, calls
+
+
+def test_selective_render_copies_subtitle_free_spans(monkeypatch, tmp_path):
+    service, ass, calls = _selective_service(monkeypatch, tmp_path)
+
+    output = service.burn_subtitle(input_video=tmp_path / "in.mp4", ass_path=ass, output_video=tmp_path / "out.mp4")
+
+    assert output.read_bytes() == b"joined"
+    assert calls == [
+        ("copy", 0.017, 17.967),
+        ("encode", 17.983, "high"),
+        ("copy", 26.017, 73.967),
+        ("concat", 3),
+    ]
+    assert not list(tmp_path.glob(".y2b-spans-*"))
+
+
+def test_selective_render_falls_back_to_full_encode(monkeypatch, tmp_path):
+    service, ass, calls = _selective_service(monkeypatch, tmp_path, codec_name="vp9")
+    service.burn_subtitle(input_video=tmp_path / "in.mp4", ass_path=ass, output_video=tmp_path / "out.mp4")
+    assert calls == [("full",)]
+
+    service, ass, calls = _selective_service(monkeypatch, tmp_path, packets=(299, 300))
+    service.burn_subtitle(input_video=tmp_path / "in.mp4", ass_path=ass, output_video=tmp_path / "out2.mp4")
+    assert calls[-1] == ("full",)
+    assert not (tmp_path / "out2.mp4").exists()
+
+
+def test_selective_render_keeps_rate_control_and_reports_whole_video_progress(monkeypatch, tmp_path):
+    service, ass, _calls = _selective_service(monkeypatch, tmp_path)
+    encodes = []
+
+    def fake_encode(_input, _ass, output, *, progress_callback, stall_seconds, **kwargs):
+        encodes.append({**kwargs, "stall_seconds": stall_seconds})
+        progress_callback(RenderProgress(out_seconds=4.0, fps=60.0, speed=2.0))
+        output.write_bytes(b"enc")
+
+    monkeypatch.setattr("src.service.renderer.encode_subtitled_segment", fake_encode)
+    snapshots = []
+
+    service.burn_subtitle(
+        input_video=tmp_path / "in.mp4",
+        ass_path=ass,
+        output_video=tmp_path / "out.mp4",
+        encoding_choice=EncodingChoice(crf=24, ssim=0.98, predicted_kbps=2000.0, maxrate="3000k", bufsize="6000k"),
+        progress_callback=snapshots.append,
+    )
+
+    assert (encodes[0]["crf"], encodes[0]["maxrate"], encodes[0]["bufsize"]) == (24, "3000k", "6000k")
+    assert encodes[0]["stall_seconds"] == service.config.render.stall_timeout_seconds
+    assert [round(snapshot.out_seconds, 3) for snapshot in snapshots] == [17.967, 22.0, 99.967, 100.0]
+    assert all(snapshot.total_seconds == 100.0 for snapshot in snapshots)
+    assert snapshots[-1].done
+
+
+def test_subtitled_segment_encode_passes_bitrate_and_reports_progress(monkeypatch, tmp_path):
+    captured = {}
+
+    class Process:
+        stdout = ["out_time_us=1500000\n", "speed=3x\n", "progress=continue\n"]
+
+        def wait(self):
+            return 0
+
+    def fake_popen(cmd, **_kwargs):
+        captured["cmd"] = cmd
+        return Process()
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", fake_popen)
+    snapshots = []
+
+    encode_subtitled_segment(
+        tmp_path / "in.mp4",
+        tmp_path / "a.ass",
+        tmp_path / "seg.ts",
+        start=10.0,
+        duration=4.0,
+        codec="libx264",
+        preset="fast",
+        crf=None,
+        profile="high",
+        pix_fmt="yuv420p",
+        bitrate="6M",
+        progress_callback=snapshots.append,
+    )
+
+    cmd = captured["cmd"]
+    assert cmd[cmd.index("-b:v") + 1] == "6M"
+    assert cmd[cmd.index("-progress") + 1] == "pipe:1"
+    assert [(snapshot.out_seconds, snapshot.speed) for snapshot in snapshots] == [(1.5, 3.0)]
+
+
+def test_http_error_from_network_input_is_reported_as_stream_error(monkeypatch, tmp_path):
+    class Process:
+        stdout = ["[https @ 0x1] HTTP error 403 Forbidden\n", "Server returned 403 Forbidden (access denied)\n"]
+
+        def wait(self):
+            return 1
+
+    monkeypatch.setattr("src.infra.ffmpeg._bin", lambda _name: "ffmpeg")
+    monkeypatch.setattr("src.infra.ffmpeg.subprocess.Popen", lambda *_args, **_kwargs: Process())
+
+    with pytest.raises(StreamHTTPError, match="403 Forbidden"):
+        burn_ass_subtitle_outputs(
+            input_video=StreamInput("https://media.example/video"),
+            ass_path=tmp_path / "a.ass",
+            targets=[RenderTarget(tmp_path / "out.mp4")],
+        )
+
+
+_HAS_FFMPEG = bool(shutil.which("ffmpeg") and shutil.which("ffprobe"))
+
+
+def _stream_start_times(path) -> dict[str, float]:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,start_time", "-of", "json", str(path)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {stream["codec_type"]: float(stream["start_time"]) for stream in json.loads(result.stdout)["streams"]}
+
+
+@pytest.mark.skipif(not _HAS_FFMPEG, reason="需要 ffmpeg/ffprobe")
+def test_selective_render_matches_source_timing_with_real_ffmpeg(tmp_path):
+    if not has_ffmpeg_filter("subtitles"):
+        pytest.skip("ffmpeg 未启用 libass subtitles 滤镜")
+    pattern = make_test_pattern(tmp_path / "pattern.mp4", seconds=12, width=320, height=240)
+    # The lossless pattern is High 4:4:4; selective rendering needs a regular High profile source.
+    source = tmp_path / "source.mp4"
+    subprocess.run(
+        ["ffmpeg", "-y", "-v", "error", "-i", str(pattern), "-c:v", "libx264", "-profile:v", "high"]
+        + ["-pix_fmt", "yuv420p", "-g", "30", "-c:a", "aac", str(source)],
+        check=True,
+    )
+    ass = tmp_path / "a.ass"
+    ass.write_text(
+        "[Script Info]\nScriptType: v4.00+\nPlayResX: 320\nPlayResY: 240\n\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, BackColour, Bold, Italic, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV\n"
+        "Style: EN,Arial,20,&H00FFFFFF,&H00000000,0,0,1,1,0,2,10,10,10\n\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        "Dialogue: 0,0:00:05.00,0:00:06.00,EN,,0,0,10,,Hello\n",
+        encoding="utf-8",
+    )
+    warnings: list[str] = []
+
+    class Logger:
+        def info(self, _message):
+            pass
+
+        def warning(self, message):
+            warnings.append(message)
+
+    config = load_config()
+    config.render.profile = "fast"
+    config.render.selective.enabled = True
+    config.render.selective.min_copy_seconds = 2.0
+
+    output = RenderService(config, Logger()).burn_subtitle(
+        input_video=source, ass_path=ass, output_video=tmp_path / "out.mp4"
+    )
+
+    assert warnings == []
+    assert abs(get_media_duration(output) - get_media_duration(source)) < 0.1
+    assert count_video_packets(output) == count_video_packets(source)
+    source_starts = _stream_start_times(source)
+    output_starts = _stream_start_times(output)
+    assert set(output_starts) == {"video", "audio"}
+    for codec_type, start in source_starts.items():
+        assert abs(output_starts[codec_type] - start) < 0.05
@@ -1,3 +1,4 @@
+import sqlite3
 from pathlib import Path
 from src.state import StateRepository
 
@@ -11,6 +12,7 @@ def test_state_repository_flow(tmp_path: Path):
     }
 
     assert "jobs" in tables
+    assert "llm_usage" in tables
     assert "videos" not in tables
     assert "meta" not in tables
 
@@ -44,8 +46,63 @@ def test_state_repository_flow(tmp_path: Path):
     assert job["error"] == "Some fatal error"
     assert job["current_step"] == "失败"
 
+    # Test LLM usage ledger and per-job prompt cache accounting
+    for stage, cached, miss in (("segmentation", 300, 100), ("translation", 50, 10), ("translation", 0, 20)):
+        repo.record_llm_usage(
+            job_id,
+            stage=stage,
+            model="deepseek-v4-flash",
+            prompt_tokens=cached + miss,
+            completion_tokens=40,
+            cached_tokens=cached,
+            cache_miss_tokens=miss,
+            latency_ms=800,
+            retries=1 if miss == 20 else 0,
+            retry_wait_ms=1200 if miss == 20 else 0,
+            cost=0.01,
+        )
+    job = repo.get_job(job_id)
+    assert job["prompt_cache_hit_tokens"] == 350
+    assert job["prompt_cache_miss_tokens"] == 130
+    by_stage = {row["stage"]: row for row in repo.llm_usage_by_stage(job_id)}
+    assert by_stage["translation"]["calls"] == 2
+    assert by_stage["translation"]["retries"] == 1
+    assert by_stage["translation"]["retry_wait_ms"] == 1200
+    assert by_stage["translation"]["avg_latency_ms"] == 800
+    assert by_stage["segmentation"]["prompt_tokens"] == 400
+    [by_model] = repo.llm_usage_rollup(group_by="model")
+    assert by_model["bucket"] == "deepseek-v4-flash"
+    assert by_model["completion_tokens"] == 120
+    assert round(by_model["cost"], 2) == 0.03
+    assert len(repo.llm_usage_rollup(group_by="day", days=1)) == 1
+
     active_job = repo.create_job(url="https://youtube.com/watch?v=unfinished")
     assert repo.mark_unfinished_interrupted() == 1
     assert repo.get_job(active_job)["status"] == "interrupted"
 
     repo.close()
+
+
+def test_state_drops_legacy_prompt_cache_columns(tmp_path: Path):
+    db_file = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        """
+        CREATE TABLE jobs (
+            job_id TEXT PRIMARY KEY, url TEXT NOT NULL, status TEXT NOT NULL,
+            prompt_cache_hit_tokens INTEGER DEFAULT 0, prompt_cache_miss_tokens INTEGER DEFAULT 0
+        )
+        """
+    )
+    conn.execute("INSERT INTO jobs(job_id, url, status, prompt_cache_hit_tokens) VALUES ('j1', 'u', 'queued', 999)")
+    conn.commit()
+    conn.close()
+
+    repo = StateRepository(str(db_file))
+    cols = {row["name"] for row in repo.conn.execute("PRAGMA table_info(jobs)").fetchall()}
+    job = repo.get_job("j1")
+    repo.close()
+
+    assert "prompt_cache_hit_tokens" not in cols
+    assert job["prompt_cache_hit_tokens"] == 0
+    assert job["prompt_cache_miss_tokens"] == 0
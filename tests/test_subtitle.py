@@ -1,6 +1,10 @@
+import io
+import json
 from pathlib import Path
 import time
 
+import pytest
+
 from src.config.config import load_config
 from src.infra.ai_client import _coerce_translation_result, _parse_json_value, build_subtitle_translation_prompt
 from src.service.subtitle import SubtitleCue, SubtitleService
@@ -32,6 +36,22 @@ def test_parse_vtt_skips_blank_padding_after_timing(tmp_path: Path):
     assert cues[0].end == 1.02
 
 
+def test_iter_cues_streams_vtt_with_identifiers_and_rolling_duplicates(tmp_path: Path):
+    path = tmp_path / "sample.en.vtt"
+    path.write_bytes(
+        b"\xef\xbb\xbfWEBVTT\r\r"
+        b"intro\r00:00:00.000 --> 00:00:01.000\rHello &amp; <c>welcome</c>\r\r"
+        b"00:00:00.500 --> 00:00:02.000\rHello &amp; welcome\r\r"
+        b"NOTE skipped\r\r"
+        b"00:00:02.000 --> 00:00:03.000\rnext<00:00:02.500><c> word</c>\r"
+    )
+
+    stream = service().iter_cues(path)
+
+    assert next(stream) == SubtitleCue(0.0, 2.0, "Hello & welcome")
+    assert list(stream) == [SubtitleCue(2.0, 2.5, "next"), SubtitleCue(2.5, 3.0, "word")]
+
+
 def test_split_youtube_timed_vtt_cue():
     cues = service()._split_timed_vtt_cue(
         0.0,
@@ -301,6 +321,35 @@ def test_write_bilingual_ass_keeps_chinese_single_line(tmp_path: Path):
     assert ",CN,,0,0,144,," in cn_dialogue_lines[-1]
 
 
+def test_stream_bilingual_ass_writes_to_any_sink(tmp_path: Path):
+    svc = service()
+    cues = [SubtitleCue(0.0, 1.0, "hello", "你好"), SubtitleCue(1.0, 2.0, "world", "世界")]
+    sink = io.StringIO()
+
+    count = svc.stream_bilingual_ass(iter(cues), sink, width=1920, height=1080)
+    path = svc.write_bilingual_ass(cues, tmp_path / "sample.ass", width=1920, height=1080)
+
+    assert count == 4
+    assert sink.getvalue() == path.read_text(encoding="utf-8")
+    assert sink.getvalue().count("Dialogue:") == 4
+
+
+def test_interrupted_ass_write_keeps_previous_file(tmp_path: Path):
+    svc = service()
+    output = tmp_path / "sample.ass"
+    output.write_text("previous", encoding="utf-8")
+
+    def failing_cues():
+        yield SubtitleCue(0.0, 1.0, "hello", "你好")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        svc.write_bilingual_ass(failing_cues(), output, width=1920, height=1080)
+
+    assert output.read_text(encoding="utf-8") == "previous"
+    assert [path.name for path in tmp_path.iterdir()] == ["sample.ass"]
+
+
 def test_split_cue_for_single_line_cn_splits_translation_and_timing():
     svc = service()
     cue = SubtitleCue(
@@ -340,6 +389,102 @@ def test_subtitle_cache_round_trip(tmp_path: Path):
     assert svc.load_cues(path) == cues
 
 
+def test_cue_cache_round_trips_in_checksummed_blocks(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("src.service.subtitle._CUE_CACHE_BLOCK_SIZE", 2)
+    svc = service()
+    path = tmp_path / "segmented.json"
+    cues = [
+        SubtitleCue(0.0, 1.0, "we load", word_starts=[0.0, 0.4]),
+        SubtitleCue(1.0, 2.0, "the data", "数据"),
+        SubtitleCue(2.0, 3.0, "now"),
+    ]
+
+    svc.save_cues(cues, path, fingerprints={"source": "abc"})
+    lines = path.read_text(encoding="utf-8").splitlines()
+
+    assert json.loads(lines[0])["fingerprints"] == {"source": "abc"}
+    assert len(lines) == 1 + 2 + 1 + 1 + 1
+    assert list(svc.iter_cached_cues(path)) == cues
+    assert svc.load_cues(path, fingerprints={"source": "abc"}) == cues
+
+
+def test_cue_cache_rejects_changed_inputs_and_corruption(tmp_path: Path):
+    svc = service()
+    path = tmp_path / "segmented.json"
+    svc.save_cues([SubtitleCue(0.0, 1.0, "Hello", "你好")], path, fingerprints={"source": "abc", "parser": "1"})
+
+    assert svc.load_cues(path, fingerprints={"parser": "1"})
+    with pytest.raises(RuntimeError, match="parser 已变化"):
+        svc.load_cues(path, fingerprints={"source": "abc", "parser": "2"})
+
+    path.write_text(path.read_text(encoding="utf-8").replace("Hello", "Hallo"), encoding="utf-8")
+    with pytest.raises(RuntimeError, match="校验失败"):
+        svc.load_cues(path)
+
+
+def test_cue_cache_append_drops_interrupted_tail(tmp_path: Path):
+    svc = service()
+    path = tmp_path / "translated.json"
+    svc.save_cues([SubtitleCue(0.0, 1.0, "one", "一")], path)
+
+    svc.append_cues([SubtitleCue(1.0, 2.0, "two", "二")], path)
+    with path.open("a", encoding="utf-8") as f:
+        f.write('[2.0,3.0,"three",null,null]\n')
+
+    assert [cue.text for cue in svc.load_cues(path)] == ["one", "two"]
+
+
+def test_load_cues_reads_legacy_json_cache(tmp_path: Path):
+    path = tmp_path / "translated.json"
+    path.write_text(
+        json.dumps([{"start": 0.0, "end": 1.0, "text": "Hello", "translation": "你好"}], ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+
+    assert service().load_cues(path) == [SubtitleCue(0.0, 1.0, "Hello", "你好")]
+    with pytest.raises(RuntimeError, match="没有输入指纹"):
+        service().load_cues(path, fingerprints={"translation": "abc"})
+
+
+def _translated_track(texts: list[str], *, shift: float = 0.0) -> list[SubtitleCue]:
+    return [SubtitleCue(i * 2.0 + shift, i * 2.0 + shift + 1.8, text, f"译{i}") for i, text in enumerate(texts)]
+
+
+def test_reuse_translations_retranslates_changed_span_with_context():
+    previous = _translated_track(["one.", "two.", "three.", "four.", "five.", "six.", "seven."])
+    cues = [SubtitleCue(cue.start, cue.end, cue.text) for cue in previous]
+    cues[3].text = "four, fixed by the uploader."
+
+    reused = service().reuse_translations(cues, previous, context=1)
+
+    assert reused == 4
+    assert [cue.translation for cue in cues] == ["译0", "译1", None, None, None, "译5", "译6"]
+
+
+def test_reuse_translations_ignores_case_punctuation_and_global_shift():
+    previous = _translated_track(["Hello, world.", "We load data.", "Then plot it."])
+    # An intro was cut: every cue moved 30 s earlier and punctuation was cleaned up.
+    cues = [SubtitleCue(cue.start - 30, cue.end - 30, cue.text.lower().rstrip(".")) for cue in previous]
+
+    assert service().reuse_translations(cues, previous, context=0) == 3
+    assert [cue.translation for cue in cues] == ["译0", "译1", "译2"]
+
+
+def test_reuse_translations_rejects_far_away_repeats_and_fallbacks():
+    previous = _translated_track(["yes.", "so.", "right."])
+    previous[2].translation = "right."
+    cues = [
+        SubtitleCue(0.0, 1.8, "yes."),
+        SubtitleCue(2.0, 3.8, "so."),
+        SubtitleCue(4.0, 5.8, "right."),
+        SubtitleCue(90.0, 91.8, "yes."),
+    ]
+
+    service().reuse_translations(cues, previous, context=0)
+
+    assert [cue.translation for cue in cues] == ["译0", "译1", None, None]
+
+
 def test_repair_missing_translations_retries_substantive_empty_result():
     calls: list[str] = []
 
@@ -404,3 +549,277 @@ def test_concurrent_translation_preserves_cue_order():
 
     assert completed == ["second", "first"]
     assert [cue.translation for cue in translated] == ["translated-first", "translated-second"]
+
+
+def _fused_config():
+    config = load_config()
+    config.translation.fused_segment_translation = True
+    config.translation.segmentation_concurrency = 1
+    config.translation.rule_segmentation = False
+    return config
+
+
+def _fused_tokens() -> list[SubtitleCue]:
+    return [
+        SubtitleCue(0.0, 1.0, "We load the data"),
+        SubtitleCue(1.0, 2.0, "frame first."),
+        SubtitleCue(2.5, 3.5, "Now plot the monthly"),
+        SubtitleCue(3.5, 4.5, "returns chart."),
+    ]
+
+
+def test_fused_segmentation_attaches_translations_and_skips_second_pass():
+    batches: list[tuple] = []
+
+    class FusedTranslator:
+        def segment_and_translate_batch(self, lines, *, source_lang: str, target_lang: str):
+            assert target_lang == "zh-CN"
+            return [{"start": 0, "end": 1, "text": "先加载数据框。"}, {"start": 2, "end": 3, "text": "再画月度收益图。"}]
+
+        def translate_subtitle_batch(self, lines, *, source_lang: str, target_lang: str):
+            batches.append(tuple(lines))
+            return [f"译-{line}" for line in lines]
+
+    svc = SubtitleService(_fused_config(), FusedTranslator())
+
+    segmented = svc.segment_cues(_fused_tokens(), source_lang="en", target_lang="zh-CN")
+    translated = svc.translate_segmented_cues(segmented, source_lang="en", target_lang="zh-CN")
+
+    assert [cue.text for cue in translated] == ["We load the data frame first.", "Now plot the monthly returns chart."]
+    assert [cue.translation for cue in translated] == ["先加载数据框。", "再画月度收益图。"]
+    assert batches == []
+
+
+def test_fused_segmentation_falls_back_to_two_pass_on_invalid_ranges():
+    class BrokenFusedTranslator:
+        def segment_and_translate_batch(self, lines, *, source_lang: str, target_lang: str):
+            return [{"start": 0, "end": 1, "text": "只覆盖一半"}]
+
+        def segment_subtitle_batch(self, lines, *, source_lang: str):
+            return [{"start": 0, "end": 1}, {"start": 2, "end": 3}]
+
+        def translate_subtitle_batch(self, lines, *, source_lang: str, target_lang: str):
+            return [f"译-{line}" for line in lines]
+
+    svc = SubtitleService(_fused_config(), BrokenFusedTranslator())
+
+    segmented = svc.segment_cues(_fused_tokens(), source_lang="en", target_lang="zh-CN")
+    assert all(cue.translation is None for cue in segmented)
+    translated = svc.translate_segmented_cues(segmented, source_lang="en", target_lang="zh-CN")
+
+    assert [cue.translation for cue in translated] == [
+        "译-We load the data frame first.",
+        "译-Now plot the monthly returns chart.",
+    ]
+
+
+def test_fused_segmentation_is_opt_in():
+    class TwoPassTranslator:
+        def segment_and_translate_batch(self, lines, **_kwargs):
+            raise AssertionError("fused mode must be opt-in")
+
+        def segment_subtitle_batch(self, lines, *, source_lang: str):
+            return [{"start": 0, "end": 3}]
+
+    config = load_config()
+    config.translation.segmentation_concurrency = 1
+    config.translation.rule_segmentation = False
+    svc = SubtitleService(config, TwoPassTranslator())
+
+    segmented = svc.segment_cues(_fused_tokens(), source_lang="en", target_lang="zh-CN")
+
+    assert [cue.translation for cue in segmented] == [None]
+
+
+class _CountingSegmenter:
+    def __init__(self):
+        self.calls = 0
+
+    def segment_subtitle_batch(self, lines, *, source_lang: str):
+        self.calls += 1
+        return [{"start": i, "end": i} for i in range(len(lines))]
+
+
+def _manual_track() -> list[SubtitleCue]:
+    lines = [
+        "Today we are going to load a CSV file.",
+        "First, import pandas as pd,",
+        "then call the read CSV function.",
+        "The result is a data frame.",
+        "Let's print the first five rows.",
+        "Now we can compute monthly returns.",
+    ]
+    return [SubtitleCue(i * 3.0, i * 3.0 + 2.8, text) for i, text in enumerate(lines)]
+
+
+def _asr_tokens() -> list[SubtitleCue]:
+    words = "so today we are going to load a csv file and then we call the read csv function on it".split()
+    return [SubtitleCue(i * 0.4, i * 0.4 + 0.4, word) for i, word in enumerate(words)]
+
+
+def test_rule_segmentation_confidence_separates_manual_and_asr_tracks():
+    svc = service()
+
+    assert svc._rule_segmentation_confidence(_manual_track()) >= 0.9
+    assert svc._rule_segmentation_confidence(_asr_tokens()) == 0.0
+
+
+def test_punctuated_manual_track_skips_llm_segmentation():
+    config = load_config()
+    config.translation.rule_segmentation = True
+    segmenter = _CountingSegmenter()
+    svc = SubtitleService(config, segmenter)
+
+    segmented = svc.segment_cues(_manual_track(), source_lang="en", track_kind="manual")
+
+    assert segmenter.calls == 0
+    assert segmented[0].text == "Today we are going to load a CSV file."
+    assert segmented[1].text.startswith("First, import pandas as pd, then call the read_csv function.")
+
+
+def test_asr_track_never_takes_rule_segmentation_fast_path():
+    config = load_config()
+    config.translation.rule_segmentation = True
+    segmenter = _CountingSegmenter()
+    svc = SubtitleService(config, segmenter)
+
+    svc.segment_cues(_manual_track(), source_lang="en", track_kind="asr")
+
+    assert segmenter.calls == 1
+
+
+def test_asr_regions_still_use_llm_segmentation():
+    config = load_config()
+    config.translation.rule_segmentation = True
+    config.translation.segmentation_batch_size = 40
+    config.translation.segmentation_concurrency = 1
+    segmenter = _CountingSegmenter()
+    svc = SubtitleService(config, segmenter)
+    manual = (_manual_track() * 7)[:40]
+    asr = [SubtitleCue(cue.start + 200, cue.end + 200, cue.text) for cue in _asr_tokens() * 3]
+
+    svc.segment_cues([*manual, *asr], source_lang="en")
+
+    # Batch 1 is the punctuated region; the two ASR batches go to the LLM.
+    assert segmenter.calls == 2
+
+
+def test_parse_json3_keeps_word_timings_and_clips_rolling_events(tmp_path: Path):
+    path = tmp_path / "sample.en.json3"
+    path.write_text(
+        json.dumps(
+            {
+                "events": [
+                    {"tStartMs": 0, "dDurationMs": 5000},
+                    {
+                        "tStartMs": 1000,
+                        "dDurationMs": 4000,
+                        "segs": [{"utf8": "we"}, {"utf8": " load", "tOffsetMs": 400}, {"utf8": " data", "tOffsetMs": 900}],
+                    },
+                    {"tStartMs": 2500, "dDurationMs": 10, "aAppend": 1, "segs": [{"utf8": "\n"}]},
+                    {"tStartMs": 2600, "dDurationMs": 3000, "segs": [{"utf8": "Hello there."}]},
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    cues = service().parse(path)
+
+    assert [(c.start, c.end, c.text) for c in cues] == [
+        (1.0, 1.4, "we"),
+        (1.4, 1.9, "load"),
+        (1.9, 2.6, "data"),
+        (2.6, 5.6, "Hello there."),
+    ]
+
+
+def test_parse_json3_joins_manual_segs_without_offsets(tmp_path: Path):
+    path = tmp_path / "sample.en.json3"
+    path.write_text(
+        json.dumps(
+            {
+                "events": [
+                    {
+                        "tStartMs": 0,
+                        "dDurationMs": 2500,
+                        "segs": [{"utf8": "Load the "}, {"utf8": "prices", "pPenId": 2}, {"utf8": " file."}],
+                    },
+                    {"tStartMs": 3000, "dDurationMs": 2000, "segs": [{"utf8": "Then "}, {"utf8": "plot it."}]},
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    cues = service().parse(path)
+
+    assert [(c.start, c.end, c.text) for c in cues] == [
+        (0.0, 2.5, "Load the prices file."),
+        (3.0, 5.0, "Then plot it."),
+    ]
+
+
+def test_parse_srv3_reads_word_offsets(tmp_path: Path):
+    path = tmp_path / "sample.en.srv3"
+    path.write_text(
+        '<?xml version="1.0" encoding="utf-8" ?><timedtext format="3"><body>'
+        '<p t="0" d="3000"><s>call</s><s t="500"> the</s><s t="900"> function</s></p>'
+        '<p t="3000" d="2000">Done.</p>'
+        "</body></timedtext>",
+        encoding="utf-8",
+    )
+
+    cues = service().parse(path)
+
+    assert [(c.start, c.text) for c in cues] == [(0.0, "call"), (0.5, "the"), (0.9, "function"), (3.0, "Done.")]
+    assert cues[2].end == 3.0
+
+
+def test_split_overlong_cue_cuts_at_recorded_word_starts():
+    words = [f"word{i}" for i in range(24)]
+    # Speech is front-loaded: the first 18 words take 3 s, the rest trail over 9 s.
+    starts = [i * 0.17 for i in range(18)] + [3.0 + (i - 18) * 1.5 for i in range(18, 24)]
+    cue = SubtitleCue(0.0, 12.0, " ".join(words), word_starts=starts)
+
+    parts = service()._split_overlong_cue(cue)
+
+    assert len(parts) == 3
+    assert [part.start for part in parts] == [0.0, starts[8], starts[16]]
+    assert parts[1].word_starts == starts[8:16]
+    assert parts[-1].end == 12.0
+
+
+def test_merged_word_cues_carry_word_starts():
+    svc = service()
+    cues = [SubtitleCue(i * 0.5, i * 0.5 + 0.5, word) for i, word in enumerate("we load the data.".split())]
+
+    merged = svc._merge_sentence_fragments(cues)
+
+    assert len(merged) == 1
+    assert merged[0].word_starts == [0.0, 0.5, 1.0, 1.5]
+
+
+class _WholeBatchTranslator:
+    def segment_subtitle_batch(self, lines, *, source_lang: str):
+        return [{"start": 0, "end": len(lines) - 1}]
+
+    def translate_subtitle_batch(self, lines, *, source_lang: str, target_lang: str):
+        return [f"译-{line}" for line in lines]
+
+
+def test_translated_windows_close_at_sentence_end_inside_overlap():
+    config = load_config()
+    config.translation.rule_segmentation = False
+    config.translation.segmentation_concurrency = 1
+    config.translation.subtitle_concurrency = 1
+    svc = SubtitleService(config, _WholeBatchTranslator())
+    words = [f"w{i}." if i in {12, 25} else f"w{i}" for i in range(70)]
+    tokens = (SubtitleCue(float(i), i + 1.0, word) for i, word in enumerate(words))
+
+    windows = list(svc.iter_translated_windows(tokens, source_lang="en", target_lang="zh-CN", window_seconds=30, overlap_seconds=10))
+
+    # w12. lies before the overlap zone, so the first window closes after w25.
+    assert windows[0][-1].text.endswith("w25.")
+    assert " ".join(cue.text for window in windows for cue in window).split() == words
+    assert all(cue.translation == f"译-{cue.text}" for window in windows for cue in window)
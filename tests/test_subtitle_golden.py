@@ -0,0 +1,112 @@
+"""Golden corpus for the local segmentation post-processing chain.
+
+The expected outputs in fixtures/subtitle_postprocess_golden.json were produced
+by the pass-by-pass implementation; any rewrite of the post-processing must keep
+them byte-for-byte. Regenerate only for intentional behavior changes:
+
+    python tests/test_subtitle_golden.py
+"""
+
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.config.config import load_config  # noqa: E402
+from src.service.subtitle import SubtitleCue, SubtitleService  # noqa: E402
+
+
+GOLDEN_PATH = Path(__file__).parent / "fixtures" / "subtitle_postprocess_golden.json"
+_VOCAB = (
+    "we", "load", "the", "data", "frame", "and", "then", "call", "plot", "on", "returns", "so", "this",
+    "brawler", "has", "a", "super", "that", "charges", "faster", "when", "you", "hit", "enemies", "with",
+    "main", "attack", "now", "let's", "compute", "monthly", "volatility", "of", "to", "for", "is", "can",
+    "um", "uh", "yeah", "oh", "hmm", "read", "CSV", "y", "Finance", "elements", "first", "story", "our",
+)
+
+
+def _words(rng: random.Random, low: int, high: int) -> str:
+    words = [rng.choice(_VOCAB) for _ in range(rng.randint(low, high))]
+    if rng.random() < 0.15 and len(words) > 2:
+        # Rolling auto-caption duplicates such as "the data the data".
+        words[1:1] = words[:2]
+    text = " ".join(words)
+    roll = rng.random()
+    if roll < 0.25:
+        text += "."
+    elif roll < 0.32:
+        text += ","
+    elif roll < 0.36:
+        text += "?"
+    return text
+
+
+def _segment_case(seed: int, count: int = 250) -> list[SubtitleCue]:
+    rng = random.Random(seed)
+    cues: list[SubtitleCue] = []
+    t = 0.0
+    for _ in range(count):
+        t += rng.choice((0.0, 0.0, 0.1, 0.25, 0.3, 0.5, 0.9, -0.2))
+        kind = rng.random()
+        if kind < 0.12:
+            text, duration = rng.choice(("um", "uh", "yeah yeah", "oh", "hmm")), rng.uniform(0.2, 1.8)
+        elif kind < 0.25:
+            text, duration = _words(rng, 1, 2), rng.uniform(0.3, 1.2)
+        elif kind < 0.32:
+            text, duration = _words(rng, 2, 6), rng.uniform(8.0, 16.0)
+        else:
+            text, duration = _words(rng, 3, 26), rng.uniform(0.8, 9.5)
+        cues.append(SubtitleCue(round(max(0.0, t), 3), round(max(0.0, t) + duration, 3), text))
+        t = max(0.0, t) + duration
+    return cues
+
+
+def _raw_case(seed: int, count: int = 300) -> list[SubtitleCue]:
+    rng = random.Random(1000 + seed)
+    cues: list[SubtitleCue] = []
+    t = 0.0
+    for _ in range(count):
+        t += rng.choice((0.0, 0.0, 0.0, 0.1, 0.3, 0.6))
+        duration = rng.uniform(8.0, 20.0) if rng.random() < 0.02 else rng.uniform(0.2, 1.1)
+        cues.append(SubtitleCue(round(t, 3), round(t + duration, 3), _words(rng, 1, 3)))
+        t += duration
+    return cues
+
+
+def _run_case(kind: str, cues: list[SubtitleCue]) -> list[SubtitleCue]:
+    svc = SubtitleService(load_config(), translator=None)
+    if kind == "raw":
+        cues = svc._trim_unusually_long_cues(cues)
+        cues = svc._merge_sentence_fragments(cues)
+    return svc._post_process_segmented(cues)
+
+
+def _dump(cues: list[SubtitleCue]) -> list[list]:
+    return [[round(cue.start, 6), round(cue.end, 6), cue.text, cue.translation] for cue in cues]
+
+
+def _cases() -> list[tuple[str, str, list[SubtitleCue]]]:
+    return [
+        *[(f"segments-{seed}", "segments", _segment_case(seed)) for seed in range(4)],
+        *[(f"raw-{seed}", "raw", _raw_case(seed)) for seed in range(4)],
+    ]
+
+
+def test_post_processing_matches_golden_corpus():
+    golden = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    cases = _cases()
+    assert sorted(golden) == sorted(name for name, _, _ in cases)
+    for name, kind, cues in cases:
+        assert golden[name]["input"] == _dump(cues), f"{name}: corpus generator changed"
+        assert _dump(_run_case(kind, cues)) == golden[name]["expected"], name
+
+
+if __name__ == "__main__":
+    corpus = {}
+    for name, kind, cues in _cases():
+        corpus[name] = {"kind": kind, "input": _dump(cues), "expected": _dump(_run_case(kind, cues))}
+    GOLDEN_PATH.parent.mkdir(parents=True, exist_ok=True)
+    GOLDEN_PATH.write_text(json.dumps(corpus, ensure_ascii=False, separators=(",", ":")) + "\n", encoding="utf-8")
+    print(f"wrote {GOLDEN_PATH}")
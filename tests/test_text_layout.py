@@ -0,0 +1,43 @@
+from src.service import text_layout
+
+
+def test_display_width_counts_wide_characters_twice():
+    assert text_layout.display_width("abc") == 3
+    assert text_layout.display_width("中文ab") == 6
+    assert text_layout.display_width("ＡＢ，") == 6
+    # Astral characters take the unicodedata fallback.
+    assert text_layout.display_width("a😀𠀀") == 5
+
+
+def test_wrap_atoms_classifies_tokens():
+    atoms = text_layout.wrap_atoms("调用read_csv，然后 plot")
+
+    assert atoms == [
+        ("调", "cjk"),
+        ("用", "cjk"),
+        ("read_csv", "word"),
+        ("，", "punct"),
+        ("然", "cjk"),
+        ("后", "cjk"),
+        (" ", "space"),
+        ("plot", "word"),
+    ]
+
+
+def test_split_by_display_width_prefers_punctuation():
+    parts = text_layout.split_by_display_width("我们先加载数据，然后调用函数计算波动率", 20)
+
+    assert parts == ["我们先加载数据，", "然后调用函数计算波动", "率"]
+    assert all(text_layout.display_width(part) <= 20 for part in parts)
+
+
+def test_split_by_display_width_breaks_overlong_atoms_and_keeps_measuring():
+    parts = text_layout.split_by_display_width("abcdefghijklmnop 中文", 6)
+
+    assert parts == ["abcdef", "ghijkl", "mnop", "中文"]
+
+
+def test_wrap_lines_splits_only_overlong_tokens():
+    assert text_layout.wrap_lines("  This is   a very long text ", 10) == ["This is a", "very long", "text"]
+    assert text_layout.wrap_lines("go abcdefghijkl", 8) == ["go", "abcdefgh", "ijkl"]
+    assert text_layout.wrap_lines("", 8) == []
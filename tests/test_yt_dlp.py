@@ -1,15 +1,27 @@
+import subprocess
+import sys
 from http.cookiejar import Cookie
 from pathlib import Path
 
+import pytest
+
+from src.infra.process_watchdog import SubprocessStalledError
 from src.infra.yt_dlp import (
     _assign_unknown_webm_candidates,
     _collect_download_candidates,
     _ensure_merged_mp4,
     _guess_media_kind_by_extension,
+    _run_yt_dlp_stream,
+    _stream_source_from_info,
     build_video_format_selector,
+    download_subtitle,
+    download_video,
     download_thumbnail,
     download_thumbnail_from_metadata,
     select_best_thumbnail_url,
+    select_stream_formats,
+    stream_resolution,
+    subtitle_track_kind,
     validate_youtube_auth,
     fetch_video_metadata,
 )
@@ -319,3 +331,128 @@ def test_fetch_metadata_passes_configured_retry_count(monkeypatch):
 
     assert fetch_video_metadata("demo", retries=7)["id"] == "demo"
     assert captured["cmd"][captured["cmd"].index("--retries") + 1] == "7"
+
+
+def test_stalled_download_is_killed_and_keeps_part_file(monkeypatch, tmp_path):
+    part = tmp_path / "video.mp4.part"
+    script = (
+        "import time\n"
+        f"open({str(part)!r}, 'wb').write(b'partial')\n"
+        "print('[download]  10.0% of 1.00GiB at 1.00MiB/s', flush=True)\n"
+        "print('[download] Got error: timed out. Retrying (1/3)...', flush=True)\n"
+        "time.sleep(30)\n"
+    )
+    real_popen = subprocess.Popen
+    started = []
+
+    def popen(cmd, **kwargs):
+        started.append(real_popen(cmd, **kwargs))
+        return started[-1]
+
+    monkeypatch.setattr("src.infra.yt_dlp.subprocess.Popen", popen)
+
+    with pytest.raises(SubprocessStalledError) as excinfo:
+        _run_yt_dlp_stream([sys.executable, "-c", script], action="下载视频", stall_seconds=0.5)
+
+    assert started[0].poll() is not None
+    assert "Retrying" in excinfo.value.last_lines[-1]
+    assert "没有进度" in str(excinfo.value)
+    assert part.read_bytes() == b"partial"
+
+
+def test_download_video_restarts_after_stall(monkeypatch, tmp_path):
+    commands = []
+
+    def fake_stream(cmd, **kwargs):
+        commands.append(cmd)
+        if len(commands) == 1:
+            raise SubprocessStalledError("yt-dlp 下载视频", kwargs["stall_seconds"], ["[download]  10.0%"])
+
+    monkeypatch.setattr("src.infra.yt_dlp._yt_dlp_bin", lambda: "yt-dlp")
+    monkeypatch.setattr("src.infra.yt_dlp._build_js_runtime_args", lambda: [])
+    monkeypatch.setattr("src.infra.yt_dlp._run_yt_dlp_stream", fake_stream)
+    monkeypatch.setattr("src.infra.yt_dlp._ensure_merged_mp4", lambda *_args, **_kwargs: None)
+
+    download_video("demo", str(tmp_path / "demo.mp4"), cookies_path=None, stall_seconds=60, stall_retries=1)
+    assert len(commands) == 2 and commands[0] == commands[1]
+
+    commands.clear()
+    with pytest.raises(SubprocessStalledError):
+        download_video("demo", str(tmp_path / "demo.mp4"), cookies_path=None, stall_seconds=60, stall_retries=0)
+    assert len(commands) == 1
+
+
+def test_stream_source_uses_requested_progressive_formats():
+    info = {
+        "format_id": "137+140",
+        "duration": 120,
+        "requested_formats": [
+            {
+                "format_id": "137",
+                "protocol": "https",
+                "url": "https://v/137",
+                "vcodec": "avc1",
+                "acodec": "none",
+                "width": 1920,
+                "height": 1080,
+                "http_headers": {"User-Agent": "UA"},
+            },
+            {"format_id": "140", "protocol": "https", "url": "https://v/140", "vcodec": "none", "acodec": "mp4a"},
+        ],
+    }
+
+    source = _stream_source_from_info(info)
+
+    assert (source.format_id, source.width, source.height, source.duration) == ("137+140", 1920, 1080, 120.0)
+    assert source.video.url == "https://v/137" and source.video.headers == {"User-Agent": "UA"}
+    assert source.audio.url == "https://v/140"
+
+    info["requested_formats"][0]["protocol"] = "m3u8_native"
+    with pytest.raises(RuntimeError, match="m3u8_native"):
+        _stream_source_from_info(info)
+
+
+def test_select_stream_formats_mirrors_the_stream_selector_offline():
+    meta = {
+        "formats": [
+            {"format_id": "96", "protocol": "m3u8_native", "vcodec": "avc1", "acodec": "mp4a", "width": 1920, "height": 1080},
+            {"format_id": "136", "protocol": "https", "vcodec": "avc1", "acodec": "none", "width": 1280, "height": 720, "fps": 30},
+            {"format_id": "298", "protocol": "https", "vcodec": "avc1", "acodec": "none", "width": 1280, "height": 720, "fps": 60},
+            {"format_id": "251", "protocol": "https", "vcodec": "none", "acodec": "opus", "language": "de", "abr": 160},
+            {"format_id": "140", "protocol": "https", "vcodec": "none", "acodec": "mp4a", "language": "en", "abr": 128},
+        ]
+    }
+
+    assert [fmt["format_id"] for fmt in select_stream_formats(meta)] == ["298", "140"]
+    assert stream_resolution(meta) == (1280, 720)
+
+    muxed = {"format_id": "18", "protocol": "https", "vcodec": "avc1", "acodec": "mp4a", "width": 640, "height": 360}
+    muxed_only = {"formats": [meta["formats"][0], muxed]}
+    assert stream_resolution(muxed_only) == (640, 360)
+    assert stream_resolution({"formats": [meta["formats"][0]]}) is None
+
+
+def test_download_subtitle_prefers_json3(monkeypatch, tmp_path):
+    captured = {}
+    monkeypatch.setattr("src.infra.yt_dlp._yt_dlp_bin", lambda: "yt-dlp")
+    monkeypatch.setattr("src.infra.yt_dlp._build_js_runtime_args", lambda: [])
+
+    def fake_run(cmd, *, action):
+        captured["cmd"] = cmd
+        for name in ("demo.en.vtt", "demo.en.json3", "demo.fr.json3"):
+            (tmp_path / name).write_text("x", encoding="utf-8")
+
+    monkeypatch.setattr("src.infra.yt_dlp._run_yt_dlp", fake_run)
+
+    path = download_subtitle("demo", tmp_path, video_id="demo", source_lang="en", cookies_path=None)
+
+    assert path.name == "demo.en.json3"
+    assert captured["cmd"][captured["cmd"].index("--sub-format") + 1].startswith("json3/")
+
+
+def test_subtitle_track_kind_distinguishes_uploader_and_automatic_captions():
+    meta = {"subtitles": {"en": [{"ext": "json3"}]}, "automatic_captions": {"en": [], "en-orig": []}}
+
+    assert subtitle_track_kind(meta, Path("demo.en.json3"), video_id="demo") == "manual"
+    assert subtitle_track_kind(meta, Path("demo.en-orig.json3"), video_id="demo") == "asr"
+    assert subtitle_track_kind({}, Path("demo.en.vtt"), video_id="demo") is None